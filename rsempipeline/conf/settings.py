@@ -25,10 +25,33 @@ QSUB_SUBMIT_SCRIPT_BASENAME = '0_submit.sh'
 # the name of the file that stores information about sra files of a GSM
 SRA_INFO_FILE_BASENAME = 'sras_info.yaml'
 
+# the SQLite database that stores sras_info of all GSMs, relative to
+# LOCAL_TOP_OUTDIR
+SRAS_INFO_DB_BASENAME = 'sras_info.sqlite'
+
+# the SQLite database that stores the disk usage of each GSM dir, relative to
+# LOCAL_TOP_OUTDIR
+USAGE_LEDGER_DB_BASENAME = 'usage_ledger.sqlite'
+
+# the max number of sras_info.yaml files kept in memory after being parsed
+SRAS_INFO_CACHE_SIZE = 4096
+
 # this is rough estimated ratio when converting sra to fastq files using
-# fastq-dump based on statistics
+# fastq-dump based on statistics, used until enough sizes are recorded in the
+# size history
 SRA2FASTQ_SIZE_RATIO = 1.5
 
+# the SQLite database that stores sizes of sra, fastq.gz files and rsem output
+# of processed GSMs for estimating usages, relative to LOCAL_TOP_OUTDIR
+SIZE_HISTORY_DB_BASENAME = 'size_history.sqlite'
+
+# where parsed soft files are cached, relative to LOCAL_TOP_OUTDIR
+SOFT_CACHE_DIR_BASENAME = 'soft_cache'
+
+# when GSMs were first seen, used to age their priorities, relative to
+# LOCAL_TOP_OUTDIR
+GSM_FIRST_SEEN_BASENAME = 'gsm_first_seen.txt'
+
 # where all analysis results go to
 RSEM_OUTPUT_BASENAME = 'rsem_output'
 
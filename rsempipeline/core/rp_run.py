@@ -19,11 +19,20 @@ from jinja2 import Environment, FileSystemLoader
 from rsempipeline.utils import misc
 misc.mkdir('log')
 from rsempipeline.utils import pre_pipeline_run as PPR
-from rsempipeline.utils.download import gen_orig_params
+from rsempipeline.utils.soft_cache import SoftCache
+from rsempipeline.utils import sras_info_store as SIS
+from rsempipeline.utils import usage_ledger as UL
+from rsempipeline.utils import size_estimator as SE
+from rsempipeline.utils import sra2fastq as S2F
+from rsempipeline.utils import retry as RT
+from rsempipeline.utils.download import (
+    gen_orig_params, init_scheduler, download_slot, get_rate_limit,
+    get_sra_info, verify_sra)
 from rsempipeline.utils.rsem import gen_fastq_gz_input
 from rsempipeline.parsers.args_parser import parse_args_for_rp_run
 from rsempipeline.conf.settings import (
-    RP_RUN_LOGGING_CONFIG, TEMPLATES_DIR, QSUB_SUBMIT_SCRIPT_BASENAME)
+    RP_RUN_LOGGING_CONFIG, TEMPLATES_DIR, QSUB_SUBMIT_SCRIPT_BASENAME,
+    SRAS_INFO_CACHE_SIZE)
 # as PATH_RE for backward compatibility
 from rsempipeline.conf.settings import RSEM_OUTPUT_DIR_RE as PATH_RE
 
@@ -79,16 +88,65 @@ def download(_, outputs, sample):
     url_path = urlparse.urlparse(sample.url).path
     sra_url_path = os.path.join(url_path, *sra.split('/')[-2:])
 
+    # the flag file is touched only after the sra is verified against
+    # sras_info, otherwise it's downloaded again right away
+    sra_info = get_sra_info(sample.outdir, sra)
+    retries = config.get('DOWNLOAD_VERIFY_RETRIES', 1)
+    verified = False
+    for attempt in range(retries + 1):
+        returncode = fetch_sra(sra_url_path, sra_outdir, msg_id)
+        if returncode != 0:
+            # including None when in debug mode or failed to start
+            break
+        error = verify_sra(sra, sra_info.get('size'), sra_info.get('md5'))
+        if error is None:
+            misc.touch(flag_file)
+            verified = True
+            break
+        logger.error('{0}: {1} failed verification ({2}), {3}'.format(
+            msg_id, sra, error,
+            'downloading again' if attempt < retries else 'giving up'))
+        if os.path.exists(sra):
+            os.remove(sra)
+    UL.update_usage(config['LOCAL_TOP_OUTDIR'], sample.outdir)
+    if verified and config.get('PIPELINE_SRA2FASTQ', False):
+        # converted while other download jobs are downloading, instead of
+        # after all sras are downloaded, and out of the ascp/wget slot
+        convert_sra(sra, S2F.get_flag_file(sra))
+
+
+def fetch_sra(sra_url_path, sra_outdir, msg_id):
+    """
+    download an sra with ascp, or wget if ascp fails
+
+    :returns: the returncode of the last one run
+    """
     cmd = config['CMD_ASCP'].format(
-        log_dir=sra_outdir, url_path=sra_url_path, output_dir=sra_outdir)
-    returncode = misc.execute(cmd, msg_id, flag_file, options.debug)
+        log_dir=sra_outdir, url_path=sra_url_path, output_dir=sra_outdir,
+        rate_limit=get_rate_limit())
+    policy = RT.get_policy('download')
+    returncode = policy.call(execute_in_slot('ascp'), cmd, msg_id,
+                             debug=options.debug)
     if returncode != 0 or returncode is None:
         # try wget
         # cmd template looks like this:
         # wget ftp://ftp-trace.ncbi.nlm.nih.gov{url_path} -P {output_dir} -N
         cmd = config['CMD_WGET'].format(
             url_path=sra_url_path, output_dir=sra_outdir)
-        misc.execute(cmd, msg_id, flag_file, options.debug)
+        returncode = policy.call(execute_in_slot('wget'), cmd, msg_id,
+                                 debug=options.debug)
+    return returncode
+
+
+def execute_in_slot(tool):
+    """
+    misc.execute holding a download slot of tool only while the command
+    runs, so a job waiting to retry doesn't keep others from downloading
+    """
+    def execute(*args, **kwargs):
+        with download_slot(tool):
+            return misc.execute(*args, **kwargs)
+    return execute
 
                
 @R.subdivide(
@@ -107,9 +165,29 @@ def sra2fastq(inputs, outputs):
     """
     sra, _ = inputs             # ignore the flag file from previous task
     flag_file = outputs[-1]
-    outdir = os.path.dirname(os.path.dirname(os.path.dirname(sra)))
-    cmd = config['CMD_FASTQ_DUMP'].format(output_dir=outdir, accession=sra)
-    misc.execute_log_stdout_stderr(cmd, flag_file=flag_file, debug=options.debug)
+    if S2F.is_converted(sra, flag_file):
+        # already converted by the download job when pipelined, it's run by
+        # ruffus anyway since its outputs aren't in the history of ruffus
+        logger.info('{0} has been converted while downloading'.format(sra))
+        return
+    convert_sra(sra, flag_file)
+
+
+def convert_sra(sra, flag_file):
+    """
+    convert sra to fastq.gz files, and replace sra with a placeholder once
+    converted when pipelined with download
+    """
+    outdir = S2F.get_gsm_dir(sra)
+    cmd = S2F.gen_sra2fastq_cmd(sra, outdir, config)
+    returncode = RT.get_policy('sra2fastq').call(
+        misc.execute_log_stdout_stderr, cmd, flag_file=flag_file,
+        debug=options.debug)
+    if returncode == 0 and config.get('PIPELINE_SRA2FASTQ', False):
+        S2F.replace_with_placeholder(sra)
+    UL.update_usage(config['LOCAL_TOP_OUTDIR'], outdir)
+    SE.record_sizes(config['LOCAL_TOP_OUTDIR'], outdir)
+    return returncode
 
 
 @R.collate(
@@ -207,19 +285,34 @@ def rsem(inputs, outputs):
         reference_name=reference_name,
         sample_name=sample_name,
         output_dir=outdir)
-    misc.execute_log_stdout_stderr(cmd, flag_file=flag_file, debug=options.debug)
+    RT.get_policy('rsem').call(
+        misc.execute_log_stdout_stderr, cmd, flag_file=flag_file,
+        debug=options.debug)
+    UL.update_usage(config['LOCAL_TOP_OUTDIR'], outdir)
+    SE.record_sizes(config['LOCAL_TOP_OUTDIR'], outdir)
 
 
-def calc_local_free_space_to_use(top_outdir, cmd_df, min_free, max_usage):
-    """All variables are in the context of local"""
+def calc_local_free_space_to_use(top_outdir, cmd_df, min_free, max_usage,
+                                 num_threads=1, ledger=None, gsm_dirs=()):
+    """
+    All variables are in the context of local
+
+    :param num_threads: the number of threads walking top_outdir for its usage
+    :param ledger: a UsageLedger, if given, the current usage is from the
+                   ledger instead of a walk of top_outdir
+    :param gsm_dirs: GSM dirs to be added to the ledger if not in it yet
+    """
     P = misc.pretty_usage
 
-    current_usage = PPR.disk_used(top_outdir)
+    if ledger is None:
+        current_usage = PPR.disk_used(top_outdir, num_threads)
+    else:
+        current_usage = ledger.get_total(gsm_dirs, num_threads)
     current_usage_pretty = P(current_usage)
     logger.info('local current usage by {0}: '
                 '{1}'.format(top_outdir, current_usage_pretty))
 
-    free_space = PPR.disk_free(cmd_df)
+    free_space = PPR.disk_free(cmd_df, top_outdir)
     free_space_pretty = P(free_space)
     logger.info('local free space avaialbe: {0}'.format(free_space_pretty))
 
@@ -245,19 +338,55 @@ def main():
 
     global samples
     G = PPR.gen_all_samples_from_soft_and_isamp
-    samples = G(options.soft_files, options.isamp, config)
+    soft_cache = SoftCache(
+        PPR.get_soft_cache_dir(config['LOCAL_TOP_OUTDIR']),
+        check_hash=config.get('SOFT_CACHE_CHECK_HASH', False),
+        invalidate=options.recreate_soft_cache)
+    samples = G(options.soft_files, options.isamp, config, options.j_parse,
+                soft_cache)
     PPR.init_sample_outdirs(samples, config['LOCAL_TOP_OUTDIR'])
-    PPR.fetch_sras_info(samples, options.recreate_sras_info)
+    PPR.init_sras_info_store(config['LOCAL_TOP_OUTDIR'], samples,
+                             config.get('SRAS_INFO_EXPORT_YAML', True),
+                             config.get('SRAS_INFO_CACHE_SIZE',
+                                        SRAS_INFO_CACHE_SIZE))
+    PPR.fetch_sras_info(samples, options.recreate_sras_info,
+                        config.get('FTP_SESSIONS', 1),
+                        config.get('FTP_LISTING', 'nlst'),
+                        config.get('SRAS_INFO_FETCH_RETRIES', 0),
+                        config.get('SRAS_INFO_FETCH_BACKOFF', 30),
+                        config.get('SRAS_INFO_FETCH_MAX_BACKOFF', 86400))
+    samples = PPR.skip_samples_without_sras_info(samples)
+    PPR.init_size_estimator(config['LOCAL_TOP_OUTDIR'],
+                            config.get('SIZE_ESTIMATE_QUANTILE', 0.9),
+                            config.get('SIZE_ESTIMATE_MIN_SAMPLES', 10))
 
     top_outdir = config['LOCAL_TOP_OUTDIR']
-    cmd_df = config['LOCAL_CMD_DF']
+    # free space is got with os.statvfs unless LOCAL_CMD_DF is given
+    cmd_df = config.get('LOCAL_CMD_DF')
     min_free = misc.ugly_usage(config['LOCAL_MIN_FREE'])
     max_usage = misc.ugly_usage(config['LOCAL_MAX_USAGE'])
+    ledger = UL.get_ledger(
+        top_outdir, config.get('USAGE_LEDGER_RECONCILE_HOURS', 24) * 3600)
     free_to_use = calc_local_free_space_to_use(
-        top_outdir, cmd_df, min_free, max_usage)
+        top_outdir, cmd_df, min_free, max_usage,
+        config.get('DISK_USED_THREADS', 1), ledger,
+        [_.outdir for _ in samples])
 
     logger.info('Selecting samples to process based their usage')
-    samples = PPR.select_gsms_to_process(samples, free_to_use)
+    status_index = PPR.build_status_index(top_outdir)
+    samples = PPR.schedule_samples(samples, top_outdir, options.isamp, config,
+                                   status_index)
+    # when pipelined, a download job keeps its sra on disk only until it's
+    # converted, so there are at most options.jobs of them at the same time
+    sras_on_disk = options.jobs if config.get('PIPELINE_SRA2FASTQ', False) else None
+    samples = PPR.select_gsms_to_process(
+        samples, free_to_use, status_index=status_index,
+        strategy=config.get('GSM_SELECTION_STRATEGY', 'first_fit'),
+        sras_on_disk=sras_on_disk,
+        # converted by up to -j jobs at the same time
+        intermediate_ratio=S2F.get_intermediate_ratio(config),
+        converting=options.jobs)
+    SIS.log_stats()
 
     if not samples:             # when samples == []
         logger.info('Cannot find a GSM that fits the disk usage rule')
@@ -271,6 +400,13 @@ def main():
         if not options.qsub_template:
             raise IOError('-t/--qsub_template required when running gen_qsub_script')
 
+    if '{rate_limit}' in config.get('CMD_ASCP', '') and not config.get('DOWNLOAD_BANDWIDTH'):
+        raise ValueError('DOWNLOAD_BANDWIDTH required when CMD_ASCP contains {rate_limit}')
+    # created before ruffus forks its workers, which share the limits
+    init_scheduler(config.get('ASCP_JOBS'), config.get('WGET_JOBS'),
+                   config.get('DOWNLOAD_BANDWIDTH'), options.jobs)
+    RT.init_policies(config.get('RETRY_POLICY'))
+
     R.pipeline_run(
         logger=logger,
         target_tasks=options.target_tasks,
@@ -281,6 +417,7 @@ def main():
         # history_file=os.path.join('log', '.{0}.sqlite'.format(
         #     '_'.join([_.name for _ in sorted(samples, key=lambda x: x.name)])))
     )
+    SIS.log_stats()
 
 
 if __name__ == "__main__":
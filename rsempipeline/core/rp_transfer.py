@@ -11,95 +11,138 @@ and execute it
 import os
 import sys
 sys.stdout.flush()              # flush print outputs to screen
-import re
 import stat
 import datetime
 import logging.config
+from multiprocessing.pool import ThreadPool
 
 from jinja2 import Template
 
 from rsempipeline.utils import misc
 misc.mkdir('log')
 from rsempipeline.utils import pre_pipeline_run as PPR
+from rsempipeline.utils.soft_cache import SoftCache
+from rsempipeline.utils import sras_info_store as SIS
+from rsempipeline.utils import usage_ledger as UL
+from rsempipeline.utils import size_estimator as SE
+from rsempipeline.utils.remote_listing import get_find_cmd, RemoteGSMIndex
 from rsempipeline.parsers.args_parser import parse_args_for_rp_transfer
 from rsempipeline.conf.settings import (RP_TRANSFER_LOGGING_CONFIG,
-                                        TRANSFER_SCRIPTS_DIR_BASENAME)
+                                        TRANSFER_SCRIPTS_DIR_BASENAME,
+                                        SRAS_INFO_CACHE_SIZE)
 
 
 logging.config.fileConfig(RP_TRANSFER_LOGGING_CONFIG)
 logger = logging.getLogger('rp_transfer')
 
 
-def get_remote_free_disk_space(remote, username, df_cmd):
+def fetch_remote_index(remote, username, r_dir, listing='full'):
     """
-    find the free disk space on remote host.
+    index GSM dirs in r_dir with the output of find, which is parsed as
+    it's received
 
-    :param df_cmd: should be in the form of df -k -P target_dir
+    :param listing: one of remote_listing.LISTING_MODES
     """
-    output = misc.sshexec(df_cmd, remote, username)
-    # e.g. output:
-    # ['Filesystem         1024-blocks      Used Available Capacity Mounted on\n',
-    #  '/dev/analysis        16106127360 12607690752 3498436608      79% /extscratch\n']
-    return int(output[1].split()[3]) * 1024
-
+    find_cmd = get_find_cmd(r_dir, listing)
+    index = RemoteGSMIndex(listing)
+    index.update(misc.sshexec_iter(find_cmd, remote, username))
+    logger.info('indexed {0} GSM dirs on {1} from {2} lines of '
+                'output of find'.format(len(index.gsm_dirs), remote,
+                                        index.num_lines))
+    return index
 
-def fetch_remote_file_list(remote, username, r_dir):
-    find_cmd = 'find {0}'.format(r_dir)
-    output = misc.sshexec(find_cmd, remote, username)
-    if output is None:
-        raise ValueError(
-            'cannot estimate current usage on remote host. Please check '
-            '{0} exists on {1}, or {1} may be down'.format(r_dir, remote))
-    output = [_.strip() for _ in output] # remote trailing '\n'
-    return output
 
-
-def estimate_current_remote_usage(remote, username, r_dir, l_dir, fastq2rsem_ratio):
+def estimate_current_remote_usage(remote, username, r_dir, l_dir, fastq2rsem_ratio,
+                                  index=None, listing='full'):
     """
     estimate the space that has already been or will be consumed by rsem_output
     by walking through each GSM and computing the sum of their estimated usage,
     if rsem.COMPLETE exists for a GSM, then ignore that GSM
 
-    mechanism: fetch the list of files in r_dir, and find the
+    mechanism: index the GSM dirs in r_dir, and find the
     fastq.gz for each GSM, then find the corresponding fastq.gz in
     l_dir, and estimate sizes based on them
 
-    :param find_cmd: should be in the form of find {remote_dir}
     :param r_dir: remote rsem output directory
     :param l_dir: local rsem output directory
+    :param index: a RemoteGSMIndex of r_dir if already fetched
+    :param listing: how r_dir is listed when index is None
 
     """
-    files = fetch_remote_file_list(remote, username, r_dir)
+    if index is None:
+        index = fetch_remote_index(remote, username, r_dir, listing)
     usage = 0
-    for dir_ in sorted(files):
-        match = re.search(r'(GSM\d+$)', os.path.basename(dir_))
-        if match:
-            rsem_comp = os.path.join(dir_, 'rsem.COMPLETE')
-            if (not rsem_comp in files) and (not misc.is_empty_dir(dir_, files)):
-                # only count the disk spaces used by those GSMs that are
-                # being processed
-                gsm_dir = dir_.replace(r_dir, l_dir)
-                usage += estimate_rsem_usage(gsm_dir, fastq2rsem_ratio)
+    for dir_ in sorted(index.gsm_dirs):
+        if not index.is_complete(dir_) and not index.is_empty(dir_):
+            # only count the disk spaces used by those GSMs that are
+            # being processed
+            gsm_dir = dir_.replace(r_dir, l_dir)
+            usage += estimate_rsem_usage(gsm_dir, fastq2rsem_ratio)
     return usage
 
 
-def get_real_current_usage(remote, username, r_dir):
-    """this will return real space consumed currently by rsem analysis"""
-    output = misc.sshexec('du -s {0}'.format(r_dir), remote, username)
-    # e.g. output:
-    # ['3096\t/path/to/top_outdir\n']
-    usage = int(output[0].split('\t')[0]) * 1024 # in KB => byte
-    return usage
+def parse_du_output(lines):
+    """:returns: the usage in bytes from the output of du -s, which is in KB"""
+    return int(lines[0].split('\t')[0]) * 1024
+
+
+def get_probe_marker(name):
+    return '__RP_TRANSFER_PROBE_{0}__'.format(name)
+
+
+def probe_remote(remote, username, r_dir, df_cmd, listing='full'):
+    """
+    get the free space, the real usage and the index of GSM dirs of r_dir on
+    the remote host in a single ssh session, instead of one for each of them
+
+    :param df_cmd: should be in the form of df -k -P target_dir
+    :param listing: one of remote_listing.LISTING_MODES
+    :returns: a tuple of the free space, the real usage and a RemoteGSMIndex
+    """
+    sections = [('df', df_cmd),
+                ('du', 'du -s {0}'.format(r_dir)),
+                ('find', get_find_cmd(r_dir, listing))]
+    cmd = '; '.join('echo {0}; {1}'.format(get_probe_marker(name), _)
+                    for name, _ in sections)
+    markers = dict((get_probe_marker(name), name) for name, _ in sections)
+    res = {}
+    index = RemoteGSMIndex(listing)
+    current = None
+    # the output of find can be very long, so it's indexed as it's received
+    for line in misc.sshexec_iter(cmd, remote, username):
+        line = line.rstrip('\n')
+        if line in markers:
+            current = markers[line]
+            res[current] = []
+        elif current == 'find':
+            index.add(line)
+        elif current is not None:
+            res[current].append(line)
+    try:
+        free = misc.parse_df_output(res['df'])
+        real = parse_du_output(res['du'])
+    except (KeyError, IndexError, ValueError):
+        raise ValueError(
+            'failed to parse the output of {0} on {1}, which may be down: '
+            '{2}'.format(cmd, remote, res))
+    logger.info('indexed {0} GSM dirs on {1} from {2} lines of '
+                'output of find'.format(len(index.gsm_dirs), remote,
+                                        index.num_lines))
+    return free, real, index
 
 
 def estimate_rsem_usage(gsm_dir, fastq2rsem_ratio):
     """
     estimate the maximum disk space that is gonna be consumed by rsem analysis
-    on one GSM based on a list of fq_gzs
+    on one GSM based on a list of fq_gzs, learned from the size history if
+    there is enough of it, otherwise by fastq2rsem_ratio
 
     :param fq_gz_size: a number reprsenting the total size of fastq.gz files
                        for the corresponding GSM
     """
+    usage = SE.estimate_rsem_usage(gsm_dir)
+    if usage is not None:
+        return usage
     fastq_usage = PPR.estimate_sra2fastq_usage(gsm_dir)
     return fastq_usage * fastq2rsem_ratio
 
@@ -130,7 +173,8 @@ def append_transfer_record(gsms_to_transfer, record_file):
 
 
 def select_gsms_to_transfer(samples, transferred_gsms,
-                          l_top_outdir, r_free_to_use, fastq2rsem_ratio):
+                          l_top_outdir, r_free_to_use, fastq2rsem_ratio,
+                          status_index=None, strategy='first_fit'):
     """
     select samples to transfer (different from select_samples_to_process in
     utils_pre_pipeline.py, which are to process)
@@ -142,31 +186,24 @@ def select_gsms_to_transfer(samples, transferred_gsms,
     :param samples: a list of Sample instances representing both transferred
                     and non-transferred GSMs
     :param transferred_gsms: a list of string with GSM ids. e.g. [GSM1, GSM2]
+    :param status_index: a StatusIndex of the local rsem_output
+    :param strategy: how GSMs are selected to fit r_free_to_use, one of
+                     selection.STRATEGIES
 
     """
     # not yet transferred GSMs
     non_tf_gsms = [_ for _  in samples if _.name not in transferred_gsms]
     gsms_to_transfer = []
     for gsm in non_tf_gsms:
-        gsm_id = os.path.relpath(gsm.outdir, l_top_outdir)
-
-        if not PPR.is_processed(gsm.outdir):
+        if not PPR.is_processed(gsm.outdir, status_index):
             # debug info will be logged by PPR.processed
             continue
-
-        rsem_usage = estimate_rsem_usage(gsm.outdir, fastq2rsem_ratio)
-
-        if rsem_usage > r_free_to_use:
-            logger.debug(
-                '{0} ({1}) doesn\'t fit current remote free_to_use ({2})'.format(
-                    gsm_id, misc.pretty_usage(rsem_usage), misc.pretty_usage(r_free_to_use)))
-            continue
-
-        logger.info('{0} ({1}) fit remote free_to_use ({2})'.format(
-            gsm_id, misc.pretty_usage(rsem_usage), misc.pretty_usage(r_free_to_use)))
-        r_free_to_use -= rsem_usage
         gsms_to_transfer.append(gsm)
-    return gsms_to_transfer
+
+    usages = [estimate_rsem_usage(_.outdir, fastq2rsem_ratio)
+              for _ in gsms_to_transfer]
+    return PPR.select_gsms_by_usage(gsms_to_transfer, usages, r_free_to_use,
+                                    strategy, 'remote')
 
 
 def create_transfer_sh_dir(l_top_outdir):
@@ -176,10 +213,38 @@ def create_transfer_sh_dir(l_top_outdir):
     return d
 
 
+def shard_gsms(gsms_tf_ids, sizes, num_shards):
+    """
+    split GSMs into at most num_shards shards of similar total sizes, by
+    assigning the biggest GSM left to the shard with the least total size so
+    far
+
+    :param sizes: the sizes of GSMs to transfer, in the same order as
+                  gsms_tf_ids
+    :returns: a list of non-empty lists of GSM ids
+    """
+    shards = [[] for _ in range(min(num_shards, len(gsms_tf_ids)))]
+    totals = [0] * len(shards)
+    for size, gsm_id in sorted(zip(sizes, gsms_tf_ids), key=lambda _: -_[0]):
+        k = totals.index(min(totals))
+        shards[k].append(gsm_id)
+        totals[k] += size
+    for k, (shard, total) in enumerate(zip(shards, totals)):
+        logger.info('shard {0}: {1} GSMs, {2}'.format(
+            k, len(shard), misc.pretty_usage(total)))
+    return shards
+
+
 def write_transfer_sh(gsms_tf_ids, rsync_template, l_top_outdir,
-                      r_username, r_host, r_top_outdir):
+                      r_username, r_host, r_top_outdir, shard=None):
+    """
+    :param shard: the index of the shard of GSMs to transfer, if the
+                  transfer is split into multiple ones
+    """
     now = datetime.datetime.now()
     job_name = 'transfer.{0}'.format(now.strftime('%y-%m-%d_%H:%M:%S'))
+    if shard is not None:
+        job_name = '{0}.{1}'.format(job_name, shard)
     tf_dir = create_transfer_sh_dir(l_top_outdir) # tf: transfer
     tf_script = os.path.join(tf_dir, '{0}.sh'.format(job_name))
 
@@ -190,9 +255,47 @@ def write_transfer_sh(gsms_tf_ids, rsync_template, l_top_outdir,
           hostname=r_host,
           gsms_to_transfer=gsms_tf_ids,
           local_top_outdir=l_top_outdir,
-          remote_top_outdir=r_top_outdir)
+          remote_top_outdir=r_top_outdir,
+          done_file=get_done_file(tf_script))
     return tf_script
-    
+
+
+def get_done_file(tf_script):
+    """where tf_script writes the GSMs transferred successfully"""
+    return '{0}.done'.format(tf_script)
+
+
+def get_gsms_done(tf_script, gsms_tf_ids, rcode):
+    """
+    the GSMs transferred successfully by tf_script, as written to its done
+    file. A template that doesn't write the done file is all-or-nothing
+    judged by rcode
+
+    :param gsms_tf_ids: the GSMs tf_script was rendered with
+    """
+    done_file = get_done_file(tf_script)
+    if not os.path.exists(done_file):
+        return list(gsms_tf_ids) if rcode == 0 else []
+    with open(done_file) as inf:
+        done = set(_.strip() for _ in inf)
+    return [_ for _ in gsms_tf_ids if _ in done]
+
+
+def run_transfer_scripts(tf_scripts):
+    """
+    run transfer scripts at the same time, each with its own rsync
+
+    :returns: the return codes of tf_scripts
+    """
+    if len(tf_scripts) == 1:
+        return [misc.execute_log_stdout_stderr(tf_scripts[0])]
+    pool = ThreadPool(len(tf_scripts))
+    try:
+        return pool.map(misc.execute_log_stdout_stderr, tf_scripts)
+    finally:
+        pool.close()
+        pool.join()
+
 
 def write(transfer_script, template, **params):
     """
@@ -210,22 +313,25 @@ def write(transfer_script, template, **params):
 
 
 def calc_remote_free_space_to_use(r_host, r_username, r_top_outdir, l_top_outdir,
-                                  r_cmd_df, r_max_usage, r_min_free, fastq2rsem_ratio):
+                                  r_cmd_df, r_max_usage, r_min_free, fastq2rsem_ratio,
+                                  listing='full'):
     # r_real_current_usage is just for giving an idea of real usage on remote,
     # and it's not used for calculating free space to use
     P = misc.pretty_usage
 
-    r_real = get_real_current_usage(r_host, r_username, r_top_outdir)
+    r_free_space, r_real, r_index = probe_remote(
+        r_host, r_username, r_top_outdir, r_cmd_df, listing)
     r_real_pretty = P(r_real)
     logger.info('real current usage on {r_host} by {r_top_outdir}: '
                 '{r_real_pretty}'.format(**locals()))
 
     r_estimated_current_usage = estimate_current_remote_usage(
-        r_host, r_username, r_top_outdir, l_top_outdir, fastq2rsem_ratio)
+        r_host, r_username, r_top_outdir, l_top_outdir, fastq2rsem_ratio,
+        r_index)
     r_estimated_current_usage_pretty = P(r_estimated_current_usage)
-    logger.info('free space on {r_host}: {r_estimated_current_usage_pretty}'.format(**locals()))
+    logger.info('estimated current usage on {r_host}: '
+                '{r_estimated_current_usage_pretty}'.format(**locals()))
 
-    r_free_space = get_remote_free_disk_space(r_host, r_username, r_cmd_df)
     r_free_space_pretty = P(r_free_space)
     logger.info('free space on {r_host}: {r_free_space_pretty}'.format(**locals()))
 
@@ -250,8 +356,21 @@ def main():
     r_top_outdir = config['REMOTE_TOP_OUTDIR']
 
     G = PPR.gen_all_samples_from_soft_and_isamp
-    samples = G(options.soft_files, options.isamp, config)
+    soft_cache = SoftCache(
+        PPR.get_soft_cache_dir(config['LOCAL_TOP_OUTDIR']),
+        check_hash=config.get('SOFT_CACHE_CHECK_HASH', False),
+        invalidate=options.recreate_soft_cache)
+    samples = G(options.soft_files, options.isamp, config, options.j_parse,
+                soft_cache)
     PPR.init_sample_outdirs(samples, l_top_outdir)
+    PPR.init_sras_info_store(l_top_outdir, samples,
+                             config.get('SRAS_INFO_EXPORT_YAML', True),
+                             config.get('SRAS_INFO_CACHE_SIZE',
+                                        SRAS_INFO_CACHE_SIZE))
+    samples = PPR.skip_samples_without_sras_info(samples)
+    PPR.init_size_estimator(l_top_outdir,
+                            config.get('SIZE_ESTIMATE_QUANTILE', 0.9),
+                            config.get('SIZE_ESTIMATE_MIN_SAMPLES', 10))
 
     r_host, r_username = config['REMOTE_HOST'], config['USERNAME']
     fastq2rsem_ratio = config['FASTQ2RSEM_RATIO']
@@ -260,7 +379,8 @@ def main():
     r_max_usage = misc.ugly_usage(config['REMOTE_MAX_USAGE'])
     r_free_to_use  = calc_remote_free_space_to_use(
         r_host, r_username, r_top_outdir, l_top_outdir,
-        r_cmd_df, r_max_usage, r_min_free, fastq2rsem_ratio)
+        r_cmd_df, r_max_usage, r_min_free, fastq2rsem_ratio,
+        config.get('REMOTE_LISTING', 'full'))
 
     # tf: transfer/transferred
     tf_record = os.path.join(l_top_outdir, 'transferred_GSMs.txt')
@@ -268,8 +388,11 @@ def main():
     tf_gsms_bn = map(os.path.basename, tf_gsms)
 
     logger.info('Selecting samples to transfer based their estimated remote usage')
+    status_index = PPR.build_status_index(l_top_outdir)
     gsms_to_tf = select_gsms_to_transfer(
-        samples, tf_gsms_bn, l_top_outdir, r_free_to_use, fastq2rsem_ratio)
+        samples, tf_gsms_bn, l_top_outdir, r_free_to_use, fastq2rsem_ratio,
+        status_index, config.get('GSM_SELECTION_STRATEGY', 'first_fit'))
+    SIS.log_stats()
 
     if not gsms_to_tf:
         logger.info('Cannot find a GSM that fits the current disk usage rule')
@@ -281,18 +404,39 @@ def main():
 
     gsms_to_tf_ids = [os.path.relpath(_.outdir, l_top_outdir)
                       for _ in gsms_to_tf]
-    tf_script = write_transfer_sh(
-        gsms_to_tf_ids, options.rsync_template, l_top_outdir,
-        r_username, r_host, r_top_outdir)
-
-    os.chmod(tf_script, stat.S_IRUSR | stat.S_IWUSR| stat.S_IXUSR)
-    rcode = misc.execute_log_stdout_stderr(tf_script)
-
-    if rcode == 0:
-        # different from processing in rsempipeline.py, where the completion is
-        # marked by .COMPLETE flags, but by writting the completed GSMs to
-        # gsms_transfer_record
-        append_transfer_record(gsms_to_tf_ids, tf_record)
+    num_streams = config.get('TRANSFER_STREAMS', 1)
+    if num_streams > 1:
+        # balanced by the size of fastq.gz files, which is most of what's
+        # transferred
+        sizes = [SE.scan_gsm_dir(_.outdir)['fastq_gz'] for _ in gsms_to_tf]
+        shards = shard_gsms(gsms_to_tf_ids, sizes, num_streams)
+    else:
+        shards = [gsms_to_tf_ids]
+
+    tf_scripts = []
+    for k, shard in enumerate(shards):
+        tf_script = write_transfer_sh(
+            shard, options.rsync_template, l_top_outdir,
+            r_username, r_host, r_top_outdir,
+            k if len(shards) > 1 else None)
+        os.chmod(tf_script, stat.S_IRUSR | stat.S_IWUSR| stat.S_IXUSR)
+        tf_scripts.append(tf_script)
+
+    rcodes = run_transfer_scripts(tf_scripts)
+    # the transfer script removes fastq.gz and sra files after transfer
+    UL.mark_dirty(l_top_outdir, [_.outdir for _ in gsms_to_tf])
+
+    for shard, tf_script, rcode in zip(shards, tf_scripts, rcodes):
+        gsms_done = get_gsms_done(tf_script, shard, rcode)
+        if gsms_done:
+            # different from processing in rsempipeline.py, where the
+            # completion is marked by .COMPLETE flags, but by writting the
+            # completed GSMs to gsms_transfer_record
+            append_transfer_record(gsms_done, tf_record)
+        if len(gsms_done) < len(shard):
+            logger.error('{0} failed to transfer {1} of {2} GSMs, which will '
+                         'be transferred again next time'.format(
+                             tf_script, len(shard) - len(gsms_done), len(shard)))
 
 
 if __name__ == "__main__":
@@ -23,6 +23,17 @@ def add_common_arguments(parser):
               'The pipeline will check data is a file and exists, or '
               'it assumes it\'s a data string'))
 
+    parser.add_argument(
+        '--j_parse', type=int,
+        help=('the number of processes to use when parsing soft files, '
+              'overwrites SOFT_PARSE_JOBS in the configuration file'))
+
+    parser.add_argument(
+        '--recreate_soft_cache', action='store_true',
+        help=('if specified, cached results of parsing soft files will be '
+              'ignored, and soft files will be parsed from scratch and cached '
+              'again'))
+
     base_dir = os.path.abspath(os.path.dirname(__file__))
     config_examp = os.path.join(base_dir, 'rp_config.example.yml')
     parser.add_argument(
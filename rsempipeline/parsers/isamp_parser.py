@@ -36,16 +36,22 @@ def read_csv_gse_as_key(infile):
 
 
 def process(k, row):
-    """Process one row of GSE_species_GSM.csv"""
+    """
+    Process one row of GSE_species_GSM.csv, there could be an optional 4th
+    column, the priority of the GSE, read by read_csv_priorities
+    """
     def err():
         logger.error('Ignored invalid row ({0}): {1}'.format(k, row))
 
-    # check if there are only two columns
-    if len(row) != 3:
+    # check if there are only three (or four) columns
+    if len(row) not in (3, 4):
+        err()
+        return
+    if len(row) == 4 and not re.search(r'^\s*(-?\d+)?\s*$', row[3]):
         err()
         return
 
-    gse, species, gsm = row
+    gse, species, gsm = row[:3]
     # check if GSE is properly named
     if not re.search(r'^GSE\d+$', gse):
         err()
@@ -57,6 +63,27 @@ def process(k, row):
     return gse, species, gsm
 
 
+def read_csv_priorities(infile):
+    """
+    read priorities of GSEs from the optional 4th column of
+    GSE_species_GSM.csv, e.g. GSE1,Homo sapiens,GSM1,10. If a GSE is given
+    different priorities in different rows, the highest one is taken
+
+    Data structure returned:
+    {'GSE1': 10, 'GSE2': 5, ...}
+    """
+    priorities = {}
+    with open(infile, 'rb') as inf:
+        csv_reader = csv.reader(inf)
+        for k, row in enumerate(csv_reader):
+            # invalid rows are logged by read_csv_gse_as_key already
+            if (row and not row[0].startswith('#') and len(row) == 4
+                    and re.search(r'^\s*-?\d+\s*$', row[3])):
+                gse, priority = row[0], int(row[3])
+                priorities[gse] = max(priority, priorities.get(gse, priority))
+    return priorities
+
+
 def gen_isamp_from_csv(input_csv):
     """
     Generate input data from GSE_species_GSM.csv with the specified data
@@ -97,3 +124,14 @@ def get_isamp(isamp_file_or_str):
     else:                       # it's a string
         res = gen_isamp_from_str(V)
     return res
+
+
+def get_isamp_priorities(isamp_file_or_str):
+    """
+    get priorities of GSEs from GSE_species_GSM.csv, an isamp str doesn't
+    have priorities
+    """
+    V = isamp_file_or_str
+    if os.path.exists(V) and os.path.splitext(V)[-1] == '.csv':
+        return read_csv_priorities(V)
+    return {}
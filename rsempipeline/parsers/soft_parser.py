@@ -82,7 +82,7 @@ def add(current_sample, series, index):
     if current_sample is not None:
         if current_sample.is_info_complete():
             current_sample.index = index
-            # add sample to both lists of samples and passed_samples
+            # add sample to samples and mark it as passed
             series.add_passed_sample(current_sample)
             index += 1
         else:
@@ -95,40 +95,102 @@ def add(current_sample, series, index):
     return index
 
 
+# labels that are relevant to a sample, keyed by the label with trailing digits
+# stripped so that e.g. !Sample_organism_ch1 and !Sample_organism_ch2 share the
+# same entry; lines with any other label are skipped without further work
+SAMPLE_LABELS = frozenset([
+    '!Sample_organism_ch',
+    '!Sample_supplementary_file_',
+    '!Sample_type',
+    '!Sample_library_strategy',
+    '!Sample_instrument_model',
+    '!Sample_library_source',
+])
+
+
+def split_line(line):
+    """
+    split a line of soft file into label and value, e.g.
+    '!Sample_type = SRA' => ('!Sample_type', 'SRA')
+    """
+    label, _, value = line.partition('=')
+    return label.rstrip(), value.strip()
+
+
+class SoftParser(object):
+    """
+    A streaming parser for soft files. Only lines starting with ^SERIES,
+    ^SAMPLE or one of SAMPLE_LABELS are split, others (e.g. data tables and
+    !Series_* lines in a full _family.soft file) are skipped with a cheap prefix
+    check, and samples are yielded one at a time as soon as they are complete
+    """
+    def __init__(self, soft_file, interested_organisms):
+        self.soft_file = soft_file
+        self.interested_organisms = interested_organisms
+        # will be set once the ^SERIES line is reached
+        self.series = None
+
+    def iter_samples(self):
+        """
+        yield samples that have been added to self.series (both passed and
+        info-incomplete ones), discarded samples are not yielded
+        """
+        series_name_from_file = get_series_name_from(self.soft_file)
+        # index: the index of all passed samples, unpassed samples are not
+        # indexed
+        index, current_sample = 1, None
+        with open(self.soft_file, 'rb') as inf:
+            for line in inf:
+                if line.startswith('!Sample_'):
+                    if current_sample is None:
+                        continue
+                    label, _, value = line.partition('=')
+                    label = label.rstrip()
+                    if label.rstrip('0123456789') not in SAMPLE_LABELS:
+                        continue
+                    current_sample = update(current_sample, label,
+                                            value.strip(),
+                                            self.interested_organisms)
+                elif line.startswith('^SAMPLE'):
+                    if current_sample is not None:
+                        index = add(current_sample, self.series, index)
+                        yield current_sample
+                    current_sample = Sample(name=split_line(line)[1],
+                                            series=self.series)
+                elif line.startswith('^SERIES'):
+                    self.series = Series(split_line(line)[1],
+                                         os.path.abspath(self.soft_file))
+                    if self.series.name != series_name_from_file:
+                        msg = ('series contained in the soft file doesn\'t '
+                               'match that in the filename: {0} != {1}'.format(
+                                   self.series, series_name_from_file))
+                        raise ValueError(msg)
+        if self.series is not None and current_sample is not None:
+            # add the last sample
+            add(current_sample, self.series, index)
+            yield current_sample
+
+
+def iter_samples(soft_file, interested_organisms):
+    """
+    yield samples from soft_file incrementally, see SoftParser.iter_samples
+    """
+    return SoftParser(soft_file, interested_organisms).iter_samples()
+
+
 def parse(soft_file, interested_organisms):
     """Parse the soft file
     :param interested_organisms: a list of interested organisms: ['Homo
                                  sapiens', 'Mus musculus']
     """
     logger.info("Parsing file: {0} ...".format(soft_file))
-    series_name_from_file = get_series_name_from(soft_file)
-    print series_name_from_file
-
     # Assume one GSE per soft file
-    # index: the index of all passed samples, unpassed samples are not indexed
-    index, series, current_sample = 1, None, None
-    with open(soft_file, 'rb') as inf:
-        for line in inf:
-            label, value = [__.strip() for __ in line.split('=')]
-            if label == '^SERIES':
-                series = Series(value, os.path.abspath(soft_file))
-                if series.name != series_name_from_file:
-                    msg = ('series contained in the soft file doesn\'t match '
-                           'that in the filename: {0} != {1}'.format(
-                               series, series_name_from_file))
-                    raise ValueError(msg)
-            elif label == '^SAMPLE':
-                index = add(current_sample, series, index)
-                current_sample = Sample(name=value, series=series)
-
-            if current_sample:
-                current_sample = update(current_sample, label, value,
-                                        interested_organisms)
-        if series is not None:
-            # add the last sample
-            add(current_sample, series, index)
-
-            logger.info("{0}: {1}/{2} samples passed".format(
-                series.name, series.num_passed_samples(), series.num_samples()))
-            logger.info('=' * 30)
-            return series
+    parser = SoftParser(soft_file, interested_organisms)
+    for _ in parser.iter_samples():
+        pass
+    series = parser.series
+    if series is not None:
+        logger.info("{0}: {1}/{2} samples passed".format(
+            series.name, series.num_passed_samples(), series.num_samples()))
+        logger.info('=' * 30)
+        return series
@@ -16,19 +16,28 @@ dest_parent={{username}}@{{hostname}}:{{remote_top_outdir}}
 echo "Job started at: $(date)"
 echo "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
 
-# -R is important for creating the same directory hierachy on remote host
-cmd="rsync -R -r -a -v -h --stats --progress $GSMS_TO_TRANSFER $dest_parent --include='*.fastq.gz' --include='0_submit.sh' --exclude='GSM*[0-9]/*'"
-echo "$cmd"
-eval "$cmd"
+# GSMs are rsynced one by one, so a failed GSM doesn't fail the others, and
+# those transferred successfully are written to done_file, which rp-transfer
+# reads to record them as transferred
+TRANSFERRED=""
+FAILED=""
+for gsm in ${GSMS_TO_TRANSFER}; do
+    # -R is important for creating the same directory hierachy on remote host
+    cmd="rsync -R -r -a -v -h --stats --progress $gsm $dest_parent --include='*.fastq.gz' --include='0_submit.sh' --exclude='GSM*[0-9]/*'"
+    echo "$cmd"
+    if eval "$cmd"; then
+        TRANSFERRED="${TRANSFERRED} ${gsm}"
+    else
+        # RC: return code
+        echo "rsync returncode for ${gsm}: $?"
+        FAILED="${FAILED} ${gsm}"
+    fi
+done
 
-# RC: return code
-RSYNC_RC=$?
-echo "rsync returncode: $RSYNC_RC"
-
-if [ "$RSYNC_RC" -eq 0 ]; then
+if [ -n "${TRANSFERRED}" ]; then
     echo 'do submission'
     ssh -l {{username}} {{hostname}} \
-	". ~/.bash_profile; gsms_to_transfer=\"${GSMS_TO_TRANSFER}\"; cd {{remote_top_outdir}};" \
+	". ~/.bash_profile; gsms_to_transfer=\"${TRANSFERRED}\"; cd {{remote_top_outdir}};" \
 	'
         pwd=${PWD}
         for gsm in ${gsms_to_transfer}; do
@@ -37,15 +46,19 @@ if [ "$RSYNC_RC" -eq 0 ]; then
             cd ${pwd}
         done
         '
-fi
 
-# remove fastq.gz files after transfer to save spaces
-if [ "$RSYNC_RC" -eq 0 ]; then
-    for i in ${GSMS_TO_TRANSFER}; do
+    # remove fastq.gz files after transfer to save spaces
+    for i in ${TRANSFERRED}; do
 	find $i -name '*.fastq.gz' -exec rm -fv '{}' ';'
 	find $i -name '*.sra' -exec rm -fv '{}' ';'
+	echo "$i" >> {{done_file}}
     done
 fi
 
 echo "~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~"
 echo "Job ended at:   $(date)"
+
+if [ -n "${FAILED}" ]; then
+    echo "failed to transfer:${FAILED}"
+    exit 1
+fi
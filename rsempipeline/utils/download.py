@@ -1,12 +1,14 @@
 """utilities for the download task"""
 
 import os
+import re
+import hashlib
+import contextlib
+import multiprocessing
 import logging
 logger = logging.getLogger(__name__)
 
-import yaml
-
-from rsempipeline.conf.settings import SRA_INFO_FILE_BASENAME
+from rsempipeline.utils.sras_info_store import get_sras_info
 
 
 def gen_orig_params_per(sample):
@@ -14,11 +16,9 @@ def gen_orig_params_per(sample):
     construct original parameters per sample, refer to the tests in
     test_download to see what return value looks like
     """
-    info_file = SRA_INFO_FILE_BASENAME
-    with open(os.path.join(sample.outdir, info_file)) as inf:
-        sras_info = yaml.load(inf.read())
-        sras = [os.path.join(sample.outdir, i)
-                for j in sras_info for i in j.keys()]
+    sras_info = get_sras_info(sample.outdir)
+    sras = [os.path.join(sample.outdir, i)
+            for j in sras_info for i in j.keys()]
     flag_files = [
         os.path.join(sample.outdir,
                      '{0}.download.COMPLETE'.format(os.path.basename(sra)))
@@ -39,3 +39,129 @@ def gen_orig_params(samples):
         orig_params = gen_orig_params_per(sample)
         orig_params_sets.extend(orig_params)
     return orig_params_sets
+
+
+def get_sra_info(gsm_dir, sra):
+    """
+    :param sra: path to an sra file of the GSM
+    :returns: the info of sra from sras_info, e.g. {'size': 2546696608,
+              'readable_size': '2.4 GB'}, an md5 is included only if it's
+              recorded, or an empty dict if sra isn't found
+    """
+    key = os.path.relpath(sra, gsm_dir)
+    for d in get_sras_info(gsm_dir):
+        if key in d:
+            return d[key]
+    return {}
+
+
+def md5sum(path, block_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as inf:
+        for block in iter(lambda: inf.read(block_size), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def verify_sra(sra, size=None, md5=None):
+    """
+    check a downloaded sra against its size and md5 where known
+
+    :returns: the reason why it failed, or None if it's verified
+    """
+    if not os.path.exists(sra):
+        return 'not found'
+    actual = os.path.getsize(sra)
+    if size is not None and actual != size:
+        return 'size is {0}, expected {1}'.format(actual, size)
+    if md5 is not None:
+        actual = md5sum(sra)
+        if actual != md5:
+            return 'md5 is {0}, expected {1}'.format(actual, md5)
+    return None
+
+
+DOWNLOAD_TOOLS = ('ascp', 'wget')
+
+# e.g. 300m, 1.5g or 800 (Kbps) as in ascp -l
+RATE_RE = re.compile(r'^\s*(?P<num>\d+(?:\.\d+)?)\s*(?P<unit>[kmg]?)(?:bps)?\s*$',
+                     re.IGNORECASE)
+RATE_UNITS = {'': 1, 'k': 1, 'm': 1000, 'g': 1000 ** 2}
+
+
+def parse_rate(rate):
+    """
+    :param rate: e.g. 300m, in the same format as ascp -l
+    :returns: the rate in Kbps
+    """
+    match = RATE_RE.search(str(rate))
+    if not match:
+        raise ValueError('invalid rate: {0}, should be like 300m'.format(rate))
+    return float(match.group('num')) * RATE_UNITS[match.group('unit').lower()]
+
+
+class DownloadScheduler(object):
+    """
+    limits the number of ascp and wget run at the same time independent of the
+    number of jobs of the pipeline, and splits the bandwidth of this host
+    among ascp sessions. Semaphores are created before ruffus forks its
+    workers, so they're shared among them
+    """
+    def __init__(self, ascp_jobs=None, wget_jobs=None, bandwidth=None,
+                 jobs=None):
+        """
+        :param ascp_jobs: max number of ascp run at the same time, None for
+                          no limit
+        :param wget_jobs: max number of wget run at the same time
+        :param bandwidth: the total rate (e.g. 300m) of all ascp sessions
+        :param jobs: the number of jobs of the pipeline, i.e. the max number
+                     of ascp run at the same time when ascp_jobs is None
+        """
+        self.ascp_jobs = ascp_jobs
+        self.slots = {}
+        for tool, num in zip(DOWNLOAD_TOOLS, [ascp_jobs, wget_jobs]):
+            if num:
+                self.slots[tool] = multiprocessing.BoundedSemaphore(num)
+        self.rate_limit = None
+        if bandwidth:
+            kbps = parse_rate(bandwidth) / (ascp_jobs or jobs or 1)
+            self.rate_limit = '{0}k'.format(max(int(kbps), 1))
+        logger.info('download limits: ascp: {0}, wget: {1}, rate of each '
+                    'ascp: {2}'.format(ascp_jobs, wget_jobs, self.rate_limit))
+
+    @contextlib.contextmanager
+    def slot(self, tool):
+        """waits for a free slot of tool if it's limited"""
+        slot = self.slots.get(tool)
+        if slot is None:
+            yield
+            return
+        slot.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+
+
+_scheduler = None
+
+
+def init_scheduler(ascp_jobs=None, wget_jobs=None, bandwidth=None, jobs=None):
+    global _scheduler
+    _scheduler = DownloadScheduler(ascp_jobs, wget_jobs, bandwidth, jobs)
+    return _scheduler
+
+
+@contextlib.contextmanager
+def download_slot(tool):
+    """no limit if the scheduler isn't initialized"""
+    if _scheduler is None:
+        yield
+    else:
+        with _scheduler.slot(tool):
+            yield
+
+
+def get_rate_limit():
+    """the rate of each ascp session, for {rate_limit} in CMD_ASCP"""
+    return None if _scheduler is None else _scheduler.rate_limit
@@ -0,0 +1,91 @@
+"""
+Directory listings with names, types and sizes in a single FTP command per
+directory, by MLSD (RFC 3659) or by parsing the output of LIST when MLSD isn't
+supported by the server. ftplib of python-2.7 has no mlsd method, so the raw
+lines are retrieved with retrlines
+"""
+
+import ftplib
+import logging
+logger = logging.getLogger(__name__)
+
+
+# listing methods that can be configured with FTP_LISTING, nlst means one
+# NLST per directory and one SIZE per file, as done before MLSD was supported
+LISTING_METHODS = ('nlst', 'mlsd', 'list')
+
+# hosts that have replied MLSD isn't supported, so it's not tried again
+NO_MLSD_HOSTS = set()
+
+# e.g. drwxr-xr-x, -r--r--r--, lrwxrwxrwx
+LIST_TYPES = {'d': 'dir', '-': 'file', 'l': 'link'}
+
+
+def parse_mlsd_line(line):
+    """
+    e.g. type=file;size=1443785368;modify=20140829161604; SRR1557065.sra
+    returns ('SRR1557065.sra', {'type': 'file', 'size': '1443785368',
+    'modify': '20140829161604'})
+    """
+    facts_str, _, name = line.partition(' ')
+    facts = {}
+    for fact in facts_str.rstrip(';').split(';'):
+        key, _, value = fact.partition('=')
+        facts[key.lower()] = value
+    if 'type' in facts:
+        facts['type'] = facts['type'].lower()
+    return name, facts
+
+
+def parse_list_line(line):
+    """
+    parse a line of LIST output in the unix ls -l format, e.g.
+    -r--r--r--   1 ftp      anonymous 1443785368 Aug 29  2014 SRR1557065.sra
+    returns ('SRR1557065.sra', {'type': 'file', 'size': '1443785368'}), or None
+    if the line can't be parsed, e.g. "total 8"
+    """
+    fields = line.split(None, 8)
+    if len(fields) != 9:
+        return
+    perms, size, name = fields[0], fields[4], fields[8]
+    type_ = LIST_TYPES.get(perms[0], 'other')
+    if type_ == 'link':
+        name = name.split(' -> ')[0]
+    return name, {'type': type_, 'size': size}
+
+
+def mlsd(ftp_handler, path):
+    lines = []
+    ftp_handler.retrlines('MLSD {0}'.format(path), lines.append)
+    return [parse_mlsd_line(_) for _ in lines]
+
+
+def list_(ftp_handler, path):
+    lines = []
+    ftp_handler.retrlines('LIST {0}'.format(path), lines.append)
+    return [_ for _ in (parse_list_line(line) for line in lines)
+            if _ is not None]
+
+
+def listdir(ftp_handler, path, method='mlsd'):
+    """
+    list path with one command, returns a list of (name, facts), where facts
+    is a dict with at least type and size (for files), names don't include
+    path. With method == 'mlsd', LIST is used instead if MLSD isn't supported
+    by the server
+    """
+    host = getattr(ftp_handler, 'host', None)
+    if method == 'mlsd' and host not in NO_MLSD_HOSTS:
+        try:
+            return [_ for _ in mlsd(ftp_handler, path)
+                    if _[0] not in ('.', '..')
+                    and _[1].get('type') not in ('cdir', 'pdir')]
+        except ftplib.error_perm as err:
+            # 500/502: command not recognized/implemented, other 5xx errors
+            # like 550 (no such directory) are raised as usual
+            if not str(err).startswith(('500', '502')):
+                raise
+            logger.info('MLSD not supported by {0} ({1}), falling back to '
+                        'LIST'.format(host, err))
+            NO_MLSD_HOSTS.add(host)
+    return list_(ftp_handler, path)
@@ -0,0 +1,105 @@
+"""
+A pool of logged-in FTP sessions shared by threads, used to fetch sras_info of
+many samples concurrently. Sessions are created lazily up to the size of the
+pool, and a session that fails with a connection error is thrown away and
+replaced with a new one
+"""
+
+import socket
+import ftplib
+import threading
+import Queue
+import logging
+logger = logging.getLogger(__name__)
+
+
+# errors that indicate the session is no longer usable, e.g. the connection
+# is dropped by the server (421) or timed out
+FTP_CONNECTION_ERRORS = (socket.error, EOFError, IOError, ftplib.error_temp)
+
+
+class FTPPool(object):
+    def __init__(self, connect, size=1, max_retries=3):
+        """
+        :param connect: a callable that returns a new logged-in FTP session,
+                        e.g. functools.partial(get_ftp_handler, sample_url)
+        :param size: the max number of concurrent sessions
+        :param max_retries: the number of times an operation is retried with a
+                            new session after a connection error
+        """
+        self.connect = connect
+        self.size = size
+        self.max_retries = max_retries
+        self.idle = Queue.Queue()
+        self.num_sessions = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        """check out an idle session, create one if none is idle and the pool
+        isn't full yet, otherwise wait for one to be returned"""
+        try:
+            return self.idle.get_nowait()
+        except Queue.Empty:
+            pass
+        with self.lock:
+            create = self.num_sessions < self.size
+            if create:
+                self.num_sessions += 1
+        if not create:
+            return self.idle.get()
+        try:
+            return self.connect()
+        except:
+            with self.lock:
+                self.num_sessions -= 1
+            raise
+
+    def put(self, ftp):
+        """return a session to the pool"""
+        self.idle.put(ftp)
+
+    def discard(self, ftp):
+        """close a broken session, so a new one can be created in its place"""
+        try:
+            ftp.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.num_sessions -= 1
+
+    def run(self, func, *args, **kwargs):
+        """
+        call func(*args, ftp, **kwargs) with a session from the pool, if it
+        fails with a connection error, retry with a new session
+        """
+        for attempt in xrange(self.max_retries + 1):
+            ftp = self.get()
+            try:
+                res = func(*(args + (ftp,)), **kwargs)
+            except FTP_CONNECTION_ERRORS as err:
+                self.discard(ftp)
+                if attempt == self.max_retries:
+                    raise
+                logger.warning('FTP connection error ({0}), reconnecting '
+                               '({1}/{2})'.format(err, attempt + 1,
+                                                  self.max_retries))
+            except:
+                self.put(ftp)
+                raise
+            else:
+                self.put(ftp)
+                return res
+
+    def close(self):
+        """quit all idle sessions"""
+        while True:
+            try:
+                ftp = self.idle.get_nowait()
+            except Queue.Empty:
+                break
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+            with self.lock:
+                self.num_sessions -= 1
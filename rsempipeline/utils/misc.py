@@ -4,7 +4,9 @@
 
 import os
 import re
+import stat
 import time
+import functools
 import logging
 import select
 import subprocess
@@ -12,10 +14,45 @@ import pickle
 import glob
 from datetime import datetime
 from functools import update_wrapper
+from multiprocessing.pool import ThreadPool
 logger = logging.getLogger(__name__)
 
 import yaml
-import paramiko
+
+from rsempipeline.utils import ssh_pool
+
+# os.scandir is only available since python-3.5, the scandir package is its
+# backport, when neither is available, fall back to os.listdir + os.stat
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+def list_dir(dir_):
+    """
+    list dir_ non-recursively, and return a tuple of two lists, the names of
+    the sub-directories and the names of the other entries. With scandir, no
+    extra stat call is needed per entry on most file systems
+    """
+    dirs, files = [], []
+    if scandir is not None:
+        for entry in scandir(dir_):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+    else:
+        for name in os.listdir(dir_):
+            path = os.path.join(dir_, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                dirs.append(name)
+            else:
+                files.append(name)
+    return dirs, files
 
 
 def mkdir(d):
@@ -148,36 +185,6 @@ def get_config(config_yaml_file):
             'potentially invalid yaml format in {0}'.format(config_yaml_file))
         raise
 
-# cache functions are deprecated
-
-# def cache_usable(cache_file, *ref_files):
-#     """check if cache is still usable"""
-#     f_cache_usable = True
-#     if os.path.exists(cache_file):
-#         logger.info('{0} exists'.format(cache_file))
-#         if cache_up_to_date(cache_file, *ref_files):
-#             logger.info('{0} is up to date. '
-#                         'reading outputs from cache'.format(cache_file))
-#         else:
-#             logger.info('{0} is outdated'.format(cache_file))
-#             f_cache_usable = False
-#     else:
-#         logger.info('{0} doesn\'t exist'.format(cache_file))
-#         f_cache_usable = False
-#     return f_cache_usable
-
-
-# def cache_up_to_date(cache_file, *ref_files):
-#     """check if cache is up-to-date"""
-#     # ctime: e.g. when renaming test.bk to test changes information in
-#     # inode
-#     for _ in ref_files:
-#         if (os.path.getmtime(cache_file) < os.path.getmtime(_) or
-#             os.path.getctime(cache_file) < os.path.getctime(_)):
-#             return False
-#     return True
-
-
 # used a better version of execute as defined in rsempipeline.py --2014-08-13
 def execute(cmd, msg_id='', flag_file=None, debug=False):
     """
@@ -302,66 +309,149 @@ def ugly_usage(val):
         return size * 2 ** 50
 
 
-def is_empty_dir(dir_, output):
-    """
-    test if dir_ is an empty dir based on output. If it's an empty dir, then
-    there should be only one item is the list (output)
-    """
-    return len([_ for _ in output if dir_ in _]) == 1
-
-
 def sshexec(cmd, host, username, private_key_file='~/.ssh/id_rsa'):
     """
-    ssh to username@remote and execute cmd.
+    ssh to username@remote and execute cmd. The connection is kept and
+    reused by later calls in the same process, see ssh_pool
 
     :param private_key_file: could be ~/.ssh/id_dsa, as well
     """
-    private_key_file = os.path.expanduser(private_key_file)
-    rsa_key = paramiko.RSAKey.from_private_key_file(private_key_file)
+    return ssh_pool.get_manager().exec_command(
+        cmd, host, username, private_key_file)
 
-    # This step will timeout after about 75 seconds if cannot proceed
-    channel = paramiko.Transport((host, 22))
 
-    channel.connect(username=username, pkey=rsa_key)
-    session = channel.open_session()
-    # if exec_command fails, None will be returned
-    session.exec_command(cmd)
+def sshexec_iter(cmd, host, username, private_key_file='~/.ssh/id_rsa'):
+    """the same as sshexec, but yields lines of output as they're received"""
+    return ssh_pool.get_manager().iter_command(
+        cmd, host, username, private_key_file)
 
-    # not sure what -1 does? learned from ssh.py
-    output = session.makefile('rb', -1).readlines()
-    channel.close()
-    # if execution failed, output is None
-    return output
 
+def disk_used(dir, num_threads=1, apparent_size=False):
+    """
+    mimic the linux command du, equivalent to du -s dir. Allocated blocks of
+    files and directories are counted, hard links only once, unless
+    apparent_size is True, in which case the sum of sizes of files (not
+    directories) is returned as before
+
+    The tree is walked level by level, directories of the same level are
+    scanned in a thread pool of num_threads, which speeds up walking a large
+    tree on a network file system a lot
 
-def disk_used(dir):
-    """mimic the linux command du, equivalent to du -s l_top_outdir"""
+    :param num_threads: the number of threads scanning directories
+    """
     # proc = subprocess.Popen(
     #     'du -s {0}'.format(l_top_outdir), stdout=subprocess.PIPE, shell=True)
     # output = proc.communicate()[0]
     # return int(output[0].split('\t')[0]) * 1024 # in KB => byte
-    # surprisingly, os.walk is of similar speed to du
-    total_size = 0
-    for dirpath, _, filenames in os.walk(dir):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
+    total_size = 0 if apparent_size else get_usage(os.lstat(dir), False)
+    # (st_dev, st_ino) of files with more than one hard link
+    inodes = set()
+    level = [dir]
+    pool = ThreadPool(num_threads) if num_threads > 1 else None
+    try:
+        while level:
+            if pool is not None and len(level) > 1:
+                results = pool.map(
+                    functools.partial(scan_dir, apparent_size=apparent_size),
+                    level)
+            else:
+                results = [scan_dir(_, apparent_size) for _ in level]
+            level = []
+            for size, linked, subdirs in results:
+                total_size += size
+                for inode, usage in linked:
+                    if inode not in inodes:
+                        inodes.add(inode)
+                        total_size += usage
+                level.extend(subdirs)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
     return total_size
 
 
-def disk_free(df_cmd):
+def get_usage(st, apparent_size=False):
+    """allocated size in bytes (like du), or apparent size"""
+    if apparent_size:
+        return st.st_size
+    # st_blocks is always in units of 512 bytes, it's unavailable on windows
+    blocks = getattr(st, 'st_blocks', None)
+    return st.st_size if blocks is None else blocks * 512
+
+
+def scan_dir(dir_, apparent_size=False):
     """
-    Get the local free disk space by executing df_cmd as specified in the
-    rsempipeline_config.yaml
+    scan a directory non-recursively, used by disk_used
+
+    :returns: a tuple of the usage of entries in dir_ except hard links, a
+              list of ((st_dev, st_ino), usage) of hard links, and a list of
+              paths of sub-directories
+    """
+    size, linked, subdirs = 0, [], []
+    try:
+        if scandir is not None:
+            # the stat result of each entry is cached by scandir, and whether
+            # it's a directory is known without a stat call
+            entries = [(_.path, _.stat) for _ in scandir(dir_)]
+        else:
+            entries = [(os.path.join(dir_, _), None) for _ in os.listdir(dir_)]
+    except OSError as err:
+        # e.g. removed while walking, or permission denied, du skips them too
+        logger.debug('skipped {0}: {1}'.format(dir_, err))
+        return size, linked, subdirs
+
+    for path, stat_entry in entries:
+        try:
+            if stat_entry is not None:
+                st = stat_entry(follow_symlinks=False)
+            else:
+                st = os.lstat(path)
+        except OSError as err:
+            # e.g. a file removed after the directory was listed, only the
+            # entry is skipped, the same as du
+            logger.debug('skipped {0}: {1}'.format(path, err))
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            subdirs.append(path)
+            if apparent_size:
+                continue
+        usage = get_usage(st, apparent_size)
+        if st.st_nlink > 1 and not stat.S_ISDIR(st.st_mode):
+            linked.append(((st.st_dev, st.st_ino), usage))
+        else:
+            size += usage
+    return size, linked, subdirs
 
-    :param df: e.g. df -k -P /path/to/dir, must be in KB
 
+def disk_free(df_cmd=None, dir=None):
+    """
+    Get the local free disk space of the file system where dir is with
+    os.statvfs, or by executing df_cmd as specified in the
+    rsempipeline_config.yaml if it's given
+
+    :param df_cmd: e.g. df -k -P /path/to/dir, must be in KB
+    :param dir: used when df_cmd is not given
     """
+    if not df_cmd:
+        st = os.statvfs(dir)
+        # blocks available to unprivileged users, the same as Available of df
+        return st.f_bavail * st.f_frsize
     proc = subprocess.Popen(df_cmd, stdout=subprocess.PIPE, shell=True)
     stdout, _ = proc.communicate()
     # e.g. output:
     # 'Filesystem     1024-blocks       Used  Available Capacity Mounted on\nisaac:/btl2    10200547328 1267127584 8933419744      13% /projects/btl2\n'
-    return int(stdout.split(os.linesep)[1].split()[3]) * 1024
+    return parse_df_output(stdout.split(os.linesep))
+
+
+def parse_df_output(lines):
+    """
+    :param lines: lines of output of df -k -P, e.g.
+    ['Filesystem     1024-blocks       Used  Available Capacity Mounted on',
+     'isaac:/btl2    10200547328 1267127584 8933419744      13% /projects/btl2']
+    :returns: the available space in bytes
+    """
+    return int(lines[1].split()[3]) * 1024
 
 
 def calc_free_space_to_use(current_usage, free, min_free, max_usage):
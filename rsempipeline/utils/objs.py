@@ -1,26 +1,40 @@
 """Lists objects used in rsempipeline.py"""
 
 import os
+import itertools
 
 class Series(object):
     """The object that corresponds to a GSE/Series"""
 
+    # __slots__ saves the per-instance __dict__, which matters when 100k+
+    # samples are loaded
+    __slots__ = ('name', 'samples', '_passed', '_num_passed', 'soft_file')
+
     def __init__(self, name, soft_file=''):
         # name: e.g. GSE46224
         self.name = name
-        # only passed samples goes here, i.e. sample.is_info_complete return
-        # True
-        self.passed_samples = []
         self.samples = []       # all samples
+        # one flag per sample in self.samples, 1 if it's passed, i.e.
+        # sample.is_info_complete return True, so passed samples aren't
+        # referenced by a second list
+        self._passed = bytearray()
+        self._num_passed = 0
         # this soft_file where this series belongs
         self.soft_file = soft_file
 
-    def add_sample(self, sample):
+    @property
+    def passed_samples(self):
+        """only passed samples, in the order they are added"""
+        return list(itertools.compress(self.samples, self._passed))
+
+    def add_sample(self, sample, passed=False):
         self.samples.append(sample)
+        self._passed.append(1 if passed else 0)
+        if passed:
+            self._num_passed += 1
 
     def add_passed_sample(self, sample):
-        self.add_sample(sample)
-        self.passed_samples.append(sample)
+        self.add_sample(sample, passed=True)
 
     def num_samples(self):
         """return the number of total samples for this Series"""
@@ -31,7 +45,15 @@ class Series(object):
         return the number of passed (i.e. qualified after checking in
         soft_parser.py) samples
         """
-        return len(self.passed_samples)
+        return self._num_passed
+
+    def __getstate__(self):
+        return (self.name, self.samples, self._passed, self._num_passed,
+                self.soft_file)
+
+    def __setstate__(self, state):
+        (self.name, self.samples, self._passed, self._num_passed,
+         self.soft_file) = state
 
     def __str__(self):
         return "{0} (passed samples: {1}/{2})".format(
@@ -44,6 +66,8 @@ class Series(object):
 class Sample(object):
     """The object that corresponds to a GSM/Sample"""
 
+    __slots__ = ('name', 'series', 'index', '_organism', 'url', 'outdir')
+
     def __init__(self, name, series, index=0, organism=None, url=None):
         """
         @params index: index of passed sample, 1-based, 0 means not indexed
@@ -59,6 +83,28 @@ class Sample(object):
         # self.sras = []
         self.outdir = None      # not created yet
 
+    @property
+    def organism(self):
+        return self._organism
+
+    @organism.setter
+    def organism(self, value):
+        # there are only a few distinct organisms, interning them makes all
+        # samples share the same string objects
+        if isinstance(value, str):
+            value = intern(value)
+        self._organism = value
+
+    def __getstate__(self):
+        return (self.name, self.series, self.index, self._organism, self.url,
+                self.outdir)
+
+    def __setstate__(self, state):
+        (self.name, self.series, self.index, organism, self.url,
+         self.outdir) = state
+        # strings are no longer interned after unpickling
+        self.organism = organism
+
     def is_info_complete(self):
         """
         see if the is information of this sample is complete, by which it means
@@ -3,7 +3,7 @@
 """
 This module contains utilities functions used before the pipeline actually
 gets run, e.g. Generating a list of Sample instances based on inputs,
-initiating directories for all samples, downloading sras_info.yaml files and
+initiating directories for all samples, downloading sras_info and
 selecting a subset of Sample instances for further process based on free-space
 availabilities (a combined rule based on availale free space on the file system
 and parameters from rsempipeline_config.yaml
@@ -11,19 +11,31 @@ and parameters from rsempipeline_config.yaml
 
 import os
 import re
-import yaml
+import time
 import urlparse
+import posixpath
+import functools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from ftplib import FTP
 import logging
 logger = logging.getLogger(__name__)
 
 from rsempipeline.parsers.soft_parser import parse
-from rsempipeline.parsers.isamp_parser import get_isamp
+from rsempipeline.parsers.isamp_parser import get_isamp, get_isamp_priorities
+from rsempipeline.utils.status_index import StatusIndex
+from rsempipeline.utils.ftp_pool import FTPPool, FTP_CONNECTION_ERRORS
+from rsempipeline.utils import ftp_listing
+from rsempipeline.utils import selection
+from rsempipeline.utils.scheduling import Scheduler
+from rsempipeline.utils import sras_info_store as SIS
+from rsempipeline.utils import size_estimator as SE
 from rsempipeline.utils.misc import (
     pretty_usage, ugly_usage, disk_used, disk_free, calc_free_space_to_use)
 from rsempipeline.conf.settings import (
-    SRA_INFO_FILE_BASENAME, QSUB_SUBMIT_SCRIPT_BASENAME, SRA2FASTQ_SIZE_RATIO,
-    RSEM_OUTPUT_BASENAME)
+    QSUB_SUBMIT_SCRIPT_BASENAME, SRA2FASTQ_SIZE_RATIO,
+    RSEM_OUTPUT_BASENAME, SOFT_CACHE_DIR_BASENAME, SRAS_INFO_DB_BASENAME,
+    SRAS_INFO_CACHE_SIZE, GSM_FIRST_SEEN_BASENAME, SIZE_HISTORY_DB_BASENAME)
 
 
 def calc_num_isamp(isamp):
@@ -47,23 +59,48 @@ def log_isamp(isamp_file_or_str, isamp):
 
 
 # about generating samples from soft and isamp inputs
-def gen_all_samples_from_soft_and_isamp(soft_files, isamp_file_or_str, config):
+def gen_all_samples_from_soft_and_isamp(soft_files, isamp_file_or_str, config,
+                                        n_jobs=None, soft_cache=None):
     """
     :param isamp: e.g. mannually prepared interested sample file
     (e.g. GSE_species_GSM.csv) or isamp_str as specified on the command
 
     :type isamp: a dict with key and value as listing of strings, not Sample
     instances
+
+    :param n_jobs: the number of processes for parsing soft files, if None,
+    SOFT_PARSE_JOBS in config is used, which defaults to 1
+
+    :param soft_cache: a SoftCache instance, if None, soft files are always
+    parsed from scratch
     """
     # IMPORTANT NOTE: for historical reason, soft files parsed does not return
     # dict as get_isamp
     isamp = get_isamp(isamp_file_or_str)
     log_isamp(isamp_file_or_str, isamp)
 
+    if n_jobs is None:
+        n_jobs = config.get('SOFT_PARSE_JOBS', 1)
+    interested_organisms = config['INTERESTED_ORGANISMS']
+    args_list = [(_, isamp, interested_organisms, soft_cache)
+                 for _ in soft_files]
+    if n_jobs > 1 and len(soft_files) > 1:
+        logger.info('parsing {0} soft files with {1} processes'.format(
+            len(soft_files), n_jobs))
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            # map preserves the order of soft_files, so the merged list of
+            # samples is the same as that from parsing in serial
+            res = pool.map(analyze_one_star, args_list)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        res = [analyze_one(*_) for _ in args_list]
+
     # a list, of Sample instances resultant of intersection
     intersected_samples = []
-    for soft_file in soft_files:
-        soft_samples = analyze_one(soft_file, isamp, config['INTERESTED_ORGANISMS'])
+    for soft_samples in res:
         if soft_samples:
             intersected_samples.extend(soft_samples)
     num_inter_samp = len(intersected_samples)
@@ -71,12 +108,20 @@ def gen_all_samples_from_soft_and_isamp(soft_files, isamp_file_or_str, config):
     return intersected_samples
 
 
-def analyze_one(soft_file, isamp, interested_organisms):
+def analyze_one_star(args):
+    """unpack args for analyze_one, used with multiprocessing.Pool.map"""
+    return analyze_one(*args)
+
+
+def analyze_one(soft_file, isamp, interested_organisms, soft_cache=None):
     """analyze a single soft_file"""
     if not filename_check(soft_file):
         return
 
-    s_series = parse(soft_file, interested_organisms)
+    if soft_cache is None:
+        s_series = parse(soft_file, interested_organisms)
+    else:
+        s_series = soft_cache.parse(soft_file, interested_organisms)
     # s_series should be in the list of series that are interested by the
     # collaborator
     if not s_series.name in isamp.keys():
@@ -132,6 +177,33 @@ def get_rsem_outdir(top_outdir):
     return os.path.join(top_outdir, RSEM_OUTPUT_BASENAME)
 
 
+def get_soft_cache_dir(top_outdir):
+    """
+    get the directory where parsed soft files are cached, it's
+    top_outdir/soft_cache by default.
+    """
+    return os.path.join(top_outdir, SOFT_CACHE_DIR_BASENAME)
+
+
+def build_status_index(top_outdir):
+    """
+    build a StatusIndex of top_outdir/rsem_output, which answers the
+    completion status of GSMs from memory during selection
+    """
+    return StatusIndex(get_rsem_outdir(top_outdir)).build()
+
+
+def init_size_estimator(top_outdir, quantile=0.9, min_samples=10):
+    """
+    initialize the process-wide SizeEstimator with the size history at
+    top_outdir/size_history.sqlite
+    """
+    if not os.path.exists(top_outdir):
+        os.makedirs(top_outdir)
+    db_file = os.path.join(top_outdir, SIZE_HISTORY_DB_BASENAME)
+    return SE.init_estimator(db_file, top_outdir, quantile, min_samples)
+
+
 # about init sample outdirs
 def init_sample_outdirs(samples, top_outdir):
     """
@@ -155,36 +227,140 @@ def get_ftp_handler(sample_url):
     return ftp_handler
 
 
+def init_sras_info_store(top_outdir, samples, export_yaml=True,
+                         cache_size=SRAS_INFO_CACHE_SIZE):
+    """
+    initialize the process-wide SrasInfoStore at top_outdir/sras_info.sqlite,
+    and import existing sras_info.yaml files of samples that are not in the
+    store yet
+    """
+    if not os.path.exists(top_outdir):
+        os.makedirs(top_outdir)
+    db_file = os.path.join(top_outdir, SRAS_INFO_DB_BASENAME)
+    store = SIS.init_store(db_file, top_outdir, export_yaml, cache_size)
+    store.import_yaml([_.outdir for _ in samples])
+    return store
+
+
 # about fetch sras info
-def fetch_sras_info(samples, flag_recreate_sras_info):
+def fetch_sras_info(samples, flag_recreate_sras_info, num_sessions=1,
+                    listing='nlst', retries=0, backoff=30,
+                    max_backoff=86400):
     """
     Fetch information (name & size) for sra files to be downloaded and save
-    them to a sras_info.yaml file under the output dir of each sample.
+    them to the sras_info store (and/or a sras_info.yaml file under the output
+    dir of each sample).
+
+    Samples whose sras_info failed to be fetched (e.g. due to network
+    problems) are put in a retry queue, which is fetched again in up to
+    `retries` more passes, waiting backoff * 2 ** (k - 1) seconds before the
+    kth one. Failures are recorded in the sras_info store, and samples that
+    still fail are returned, they'll be fetched again in a later run.
+
+    Across runs, the recorded failures are backed off the same way up to
+    max_backoff seconds: a sample isn't fetched again until that long after
+    its last failed attempt, and samples that failed fewer times are fetched
+    first, so ones that keep failing don't hold up the others.
+
+    :param num_sessions: the number of FTP sessions used to fetch sras_info of
+    samples concurrently, results are saved one sample at a time by the
+    calling thread as they arrive
+    :param listing: passed to fetch_sras_info_per
     """
     # e.g. of sample.url
     # ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX029/SRX029242
+    if listing not in ftp_listing.LISTING_METHODS:
+        raise ValueError('unknown FTP_LISTING: {0}, should be one of {1}'.format(
+            listing, ftp_listing.LISTING_METHODS))
+    samples = [_ for _ in samples if flag_recreate_sras_info
+               or not SIS.has_sras_info(_.outdir)]
+    now = time.time()
+    deferred = [_ for _ in samples if SIS.get_fetch_retry_time(
+        _.outdir, backoff, max_backoff) > now]
+    if deferred:
+        logger.info('deferred fetching sras info for {0} samples that failed '
+                    'recently: {1}'.format(len(deferred),
+                                           ', '.join(str(_) for _ in deferred)))
+        samples = [_ for _ in samples if _ not in deferred]
+    samples.sort(key=lambda _: SIS.get_fetch_failures(_.outdir))
+    for k in xrange(retries + 1):
+        if not samples:
+            break
+        if k > 0:
+            wait = backoff * 2 ** (k - 1)
+            logger.info('retrying to fetch sras info for {0} failed samples in '
+                        '{1}s ({2}/{3})'.format(len(samples), wait, k, retries))
+            time.sleep(wait)
+        samples = fetch_sras_info_pass(samples, num_sessions, listing)
+        SIS.record_fetch_failures([_.outdir for _ in samples])
+    if samples:
+        logger.warning('failed to fetch sras info for {0} samples: {1}'.format(
+            len(samples), ', '.join(str(_) for _ in samples)))
+    return samples + deferred
+
+
+def fetch_sras_info_pass(samples, num_sessions=1, listing='nlst'):
+    """
+    fetch sras_info of samples once, and return the samples failed
+    """
+    failed = []
     num_samples = len(samples)
-    ftp_handler = get_ftp_handler(samples[0].url)
-    for k, sample in enumerate(samples):
-        sras_info_yml = os.path.join(sample.outdir, SRA_INFO_FILE_BASENAME)
-        if os.path.exists(sras_info_yml) and not flag_recreate_sras_info:
-            continue
-        logger.info('({0}/{1}), fetching sras info from FTP for {2}, saving '
-                    'to {3}'.format(k+1, num_samples, sample, sras_info_yml))
-        sras_info = fetch_sras_info_per(sample.url, ftp_handler)
-        if sras_info:       # could be None due to Network problem
-            write(sras_info, sras_info_yml)
-    ftp_handler.quit()
+    ftp_pool = FTPPool(functools.partial(get_ftp_handler, samples[0].url),
+                       num_sessions)
+    thread_pool = ThreadPool(min(num_sessions, num_samples))
+    try:
+        results = thread_pool.imap_unordered(
+            functools.partial(fetch_sras_info_with_pool, ftp_pool=ftp_pool,
+                              listing=listing),
+            samples)
+        for k, (sample, sras_info) in enumerate(results):
+            logger.info('({0}/{1}), fetched sras info from FTP for {2}'.format(
+                k+1, num_samples, sample))
+            if sras_info:       # could be None due to Network problem
+                SIS.save_sras_info(sample.outdir, sras_info)
+            else:
+                failed.append(sample)
+    finally:
+        thread_pool.close()
+        thread_pool.join()
+        ftp_pool.close()
+    return failed
+
+
+def skip_samples_without_sras_info(samples):
+    """
+    exclude samples without sras_info, e.g. those failed to be fetched, so
+    that they don't crash the selection and the pipeline
+    """
+    res = []
+    for sample in samples:
+        if SIS.has_sras_info(sample.outdir):
+            res.append(sample)
+        else:
+            logger.warning('{0}: no sras info available, skipped'.format(
+                sample))
+    return res
 
 
-def write(sras_info, output_yml):
-    with open(output_yml, 'wb') as opf:
-        yaml.dump(sras_info, stream=opf, default_flow_style=False)
+def fetch_sras_info_with_pool(sample, ftp_pool, listing='nlst'):
+    """
+    fetch information of sra files for one sample with a session from
+    ftp_pool, run in a thread of fetch_sras_info
+    """
+    try:
+        return sample, ftp_pool.run(fetch_sras_info_per, sample.url,
+                                    listing=listing)
+    except Exception, err:
+        logger.exception(err)
+        return sample, None
 
 
-def fetch_sras_info_per(sample_url, ftp_handler):
+def fetch_sras_info_per(sample_url, ftp_handler, listing='nlst'):
     """
     fetch information of sra files for one sample.
+
+    :param listing: how sra files and their sizes are listed, one of
+    ftp_listing.LISTING_METHODS
     """
     urlparsed = urlparse.urlparse(sample_url)
     # e.g. before_srx_dir: /sra/sra-instant/reads/ByExp/sra/SRX/SRX573[/SRX123456]
@@ -193,73 +369,182 @@ def fetch_sras_info_per(sample_url, ftp_handler):
     # e.g. srx: SRX573027
     srx = os.path.basename(urlparsed.path)
     try:
-        srrs = ftp_handler.nlst(srx)
-        # cool trick for flatten 2D list:
-        # http://stackoverflow.com/questions/2961983/convert-multi-dimensional-list-to-a-1d-list-in-python
-        sras = [_ for srr in srrs for _ in ftp_handler.nlst(srr)]
-
-        # to get size,
-        # http://stackoverflow.com/questions/3231910/python-ftplib-cant-get-size-of-file-before-download
-        ftp_handler.sendcmd('TYPE i')
-        # sizes returned are in unit of byte
-        sizes = [ftp_handler.size(_) for _ in sras]
-
+        if listing == 'nlst':
+            sras_sizes = list_sras_by_nlst(srx, ftp_handler)
+        else:
+            sras_sizes = list_sras_by_listdir(srx, ftp_handler, listing)
         sras_info = [{i: {'size': j, 'readable_size': pretty_usage(j)}}
-                     for (i, j) in zip(sras, sizes)]
+                     for (i, j) in sras_sizes]
         # e.g. [{sra1: {'size': 123}}), {sra2: {'size': 456}}, ...]
         return sras_info
+    except FTP_CONNECTION_ERRORS:
+        # leave it to FTPPool to reconnect
+        raise
     except Exception, err:
         logger.exception(err)
 
 
-def select_gsms_to_process(samples, l_free_to_use, ignore_disk_usage=False):
+def list_sras_by_nlst(srx, ftp_handler):
+    """
+    list (sra, size) of sra files under srx with one NLST per directory and
+    one SIZE per sra file
+    """
+    srrs = nlst(srx, ftp_handler)
+    # cool trick for flatten 2D list:
+    # http://stackoverflow.com/questions/2961983/convert-multi-dimensional-list-to-a-1d-list-in-python
+    sras = [_ for srr in srrs for _ in nlst(srr, ftp_handler)]
+
+    # to get size,
+    # http://stackoverflow.com/questions/3231910/python-ftplib-cant-get-size-of-file-before-download
+    ftp_handler.sendcmd('TYPE i')
+    # sizes returned are in unit of byte
+    sizes = [ftp_handler.size(_) for _ in sras]
+    return zip(sras, sizes)
+
+
+def nlst(path, ftp_handler):
+    """
+    NLST path, names returned by some servers (e.g. NCBI) are prefixed with
+    path, but not by others, so they're prefixed here if not
+    """
+    return [_ if '/' in _ else posixpath.join(path, _)
+            for _ in ftp_handler.nlst(path)]
+
+
+def list_sras_by_listdir(srx, ftp_handler, method='mlsd'):
+    """
+    list (sra, size) of sra files under srx with one MLSD (or LIST) per
+    directory, which returns sizes along with names
+    """
+    sras_sizes = []
+    # sorted as the order of MLSD isn't guaranteed
+    for srr, facts in sorted(ftp_listing.listdir(ftp_handler, srx, method)):
+        if facts['type'] != 'dir':
+            continue
+        srr = posixpath.join(srx, srr)
+        for sra, facts in sorted(
+                ftp_listing.listdir(ftp_handler, srr, method)):
+            if facts['type'] == 'file':
+                sras_sizes.append((posixpath.join(srr, sra),
+                                   int(facts['size'])))
+    return sras_sizes
+
+
+def schedule_samples(samples, top_outdir, isamp_file_or_str, config,
+                     status_index=None):
+    """
+    order samples by priority before they're selected to be processed, see
+    rsempipeline.utils.scheduling. Priorities of GSEs in GSE_PRIORITIES of
+    config override those in the isamp csv file. Processed samples (including
+    transferred ones, whose flag files are kept) are dropped from
+    gsm_first_seen.txt
+
+    :param status_index: see is_processed
+    """
+    priorities = get_isamp_priorities(isamp_file_or_str)
+    priorities.update(config.get('GSE_PRIORITIES') or {})
+    scheduler = Scheduler(
+        priorities, os.path.join(top_outdir, GSM_FIRST_SEEN_BASENAME),
+        config.get('PRIORITY_AGING_PER_DAY', 0)).load()
+    done = set(_.name for _ in samples if is_processed(_.outdir, status_index))
+    return scheduler.schedule(samples, done=done)
+
+
+def select_gsms_to_process(samples, l_free_to_use, ignore_disk_usage=False,
+                           status_index=None, strategy='first_fit',
+                           sras_on_disk=None, intermediate_ratio=0,
+                           converting=1):
     """
     Find samples that are to be processed, the selecting rule is implemented
     here
+
+    :param status_index: a StatusIndex, if None, the completion status is
+    checked on the file system directly
+    :param strategy: how GSMs are selected to fit l_free_to_use, one of
+    selection.STRATEGIES
+    :param sras_on_disk, intermediate_ratio, converting: see
+    estimate_sra2fastq_usage
     """
     gsms_to_process = []
-    P = pretty_usage
     for gsm in samples:
-        if is_processed(gsm.outdir):
+        if is_processed(gsm.outdir, status_index):
             logger.debug('{0} has already been processed successfully, pass)'.format(gsm))
             continue
+        gsms_to_process.append(gsm)
 
-        if ignore_disk_usage:
-            gsms_to_process.append(gsm)
-            continue
+    if ignore_disk_usage:
+        return gsms_to_process
 
-        usage = estimate_sra2fastq_usage(gsm.outdir)
-        if usage > l_free_to_use:
-            logger.debug('{0} ({1}) doesn\'t fit current local free_to_use '
-                         '({2})'.format(gsm, P(usage), P(l_free_to_use)))
-            continue
+    usages = [estimate_sra2fastq_usage(_.outdir, sras_on_disk,
+                                       intermediate_ratio, converting)
+              for _ in gsms_to_process]
+    return select_gsms_by_usage(gsms_to_process, usages, l_free_to_use,
+                                strategy, 'local')
 
-        logger.info('{0} ({1}) fits local free_to_use '
-                    '({2})'.format(gsm, P(usage), P(l_free_to_use)))
-        l_free_to_use -= usage
-        gsms_to_process.append(gsm)
-    return gsms_to_process
+
+def select_gsms_by_usage(gsms, usages, free_to_use, strategy='first_fit',
+                         where='local'):
+    """
+    select GSMs to fit free_to_use with the strategy, and log the result
+
+    :param where: local or remote, only used in logging
+    """
+    selected = set(selection.select(usages, free_to_use, strategy))
+    P = pretty_usage
+    res = []
+    total = free_to_use
+    for k, (gsm, usage) in enumerate(zip(gsms, usages)):
+        if k not in selected:
+            logger.debug('{0} ({1}) doesn\'t fit current {2} free_to_use '
+                         '({3})'.format(gsm, P(usage), where, P(free_to_use)))
+            continue
+        logger.info('{0} ({1}) fits {2} free_to_use '
+                    '({3})'.format(gsm, P(usage), where, P(free_to_use)))
+        free_to_use -= usage
+        res.append(gsm)
+    if res and total > 0:
+        logger.info('{0} of {1} GSMs selected by {2}, using {3:.1%} of {4} '
+                    'free_to_use'.format(len(res), len(gsms), strategy,
+                                         1 - free_to_use / float(total), where))
+    return res
 
 
 def get_sras_info(gsm_dir):
-    info_file = os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME)
-    with open(info_file) as inf:
-        return yaml.load(inf.read())
+    return SIS.get_sras_info(gsm_dir)
 
 
-def estimate_sra2fastq_usage(gsm_dir):
+def estimate_sra2fastq_usage(gsm_dir, sras_on_disk=None, intermediate_ratio=0,
+                             converting=1):
     """
     Estimated the disk usage needed for processing a sample based on the size
-    of sra files, the information of which is contained in the info_file 
+    of sra files, the information of which is contained in the info_file. The
+    ratio is learned from the size history if there is enough of it
+
+    :param sras_on_disk: the max number of sra files kept on disk at the same
+    time, when each sra is replaced with a placeholder once converted, None
+    if all of them are kept
+    :param intermediate_ratio: the size of intermediate files (e.g.
+    uncompressed fastq written by fasterq-dump before compressed) relative to
+    the sra, which are on disk only while it's being converted, see
+    sra2fastq.get_intermediate_ratio
+    :param converting: the max number of sra files converted at the same time
     """
-    ratio = float(SRA2FASTQ_SIZE_RATIO)
+    ratio = SE.get_sra2fastq_ratio(gsm_dir)
+    if ratio is None:
+        ratio = float(SRA2FASTQ_SIZE_RATIO)
     sras_info = get_sras_info(gsm_dir)
-    usage = sum(d[k]['size'] for d in sras_info for k in d.keys())
-    usage = (1 + ratio) * usage
-    return usage
-
-
-def is_processed(gsm_dir):
+    sizes = [d[k]['size'] for d in sras_info for k in d.keys()]
+    biggest = sorted(sizes, reverse=True)
+    # the biggest ones are assumed to be converted at the same time
+    intermediate = intermediate_ratio * sum(biggest[:converting])
+    if sras_on_disk is None:
+        return (1 + ratio) * sum(sizes) + intermediate
+    # the biggest ones are assumed to be on disk at the same time
+    peak = sum(biggest[:sras_on_disk])
+    return ratio * sum(sizes) + peak + intermediate
+
+
+def is_processed(gsm_dir, status_index=None):
     """
     Checking the processing status, whether completed or not based the
     existence of COMPLETE flags
@@ -270,9 +555,9 @@ def is_processed(gsm_dir):
     # e.g. /path/to/rsem_output/GSExxxxx/homo_sapiens/GSMxxxxxx
     sra_files = [os.path.join(gsm_dir, _) for _ in sra_files]
     res = False
-    if is_download_complete(gsm_dir, sra_files):
-        if is_sra2fastq_complete(gsm_dir, sra_files):
-            if is_gen_qsub_script_complete(gsm_dir):
+    if is_download_complete(gsm_dir, sra_files, status_index):
+        if is_sra2fastq_complete(gsm_dir, sra_files, status_index):
+            if is_gen_qsub_script_complete(gsm_dir, status_index):
                 res = True
             else:
                 logger.debug('{0}: gen_qsub_script incomplete'.format(gsm_dir))
@@ -282,21 +567,27 @@ def is_processed(gsm_dir):
         logger.debug('{0}: download incomplete'.format(gsm_dir))
     return res
 
-    
-def is_download_complete(gsm_dir, sra_files):
+
+def get_exists(status_index=None):
+    """return the function for checking the existence of a flag file"""
+    return os.path.exists if status_index is None else status_index.exists
+
+
+def is_download_complete(gsm_dir, sra_files, status_index=None):
     flags = [os.path.join(gsm_dir, '{0}.download.COMPLETE'.format(_))
              for _ in map(os.path.basename, sra_files)]
-    return all(map(os.path.exists, flags))
-    
+    return all(map(get_exists(status_index), flags))
+
 
-def is_sra2fastq_complete(gsm_dir, sra_files):
+def is_sra2fastq_complete(gsm_dir, sra_files, status_index=None):
     flags = [os.path.join(gsm_dir, '{0}.sra2fastq.COMPLETE'.format(_))
              for _ in map(os.path.basename, sra_files)]
-    return all(map(os.path.exists, flags))
+    return all(map(get_exists(status_index), flags))
 
 
-def is_gen_qsub_script_complete(gsm_dir):
-    return os.path.exists(os.path.join(gsm_dir, QSUB_SUBMIT_SCRIPT_BASENAME))
+def is_gen_qsub_script_complete(gsm_dir, status_index=None):
+    exists = get_exists(status_index)
+    return exists(os.path.join(gsm_dir, QSUB_SUBMIT_SCRIPT_BASENAME))
 
 
 # def get_recorded_gsms(record_file):
@@ -0,0 +1,87 @@
+"""
+Index the GSM dirs under the remote top output directory from the output of
+find, which is parsed line by line as it's received, so whether a GSM is
+complete or empty is answered from a dict instead of scanning the whole
+listing for every GSM. Set by REMOTE_LISTING:
+
+full: a bare find, which lists every file
+filtered: find only prints GSM dirs, whether they're empty, and the files of
+          interest (rsem.COMPLETE and fastq.gz), it requires GNU find
+"""
+
+import re
+import logging
+logger = logging.getLogger(__name__)
+
+
+LISTING_MODES = ('full', 'filtered')
+
+# a path in a GSM dir (group 2), or the GSM dir itself
+GSM_PATH_RE = re.compile(r'^(.*/[^/]*GSM\d+)(?:/(.+))?$')
+
+# the prefixes of each line printed by the filtered find
+EMPTY_GSM_DIR, GSM_DIR, FILE = 'E', 'D', 'F'
+
+
+def get_find_cmd(r_dir, mode='full'):
+    if mode not in LISTING_MODES:
+        raise ValueError('unknown REMOTE_LISTING: {0}, should be one of '
+                         '{1}'.format(mode, LISTING_MODES))
+    if mode == 'full':
+        return 'find {0}'.format(r_dir)
+    return (
+        "find {0} "
+        "\\( -type d -name '*GSM[0-9]*' -empty -printf '{1} %p\\n' \\) -o "
+        "\\( -type d -name '*GSM[0-9]*' -printf '{2} %p\\n' \\) -o "
+        "\\( -type f \\( -name rsem.COMPLETE -o -name '*.fastq.gz' \\) "
+        "-printf '{3} %p\\n' \\)".format(r_dir, EMPTY_GSM_DIR, GSM_DIR, FILE))
+
+
+class RemoteGSMIndex(object):
+    def __init__(self, mode='full'):
+        self.mode = mode
+        # key: path to a GSM dir, value: a dict of complete (whether
+        # rsem.COMPLETE exists) and empty
+        self.gsm_dirs = {}
+        self.num_lines = 0
+
+    def add_path(self, path, empty=None):
+        match = GSM_PATH_RE.search(path)
+        if not match:
+            return
+        gsm_dir, sub_path = match.groups()
+        item = self.gsm_dirs.setdefault(gsm_dir, {'complete': False, 'empty': True})
+        if sub_path is not None:
+            item['empty'] = False
+            if sub_path == 'rsem.COMPLETE':
+                item['complete'] = True
+        elif empty is not None:
+            item['empty'] = empty
+
+    def add(self, line):
+        """add a line of output of the find command"""
+        line = line.rstrip('\n')
+        if not line:
+            return
+        self.num_lines += 1
+        if self.mode == 'full':
+            self.add_path(line)
+            return
+        kind, _, path = line.partition(' ')
+        if kind == EMPTY_GSM_DIR:
+            self.add_path(path, empty=True)
+        elif kind == GSM_DIR:
+            self.add_path(path, empty=False)
+        elif kind == FILE:
+            self.add_path(path)
+
+    def update(self, lines):
+        for line in lines:
+            self.add(line)
+        return self
+
+    def is_complete(self, gsm_dir):
+        return self.gsm_dirs[gsm_dir]['complete']
+
+    def is_empty(self, gsm_dir):
+        return self.gsm_dirs[gsm_dir]['empty']
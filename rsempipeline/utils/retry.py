@@ -0,0 +1,123 @@
+"""
+Retry commands run by misc.execute and misc.execute_log_stdout_stderr that
+failed with a transient error, e.g. a dropped connection while downloading,
+instead of leaving them to the next run of rp-run. Set by RETRY_POLICY in the
+config, a dict of the policy by task name with a default key, where a task's
+policy overrides the default one, e.g.
+
+RETRY_POLICY:
+  default:
+    max_attempts: 1
+  download:
+    max_attempts: 3
+    returncodes: [1]
+"""
+
+import time
+import random
+import logging
+logger = logging.getLogger(__name__)
+
+
+TASKS = ('download', 'sra2fastq', 'rsem')
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=1, backoff=30, max_backoff=600, jitter=0.5,
+                 returncodes=None):
+        """
+        :param max_attempts: the number of times a command is run at most,
+                             1 means it's never retried
+        :param backoff: seconds to wait before the first retry, doubled
+                        before each next one up to max_backoff
+        :param jitter: the fraction of a wait that's randomized, so commands
+                       that failed at the same time aren't retried at the
+                       same time, too
+        :param returncodes: the returncodes that are retried, None for any
+                            non-zero one
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts should be at least 1: {0}'.format(
+                max_attempts))
+        if not 0 <= jitter <= 1:
+            raise ValueError('jitter should be between 0 and 1: {0}'.format(
+                jitter))
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.returncodes = returncodes
+
+    def is_retryable(self, returncode):
+        # None means it's in debug mode or the command failed to start, which
+        # isn't transient
+        if returncode is None or returncode == 0:
+            return False
+        return self.returncodes is None or returncode in self.returncodes
+
+    def get_wait(self, attempt):
+        """seconds to wait before the retry after the attempt-th run"""
+        wait = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return wait * (1 - self.jitter * random.random())
+
+    def call(self, execute, cmd, *args, **kwargs):
+        """
+        call execute (misc.execute or misc.execute_log_stdout_stderr) with
+        cmd and the other arguments until it succeeds, fails with a
+        returncode that isn't retryable, or max_attempts is reached
+
+        :returns: the returncode of the last run
+        """
+        msg_id = args[0] if args else kwargs.get('msg_id', '')
+        for attempt in xrange(1, self.max_attempts + 1):
+            returncode = execute(cmd, *args, **kwargs)
+            if not self.is_retryable(returncode):
+                break
+            if attempt == self.max_attempts:
+                if self.max_attempts > 1:
+                    logger.error('{0}: gave up after {1} attempts. CMD: '
+                                 '"{2}"'.format(msg_id, attempt, cmd))
+                break
+            wait = self.get_wait(attempt)
+            logger.warning(
+                '{0}: failed with a returncode of {1}, retrying in {2:.1f}s '
+                '({3}/{4}). CMD: "{5}"'.format(
+                    msg_id, returncode, wait, attempt, self.max_attempts - 1,
+                    cmd))
+            time.sleep(wait)
+        if returncode == 0 and attempt > 1:
+            logger.info('{0}: succeeded after {1} attempts. CMD: "{2}"'.format(
+                msg_id, attempt, cmd))
+        return returncode
+
+
+_policies = {}
+
+
+def init_policies(conf=None):
+    """
+    :param conf: the value of RETRY_POLICY in the config
+    """
+    global _policies
+    conf = conf or {}
+    unknown = set(conf) - set(TASKS) - set(['default'])
+    if unknown:
+        raise ValueError('unknown task(s) in RETRY_POLICY: {0}, should be '
+                         'among {1}'.format(', '.join(sorted(unknown)), TASKS))
+    default = conf.get('default') or {}
+    policies = {}
+    for task in TASKS:
+        kwargs = dict(default)
+        kwargs.update(conf.get(task) or {})
+        try:
+            policies[task] = RetryPolicy(**kwargs)
+        except TypeError:
+            raise ValueError('invalid RETRY_POLICY of {0}: {1}'.format(
+                task, kwargs))
+    _policies = policies
+    return _policies
+
+
+def get_policy(task):
+    """the policy of task, which runs a command only once if not initialized"""
+    return _policies.get(task, RetryPolicy())
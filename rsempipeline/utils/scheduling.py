@@ -0,0 +1,92 @@
+"""
+Order GSMs by priority before they're selected to be processed, so that GSMs
+of urgent GSEs are considered first. The priority of a GSM is that of its GSE
+(from GSE_PRIORITIES in the config or the 4th column of GSE_species_GSM.csv,
+defaults to 0) plus PRIORITY_AGING_PER_DAY for each day since the GSM was
+first seen, so GSMs of low priority don't wait for ever. When the GSMs were
+first seen is kept in LOCAL_TOP_OUTDIR/gsm_first_seen.txt until they're
+processed
+"""
+
+import os
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+
+SECONDS_PER_DAY = 24 * 3600.
+
+
+class Scheduler(object):
+    def __init__(self, priorities=None, first_seen_file=None,
+                 aging_per_day=0):
+        """
+        :param priorities: a dict of priorities keyed by GSE, the higher the
+                           more urgent
+        :param first_seen_file: where the time GSMs were first seen is kept,
+                                if None, it's not persisted between runs
+        :param aging_per_day: the priority gained per day of waiting
+        """
+        self.priorities = priorities or {}
+        self.first_seen_file = first_seen_file
+        self.aging_per_day = aging_per_day
+        # key: GSM, value: the time it was first seen in seconds since epoch
+        self.first_seen = {}
+
+    def load(self):
+        if self.first_seen_file and os.path.exists(self.first_seen_file):
+            with open(self.first_seen_file) as inf:
+                for line in inf:
+                    gsm, _, seen = line.strip().partition('\t')
+                    if gsm and seen:
+                        self.first_seen[gsm] = float(seen)
+        return self
+
+    def dump(self):
+        """written to a temporary file first and then renamed"""
+        if not self.first_seen_file:
+            return
+        tmp_file = '{0}.{1}.tmp'.format(self.first_seen_file, os.getpid())
+        with open(tmp_file, 'wb') as opf:
+            for gsm in sorted(self.first_seen):
+                opf.write('{0}\t{1:.0f}\n'.format(gsm, self.first_seen[gsm]))
+        os.rename(tmp_file, self.first_seen_file)
+
+    def get_priority(self, sample, now):
+        priority = self.priorities.get(sample.series.name, 0)
+        waited = max(now - self.first_seen.get(sample.name, now), 0)
+        return priority + self.aging_per_day * waited / SECONDS_PER_DAY
+
+    def schedule(self, samples, now=None, done=None):
+        """
+        record samples not seen before, and return them sorted by priority in
+        descending order, samples of the same priority keep their order
+
+        :param done: names of GSMs that have been processed, which no longer
+                     need to be kept in first_seen
+        """
+        if now is None:
+            now = time.time()
+        done = done or set()
+        num_pruned = 0
+        for gsm in done:
+            if self.first_seen.pop(gsm, None) is not None:
+                num_pruned += 1
+        num_new = 0
+        for sample in samples:
+            if sample.name not in self.first_seen and sample.name not in done:
+                self.first_seen[sample.name] = now
+                num_new += 1
+        if num_new or num_pruned:
+            self.dump()
+        priorities = dict((_.name, self.get_priority(_, now)) for _ in samples)
+        res = sorted(samples, key=lambda _: priorities[_.name], reverse=True)
+        if res:
+            logger.info('scheduled {0} samples, {1} first seen, priorities '
+                        'from {2:.2f} to {3:.2f}'.format(
+                            len(res), num_new, priorities[res[-1].name],
+                            priorities[res[0].name]))
+        for sample in res:
+            logger.debug('{0}: priority {1:.2f}'.format(
+                sample, priorities[sample.name]))
+        return res
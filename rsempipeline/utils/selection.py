@@ -0,0 +1,119 @@
+"""
+Strategies for selecting GSMs whose estimated usages fit into the free space
+to use, configured by GSM_SELECTION_STRATEGY:
+
+first_fit: walk through GSMs in their original order and take each one that
+           still fits, as done before the strategies were introduced
+first_fit_decreasing: the same as first_fit, but walk from the largest GSM to
+                      the smallest, so large GSMs don't wait for ever
+knapsack: a 0/1 knapsack by bytes, maximizing the total usage selected, i.e.
+          the utilization of the free space
+max_count: maximize the number of GSMs selected, i.e. take the smallest ones
+"""
+
+import math
+import logging
+logger = logging.getLogger(__name__)
+
+
+# the free space is divided into this number of units for the knapsack, so its
+# time and memory are O(number of GSMs * KNAPSACK_RESOLUTION)
+KNAPSACK_RESOLUTION = 1000
+
+
+def fit(order, usages, free_to_use):
+    """take usages in the given order as long as they fit"""
+    selected = []
+    for k in order:
+        if usages[k] <= free_to_use:
+            selected.append(k)
+            free_to_use -= usages[k]
+    return selected
+
+
+def first_fit(usages, free_to_use):
+    return fit(xrange(len(usages)), usages, free_to_use)
+
+
+def first_fit_decreasing(usages, free_to_use):
+    # sorted is stable, so GSMs of the same usage keep their original order
+    order = sorted(xrange(len(usages)), key=lambda k: usages[k], reverse=True)
+    return fit(order, usages, free_to_use)
+
+
+def max_count(usages, free_to_use):
+    order = sorted(xrange(len(usages)), key=lambda k: usages[k])
+    return fit(order, usages, free_to_use)
+
+
+def knapsack(usages, free_to_use, resolution=KNAPSACK_RESOLUTION):
+    """
+    usages are rounded up to units of free_to_use / resolution, so the total
+    usage selected never exceeds free_to_use, at the cost of up to one unit
+    per GSM selected. What's lost to rounding is made up by filling the space
+    left with first fit, and the result of first_fit or first_fit_decreasing
+    is taken instead if it's still better
+    """
+    if free_to_use <= 0:
+        return []
+    unit = free_to_use / float(resolution)
+    capacity = resolution
+    weights = []
+    for usage in usages:
+        if usage > free_to_use:
+            # never fits
+            weights.append(capacity + 1)
+        else:
+            # min: guard against floating point errors when usage equals
+            # free_to_use
+            weights.append(min(int(math.ceil(usage / unit)), capacity))
+
+    # best[c]: the max total usage with total weight <= c, keep[k][c]: whether
+    # usages[k] is taken to reach best[c] after the first k + 1 usages
+    best = [0] * (capacity + 1)
+    keep = []
+    for usage, weight in zip(usages, weights):
+        taken = bytearray(capacity + 1)
+        for c in xrange(capacity, weight - 1, -1):
+            candidate = best[c - weight] + usage
+            if candidate > best[c]:
+                best[c] = candidate
+                taken[c] = 1
+        keep.append(taken)
+
+    selected = []
+    c = capacity
+    for k in xrange(len(usages) - 1, -1, -1):
+        if keep[k][c]:
+            selected.append(k)
+            c -= weights[k]
+    left = free_to_use - sum(usages[k] for k in selected)
+    taken = set(selected)
+    selected.extend(fit([k for k in xrange(len(usages)) if k not in taken],
+                        usages, left))
+
+    candidates = [selected, first_fit(usages, free_to_use),
+                  first_fit_decreasing(usages, free_to_use)]
+    # max returns the first of equally good ones
+    return max(candidates, key=lambda _: sum(usages[k] for k in _))
+
+
+STRATEGIES = {
+    'first_fit': first_fit,
+    'first_fit_decreasing': first_fit_decreasing,
+    'knapsack': knapsack,
+    'max_count': max_count,
+}
+
+
+def select(usages, free_to_use, strategy='first_fit'):
+    """
+    :param usages: estimated usages of GSMs
+    :param strategy: one of STRATEGIES
+    :returns: the indices of selected usages in ascending order
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(
+            'unknown GSM_SELECTION_STRATEGY: {0}, should be one of {1}'.format(
+                strategy, sorted(STRATEGIES)))
+    return sorted(STRATEGIES[strategy](usages, free_to_use))
@@ -0,0 +1,279 @@
+"""
+Estimate the usages of GSMs from the sizes observed for GSMs processed before,
+instead of the fixed SRA2FASTQ_SIZE_RATIO and FASTQ2RSEM_RATIO. The sizes of
+sra, fastq.gz files and rsem output of each GSM are recorded in an SQLite
+database under LOCAL_TOP_OUTDIR after sra2fastq and rsem finish, and ratios
+are fitted per species and per layout (single or paired), taking a
+conservative quantile of those observed. A ratio falls back to that of the
+species regardless of layout, then that of all GSMs, then the constant when
+there aren't enough observations.
+
+ratios:
+sra2fastq: size of fastq.gz files / size of sra files
+rsem: (size of fastq.gz files + size of rsem output) / size of fastq.gz files
+"""
+
+import os
+import re
+import time
+import math
+import sqlite3
+import logging
+logger = logging.getLogger(__name__)
+
+from rsempipeline.utils import sras_info_store as SIS
+from rsempipeline.conf.settings import (
+    SIZE_HISTORY_DB_BASENAME, RSEM_OUTPUT_DIR_RE)
+
+
+SINGLE, PAIRED = 'single', 'paired'
+
+
+class SizeEstimator(object):
+    """
+    sizes of GSMs, keyed by the GSM dir relative to top_outdir, e.g.
+    rsem_output/GSE1/homo_sapiens/GSM1
+    """
+    def __init__(self, db_file, top_outdir, quantile=0.9, min_samples=10):
+        """
+        :param quantile: the quantile of observed ratios to use, the higher
+                         the more conservative
+        :param min_samples: the min number of observations to fit a ratio
+        """
+        self.db_file = db_file
+        self.top_outdir = top_outdir
+        self.quantile = quantile
+        self.min_samples = min_samples
+        # key: GSM dir relative to top_outdir, value: a dict of species,
+        # layout, sra, fastq_gz and rsem
+        self.sizes = {}
+        # key: (kind, species, layout), value: (ratio, number of observations)
+        self.ratios = {}
+
+    def connect(self):
+        # tasks of different processes record sizes at the same time
+        conn = sqlite3.connect(self.db_file, timeout=60)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sizes ('
+            'gsm TEXT PRIMARY KEY, '
+            'species TEXT, '
+            'layout TEXT, '
+            'sra INTEGER, '
+            'fastq_gz INTEGER, '
+            'rsem INTEGER, '
+            'updated REAL NOT NULL)')
+        return conn
+
+    def load(self):
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                'SELECT gsm, species, layout, sra, fastq_gz, rsem FROM sizes')
+            self.sizes = dict(
+                (gsm, {'species': species, 'layout': layout, 'sra': sra,
+                       'fastq_gz': fastq_gz, 'rsem': rsem})
+                for gsm, species, layout, sra, fastq_gz, rsem in rows)
+        finally:
+            conn.close()
+        self.ratios = {}
+        logger.info('loaded sizes of {0} GSMs from {1}'.format(
+            len(self.sizes), self.db_file))
+        return self
+
+    def get_key(self, gsm_dir):
+        return os.path.relpath(gsm_dir, self.top_outdir)
+
+    def record(self, gsm_dir, **sizes):
+        """
+        :param sizes: any of layout, sra, fastq_gz and rsem, the others
+                      recorded before are kept
+        """
+        key = self.get_key(gsm_dir)
+        species = get_species(gsm_dir)
+        columns = sorted(sizes)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR IGNORE INTO sizes (gsm, species, updated) '
+                    'VALUES (?, ?, ?)', (key, species, time.time()))
+                conn.execute(
+                    'UPDATE sizes SET {0}, updated = ? WHERE gsm = ?'.format(
+                        ', '.join('{0} = ?'.format(_) for _ in columns)),
+                    [sizes[_] for _ in columns] + [time.time(), key])
+        finally:
+            conn.close()
+        self.sizes.setdefault(key, {'species': species}).update(sizes)
+        self.ratios = {}
+
+    def get_observations(self, kind, species=None, layout=None):
+        res = []
+        for item in self.sizes.values():
+            if species is not None and item.get('species') != species:
+                continue
+            if layout is not None and item.get('layout') != layout:
+                continue
+            sra, fastq_gz, rsem = [item.get(_) for _ in ['sra', 'fastq_gz', 'rsem']]
+            if kind == 'sra2fastq' and sra and fastq_gz:
+                res.append(fastq_gz / float(sra))
+            elif kind == 'rsem' and fastq_gz and rsem:
+                res.append((fastq_gz + rsem) / float(fastq_gz))
+        return res
+
+    def get_ratio(self, kind, species=None, layout=None):
+        """
+        :param kind: sra2fastq or rsem
+        :returns: the ratio fitted with the most specific group of GSMs that
+                  has enough observations, or None
+        """
+        groups = []
+        if species is not None:
+            if layout is not None:
+                groups.append((species, layout))
+            groups.append((species, None))
+        groups.append((None, None))
+        for group in groups:
+            key = (kind,) + group
+            if key not in self.ratios:
+                observations = self.get_observations(kind, *group)
+                self.ratios[key] = (quantile(observations, self.quantile)
+                                    if len(observations) >= self.min_samples
+                                    else None, len(observations))
+            ratio = self.ratios[key][0]
+            if ratio is not None:
+                return ratio
+        return None
+
+    def get_sra2fastq_ratio(self, gsm_dir):
+        """the layout is unknown before sra files are converted"""
+        return self.get_ratio('sra2fastq', get_species(gsm_dir))
+
+    def estimate_rsem_usage(self, gsm_dir):
+        """
+        :returns: the estimated usage of fastq.gz files and rsem output of
+                  a GSM whose fastq.gz files have been recorded, or None
+        """
+        item = self.sizes.get(self.get_key(gsm_dir))
+        if not item or not item.get('fastq_gz'):
+            return None
+        ratio = self.get_ratio('rsem', item.get('species'), item.get('layout'))
+        if ratio is None:
+            return None
+        return item['fastq_gz'] * ratio
+
+    def log_ratios(self):
+        for species in sorted(set(_.get('species') for _ in self.sizes.values())):
+            for kind in ['sra2fastq', 'rsem']:
+                for layout in [None, SINGLE, PAIRED]:
+                    n = len(self.get_observations(kind, species, layout))
+                    if n:
+                        logger.info('{0} ratio of {1} ({2}): {3} from {4} '
+                                    'GSMs'.format(
+                                        kind, species, layout or 'all',
+                                        self.get_ratio(kind, species, layout),
+                                        n))
+
+
+def quantile(values, q):
+    """the nearest-rank quantile, which is one of values"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(q * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def get_species(gsm_dir):
+    match = re.search(RSEM_OUTPUT_DIR_RE, gsm_dir)
+    return match.group('species') if match else None
+
+
+def scan_gsm_dir(gsm_dir):
+    """
+    :returns: a dict of the sizes of sra files, fastq.gz files and the
+              others (i.e. rsem output) in gsm_dir, the layout, the names of
+              COMPLETE flags directly under gsm_dir, and the sra files
+              replaced with empty placeholders relative to gsm_dir
+    """
+    res = {'sra': 0, 'num_sras': 0, 'fastq_gz': 0, 'rsem': 0,
+           'layout': SINGLE, 'flags': set(), 'placeholders': []}
+    for dirpath, _, filenames in os.walk(gsm_dir):
+        for name in filenames:
+            size = os.path.getsize(os.path.join(dirpath, name))
+            if name.endswith('.sra'):
+                res['sra'] += size
+                res['num_sras'] += 1
+                if size == 0:
+                    res['placeholders'].append(os.path.relpath(
+                        os.path.join(dirpath, name), gsm_dir))
+            elif name.endswith('.fastq.gz'):
+                res['fastq_gz'] += size
+                if name.endswith('_2.fastq.gz'):
+                    res['layout'] = PAIRED
+            elif name.endswith('.COMPLETE'):
+                if dirpath == gsm_dir:
+                    res['flags'].add(name)
+            else:
+                res['rsem'] += size
+    return res
+
+
+_estimator = None
+
+
+def init_estimator(db_file, top_outdir, quantile=0.9, min_samples=10):
+    global _estimator
+    _estimator = SizeEstimator(db_file, top_outdir, quantile, min_samples).load()
+    _estimator.log_ratios()
+    return _estimator
+
+
+def get_estimator():
+    return _estimator
+
+
+def get_sra2fastq_ratio(gsm_dir):
+    """None if there is no estimator or not enough history"""
+    if _estimator is None:
+        return None
+    return _estimator.get_sra2fastq_ratio(gsm_dir)
+
+
+def estimate_rsem_usage(gsm_dir):
+    """None if there is no estimator or not enough history"""
+    if _estimator is None:
+        return None
+    return _estimator.estimate_rsem_usage(gsm_dir)
+
+
+def record_sizes(top_outdir, gsm_dir):
+    """
+    record sizes of gsm_dir after a task finishes on it: those of sra and
+    fastq.gz files once all sra files are converted, and that of rsem output
+    once rsem is complete. A failure is only logged, since it only affects
+    the estimates
+    """
+    try:
+        scanned = scan_gsm_dir(gsm_dir)
+        sizes = {}
+        converted = [_ for _ in scanned['flags'] if _.endswith('.sra2fastq.COMPLETE')]
+        # sra and fastq.gz files are removed after rsem, when the flags
+        # outnumber the sra files
+        if scanned['num_sras'] and len(converted) == scanned['num_sras']:
+            sra = scanned['sra']
+            if scanned['placeholders']:
+                # sras converted when pipelined with download, their sizes are
+                # known from sras_info
+                expected = dict((k, d[k]['size'])
+                                for d in SIS.get_sras_info(gsm_dir) for k in d)
+                sra += sum(expected[_] for _ in scanned['placeholders'])
+            sizes.update(sra=sra, fastq_gz=scanned['fastq_gz'],
+                         layout=scanned['layout'])
+        if 'rsem.COMPLETE' in scanned['flags']:
+            sizes.update(rsem=scanned['rsem'])
+        if sizes:
+            estimator = SizeEstimator(
+                os.path.join(top_outdir, SIZE_HISTORY_DB_BASENAME), top_outdir)
+            estimator.record(gsm_dir, **sizes)
+    except (sqlite3.Error, EnvironmentError, KeyError) as err:
+        logger.warning('failed to record sizes of {0}: {1}'.format(gsm_dir, err))
@@ -0,0 +1,130 @@
+"""
+A persistent cache of parsed soft files. Soft files rarely change between runs
+of rp-run and rp-transfer, so the Series parsed from each of them is pickled
+under LOCAL_TOP_OUTDIR/soft_cache, and reused as long as the mtime, size (and
+optionally the md5 checksum) of the soft file remain the same
+"""
+
+import os
+import hashlib
+import cPickle as pickle
+import logging
+logger = logging.getLogger(__name__)
+
+from rsempipeline.parsers.soft_parser import parse
+
+# increment it whenever the structure of what's pickled changes, so that old
+# cache files are invalidated
+SOFT_CACHE_VERSION = 2
+
+
+def md5sum(path, block_size=2 ** 20):
+    """calculate the md5 checksum of a file by reading it in blocks"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as inf:
+        for block in iter(lambda: inf.read(block_size), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class SoftCache(object):
+    """
+    Cache of Series parsed from soft files, one pickle file per soft file
+    """
+    def __init__(self, cache_dir, check_hash=False, invalidate=False):
+        """
+        :param cache_dir: where the pickle files are saved, it's created lazily
+        :param check_hash: also compare md5 checksum of the soft file besides
+                           its mtime and size
+        :param invalidate: if True, ignore existing cache files and parse
+                           every soft file again
+        """
+        self.cache_dir = cache_dir
+        self.check_hash = check_hash
+        self.invalidate = invalidate
+
+    def get_cache_file(self, soft_file):
+        """
+        e.g. GSE43770_family.soft.subset.4a7d1ed4.pickle, the hash of the
+        absolute path avoids collisions between soft files with the same
+        basename in different directories
+        """
+        key = hashlib.md5(os.path.abspath(soft_file)).hexdigest()[:8]
+        return os.path.join(self.cache_dir, '{0}.{1}.pickle'.format(
+            os.path.basename(soft_file), key))
+
+    def gen_stamp(self, soft_file, interested_organisms):
+        """
+        generate the stamp used to validate a cache file, the interested
+        organisms are part of it because they affect the parsing results
+        """
+        stat = os.stat(soft_file)
+        stamp = {
+            'version': SOFT_CACHE_VERSION,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'interested_organisms': sorted(interested_organisms),
+        }
+        if self.check_hash:
+            stamp['md5'] = md5sum(soft_file)
+        return stamp
+
+    def load(self, soft_file, stamp):
+        """return the cached Series or None if the cache is not usable"""
+        cache_file = self.get_cache_file(soft_file)
+        if not os.path.exists(cache_file):
+            logger.info('soft cache miss for {0}: {1} doesn\'t exist'.format(
+                soft_file, cache_file))
+            return
+        try:
+            with open(cache_file, 'rb') as inf:
+                cached_stamp, series = pickle.load(inf)
+        except Exception as err:
+            logger.warning('soft cache miss for {0}: failed to load {1} '
+                           '({2})'.format(soft_file, cache_file, err))
+            return
+        if cached_stamp != stamp:
+            logger.info('soft cache miss for {0}: {1} is outdated'.format(
+                soft_file, cache_file))
+            return
+        logger.info('soft cache hit for {0}: {1}'.format(soft_file, cache_file))
+        return series
+
+    def dump(self, soft_file, stamp, series):
+        """
+        write the cache file, it's written to a temporary file first and then
+        renamed, so a concurrent reader never sees a partially written one
+        """
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            # could have been created by another process
+            if not os.path.isdir(self.cache_dir):
+                raise
+        cache_file = self.get_cache_file(soft_file)
+        tmp_file = '{0}.{1}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as opf:
+            pickle.dump((stamp, series), opf, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+        logger.debug('written soft cache {0}'.format(cache_file))
+
+    def parse(self, soft_file, interested_organisms):
+        """
+        the same as rsempipeline.parsers.soft_parser.parse, but reads from or
+        writes to the cache
+        """
+        stamp = self.gen_stamp(soft_file, interested_organisms)
+        if self.invalidate:
+            logger.info('soft cache invalidated for {0}'.format(soft_file))
+        else:
+            series = self.load(soft_file, stamp)
+            if series is not None:
+                return series
+        series = parse(soft_file, interested_organisms)
+        if series is not None:
+            try:
+                self.dump(soft_file, stamp, series)
+            except (IOError, OSError) as err:
+                logger.warning('failed to write soft cache for {0}: '
+                               '{1}'.format(soft_file, err))
+        return series
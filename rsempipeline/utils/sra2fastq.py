@@ -0,0 +1,119 @@
+"""
+utilities for the sra2fastq task
+
+When sra2fastq is pipelined with download (PIPELINE_SRA2FASTQ), each sra is
+converted by the download job right after it's downloaded, and then replaced
+with an empty placeholder. The placeholder keeps the mtime of the sra, so
+ruffus still finds the download task up to date, and the sra older than the
+outputs of sra2fastq.
+
+The conversion is done by one of SRA2FASTQ_BACKENDS, which can be chosen per
+host:
+
+fastq-dump: CMD_FASTQ_DUMP, which compresses with --gzip in a single thread
+fasterq-dump: CMD_FASTERQ_DUMP converts with multiple threads into
+              uncompressed fastq files, which are then compressed in parallel
+              by CMD_PIGZ
+"""
+
+import os
+import socket
+import logging
+logger = logging.getLogger(__name__)
+
+
+SRA2FASTQ_BACKENDS = ('fastq-dump', 'fasterq-dump')
+
+DEFAULT_CMD_FASTERQ_DUMP = (
+    'fasterq-dump --force --min-read-len 25 --split-files --threads {threads} '
+    '--temp {tmp_dir} --outdir {output_dir} {accession}')
+# -f overwrites fastq.gz left partially written by an interrupted run
+DEFAULT_CMD_PIGZ = 'pigz -f -p {threads} {fastqs}'
+# uncompressed fastq and the temporary files of fasterq-dump relative to the
+# size of the sra, on disk until pigz finishes
+DEFAULT_FASTERQ_DUMP_INTERMEDIATE_RATIO = 8
+
+
+def get_gsm_dir(sra):
+    """e.g. GSM dir/SRXxxxxxx/SRRxxxxxx/SRRxxxxxx.sra"""
+    return os.path.dirname(os.path.dirname(os.path.dirname(sra)))
+
+
+def get_flag_file(sra):
+    return os.path.join(get_gsm_dir(sra),
+                        '{0}.sra2fastq.COMPLETE'.format(os.path.basename(sra)))
+
+
+def is_placeholder(sra):
+    return os.path.getsize(sra) == 0
+
+
+def is_converted(sra, flag_file):
+    """whether sra has been converted and replaced with a placeholder"""
+    return os.path.exists(flag_file) and is_placeholder(sra)
+
+
+def replace_with_placeholder(sra):
+    """truncate sra to an empty file, keeping its mtime"""
+    st = os.stat(sra)
+    with open(sra, 'wb'):
+        pass
+    os.utime(sra, (st.st_atime, st.st_mtime))
+    logger.info('replaced {0} with a placeholder, {1} bytes freed'.format(
+        sra, st.st_size))
+
+
+def get_backend(backend, hostname=None):
+    """
+    :param backend: one of SRA2FASTQ_BACKENDS, or a dict of them keyed by
+                    hostname, with the key default for the other hosts
+    """
+    if isinstance(backend, dict):
+        if hostname is None:
+            hostname = socket.gethostname()
+        backend = backend.get(hostname, backend.get('default', 'fastq-dump'))
+    if backend not in SRA2FASTQ_BACKENDS:
+        raise ValueError('unknown SRA2FASTQ_BACKEND: {0}, should be one of '
+                         '{1}'.format(backend, SRA2FASTQ_BACKENDS))
+    return backend
+
+
+def get_intermediate_ratio(config):
+    """
+    the peak size of intermediate files of converting an sra relative to its
+    size by the backend chosen for this host, 0 for fastq-dump, which gzips
+    as it goes
+    """
+    backend = get_backend(config.get('SRA2FASTQ_BACKEND', 'fastq-dump'))
+    if backend == 'fastq-dump':
+        return 0
+    return config.get('FASTERQ_DUMP_INTERMEDIATE_RATIO',
+                      DEFAULT_FASTERQ_DUMP_INTERMEDIATE_RATIO)
+
+
+def gen_sra2fastq_cmd(sra, outdir, config):
+    """
+    :returns: the command converting sra into {run}_[12].fastq.gz in outdir
+              by the backend chosen for this host
+    """
+    backend = get_backend(config.get('SRA2FASTQ_BACKEND', 'fastq-dump'))
+    if backend == 'fastq-dump':
+        return config['CMD_FASTQ_DUMP'].format(output_dir=outdir, accession=sra)
+
+    threads = config.get('SRA2FASTQ_THREADS', 1)
+    run = os.path.splitext(os.path.basename(sra))[0]
+    prefix = os.path.join(outdir, run)
+    cmds = [
+        config.get('CMD_FASTERQ_DUMP', DEFAULT_CMD_FASTERQ_DUMP).format(
+            threads=threads, tmp_dir=os.path.dirname(sra), output_dir=outdir,
+            accession=sra),
+        # single-end reads are written to {run}.fastq, but named
+        # {run}_1.fastq.gz by fastq-dump --split-files, which is expected by
+        # the tasks after sra2fastq
+        'if [ -f {0}.fastq ]; then mv {0}.fastq {0}_1.fastq; fi'.format(prefix),
+        # fastq.gz left by a failed run, in case CMD_PIGZ doesn't overwrite
+        # them, so the command can be run again, e.g. by RETRY_POLICY
+        'rm -f {0}_1.fastq.gz {0}_2.fastq.gz'.format(prefix),
+        config.get('CMD_PIGZ', DEFAULT_CMD_PIGZ).format(
+            threads=threads, fastqs='{0}_[12].fastq'.format(prefix))]
+    return ' && '.join(cmds)
@@ -0,0 +1,343 @@
+"""
+A central store of sras_info, i.e. the names and sizes of the sra files to be
+downloaded for each GSM. It's an SQLite database under LOCAL_TOP_OUTDIR, which
+is read into memory once per process, so sras_info of a GSM is no longer
+loaded from its sras_info.yaml again and again. sras_info.yaml files that
+already exist are imported, and they're still written (exported) by default
+for compatibility.
+"""
+
+import os
+import time
+import sqlite3
+from collections import OrderedDict
+import logging
+logger = logging.getLogger(__name__)
+
+import yaml
+
+from rsempipeline.conf.settings import (
+    SRA_INFO_FILE_BASENAME, SRAS_INFO_CACHE_SIZE)
+
+
+class SrasInfoStore(object):
+    """
+    sras_info of all GSMs, keyed by the GSM dir relative to top_outdir,
+    e.g. rsem_output/GSE1/homo_sapiens/GSM1
+    """
+    def __init__(self, db_file, top_outdir, export_yaml=True):
+        """
+        :param export_yaml: also write sras_info.yaml to the GSM dir when
+                            sras_info of a GSM is put into the store
+        """
+        self.db_file = db_file
+        self.top_outdir = top_outdir
+        self.export_yaml = export_yaml
+        # key: GSM dir relative to top_outdir, value: sras_info in the same
+        # structure as that in sras_info.yaml, e.g.
+        # [{'SRX1/SRR1/SRR1.sra': {'size': 123, 'readable_size': '123.0 bytes'}}]
+        self.data = {}
+        # key: the same as data, value: (attempts, last_attempt), i.e. the
+        # number of failed attempts to fetch sras_info and the time of the
+        # last one
+        self.failures = {}
+        # number of lookups found or not found in the store
+        self.hits = 0
+        self.misses = 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=60)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS sras ('
+            'gsm TEXT NOT NULL, '
+            'idx INTEGER NOT NULL, '
+            'sra TEXT NOT NULL, '
+            'size INTEGER NOT NULL, '
+            'readable_size TEXT, '
+            'PRIMARY KEY (gsm, idx))')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS failures ('
+            'gsm TEXT PRIMARY KEY, '
+            'attempts INTEGER NOT NULL, '
+            'last_attempt REAL NOT NULL)')
+        return conn
+
+    def load(self):
+        """read the whole store into memory"""
+        data = {}
+        conn = self.connect()
+        try:
+            rows = conn.execute(
+                'SELECT gsm, sra, size, readable_size FROM sras '
+                'ORDER BY gsm, idx')
+            for gsm, sra, size, readable_size in rows:
+                data.setdefault(gsm, []).append(
+                    {str(sra): {'size': size,
+                                'readable_size': str(readable_size)}})
+            failures = dict(
+                (gsm, (attempts, last_attempt)) for gsm, attempts, last_attempt
+                in conn.execute('SELECT gsm, attempts, last_attempt FROM failures'))
+        finally:
+            conn.close()
+        self.data = data
+        self.failures = failures
+        logger.info('loaded sras_info of {0} GSMs from {1}'.format(
+            len(self.data), self.db_file))
+        return self
+
+    def get_key(self, gsm_dir):
+        return os.path.relpath(gsm_dir, self.top_outdir)
+
+    def has(self, gsm_dir):
+        return self.get_key(gsm_dir) in self.data
+
+    def get(self, gsm_dir):
+        """return sras_info of gsm_dir, or None if it's not in the store"""
+        res = self.data.get(self.get_key(gsm_dir))
+        if res is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return res
+
+    def put(self, gsm_dir, sras_info):
+        self.put_many([(gsm_dir, sras_info)])
+
+    def put_many(self, items):
+        """
+        :param items: a list of (gsm_dir, sras_info), written in a single
+                      transaction
+        """
+        conn = self.connect()
+        try:
+            with conn:
+                for gsm_dir, sras_info in items:
+                    key = self.get_key(gsm_dir)
+                    conn.execute('DELETE FROM sras WHERE gsm = ?', (key,))
+                    conn.execute('DELETE FROM failures WHERE gsm = ?', (key,))
+                    conn.executemany(
+                        'INSERT INTO sras VALUES (?, ?, ?, ?, ?)',
+                        [(key, k, sra, info['size'], info.get('readable_size'))
+                         for k, (sra, info) in enumerate(iter_sras(sras_info))])
+        finally:
+            conn.close()
+        for gsm_dir, sras_info in items:
+            self.data[self.get_key(gsm_dir)] = sras_info
+            self.failures.pop(self.get_key(gsm_dir), None)
+            if self.export_yaml:
+                self.export(gsm_dir)
+
+    def record_failures(self, gsm_dirs):
+        """record a failed attempt to fetch sras_info for each of gsm_dirs"""
+        now = time.time()
+        for gsm_dir in gsm_dirs:
+            key = self.get_key(gsm_dir)
+            attempts = self.failures.get(key, (0, None))[0] + 1
+            self.failures[key] = (attempts, now)
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO failures VALUES (?, ?, ?)',
+                    [(self.get_key(_),) + self.failures[self.get_key(_)]
+                     for _ in gsm_dirs])
+        finally:
+            conn.close()
+
+    def get_failures(self, gsm_dir):
+        """the number of failed attempts to fetch sras_info of gsm_dir"""
+        return self.failures.get(self.get_key(gsm_dir), (0, None))[0]
+
+    def get_retry_time(self, gsm_dir, backoff, max_backoff):
+        """
+        the time before which fetching sras_info of gsm_dir isn't attempted
+        again, i.e. backoff * 2 ** (attempts - 1) seconds up to max_backoff
+        after the last failed attempt, 0 if it has never failed
+        """
+        attempts, last_attempt = self.failures.get(
+            self.get_key(gsm_dir), (0, None))
+        if not attempts:
+            return 0
+        return last_attempt + min(backoff * 2 ** (attempts - 1), max_backoff)
+
+    def import_yaml(self, gsm_dirs):
+        """
+        import sras_info.yaml of GSMs that are not in the store yet
+
+        :param gsm_dirs: a list of GSM dirs, e.g. sample.outdir
+        """
+        items = []
+        for gsm_dir in gsm_dirs:
+            if self.has(gsm_dir):
+                continue
+            yml = os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME)
+            if os.path.exists(yml):
+                items.append((gsm_dir, read_yaml(yml)))
+        if items:
+            logger.info('importing {0} {1} files into {2}'.format(
+                len(items), SRA_INFO_FILE_BASENAME, self.db_file))
+            export_yaml, self.export_yaml = self.export_yaml, False
+            try:
+                self.put_many(items)
+            finally:
+                self.export_yaml = export_yaml
+        return len(items)
+
+    def export(self, gsm_dir):
+        """write sras_info of gsm_dir to its sras_info.yaml"""
+        write_yaml(self.data[self.get_key(gsm_dir)],
+                   os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME))
+
+
+class SrasInfoLoader(object):
+    """
+    A bounded LRU cache of parsed sras_info.yaml files keyed on path + mtime,
+    so the same sras_info.yaml isn't parsed again unless it's been modified
+    """
+    def __init__(self, maxsize=SRAS_INFO_CACHE_SIZE):
+        """
+        :param maxsize: the max number of parsed files to keep, 0 disables
+                        caching
+        """
+        self.maxsize = maxsize
+        # key: absolute path, value: (mtime, sras_info), ordered from the
+        # least to the most recently used
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, yml):
+        try:
+            mtime = os.path.getmtime(yml)
+        except OSError:
+            # leave it to read_yaml to raise the usual IOError
+            self.misses += 1
+            return read_yaml(yml)
+        key = os.path.abspath(yml)
+        cached = self.cache.pop(key, None)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            res = cached[1]
+        else:
+            self.misses += 1
+            res = read_yaml(yml)
+        if self.maxsize > 0:
+            while len(self.cache) >= self.maxsize:
+                self.cache.popitem(last=False)
+            self.cache[key] = (mtime, res)
+        return res
+
+    def clear(self):
+        self.cache.clear()
+
+
+def iter_sras(sras_info):
+    """
+    yield (sra, info) from sras_info, e.g.
+    ('SRX1/SRR1/SRR1.sra', {'size': 123, 'readable_size': '123.0 bytes'})
+    """
+    for dict_ in sras_info:
+        for sra, info in dict_.items():
+            yield sra, info
+
+
+def read_yaml(yml):
+    with open(yml) as inf:
+        return yaml.load(inf.read())
+
+
+def write_yaml(sras_info, yml):
+    """
+    written to a temporary file first and then renamed, so a partially
+    written sras_info.yaml is never left behind
+    """
+    tmp_yml = '{0}.{1}.tmp'.format(yml, os.getpid())
+    with open(tmp_yml, 'wb') as opf:
+        yaml.dump(sras_info, stream=opf, default_flow_style=False)
+    os.rename(tmp_yml, yml)
+
+
+# the store and loader used by the current process, initialized by init_store
+_store = None
+_loader = SrasInfoLoader()
+
+
+def init_store(db_file, top_outdir, export_yaml=True,
+               cache_size=SRAS_INFO_CACHE_SIZE):
+    """initialize the process-wide store and load it into memory"""
+    global _store, _loader
+    _store = SrasInfoStore(db_file, top_outdir, export_yaml).load()
+    _loader = SrasInfoLoader(cache_size)
+    return _store
+
+
+def get_store():
+    return _store
+
+
+def get_sras_info(gsm_dir):
+    """
+    get sras_info of a GSM from the store, or from its sras_info.yaml if the
+    store isn't initialized or the GSM isn't in the store
+    """
+    if _store is not None:
+        res = _store.get(gsm_dir)
+        if res is not None:
+            return res
+    return _loader.load(os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME))
+
+
+def has_sras_info(gsm_dir):
+    """check if sras_info of a GSM is available in the store or as yaml"""
+    if _store is not None and _store.has(gsm_dir):
+        return True
+    return os.path.exists(os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME))
+
+
+def record_fetch_failures(gsm_dirs):
+    """record failed attempts to fetch sras_info, if the store is initialized"""
+    if _store is not None and gsm_dirs:
+        _store.record_failures(gsm_dirs)
+
+
+def get_fetch_failures(gsm_dir):
+    """the number of failed attempts to fetch sras_info, 0 without the store"""
+    return _store.get_failures(gsm_dir) if _store is not None else 0
+
+
+def get_fetch_retry_time(gsm_dir, backoff, max_backoff):
+    """see SrasInfoStore.get_retry_time, 0 without the store"""
+    if _store is None:
+        return 0
+    return _store.get_retry_time(gsm_dir, backoff, max_backoff)
+
+
+def save_sras_info(gsm_dir, sras_info):
+    """save sras_info to the store if initialized, otherwise to yaml"""
+    if _store is not None:
+        _store.put(gsm_dir, sras_info)
+    else:
+        write_yaml(sras_info, os.path.join(gsm_dir, SRA_INFO_FILE_BASENAME))
+
+
+def get_stats():
+    """
+    counts of sras_info reads served by the store, by the yaml cache, and
+    parsed from sras_info.yaml
+    """
+    store_hits = _store.hits if _store is not None else 0
+    total = store_hits + _loader.hits + _loader.misses
+    return {
+        'store_hits': store_hits,
+        'cache_hits': _loader.hits,
+        'cache_misses': _loader.misses,
+        'total': total,
+        'hit_rate': (store_hits + _loader.hits) / float(total) if total else 0.,
+    }
+
+
+def log_stats():
+    logger.info(
+        'sras_info reads: {total} in total, {store_hits} from store, '
+        '{cache_hits} from cached sras_info.yaml, {cache_misses} parsed from '
+        'sras_info.yaml (hit rate: {hit_rate:.1%})'.format(**get_stats()))
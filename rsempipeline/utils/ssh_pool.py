@@ -0,0 +1,137 @@
+"""
+Reuse authenticated ssh connections within a process. A private key is only
+loaded from disk once, and a single paramiko.Transport is kept per (host,
+port, username), on which a new channel is opened for each command, so the
+key exchange and authentication are paid only once. Transports are kept
+alive with keepalive packets, and reconnected when found dead.
+"""
+
+import os
+import socket
+import atexit
+import threading
+import logging
+logger = logging.getLogger(__name__)
+
+import paramiko
+
+
+SSH_CONNECTION_ERRORS = (paramiko.SSHException, socket.error, EOFError)
+
+
+class SSHConnectionManager(object):
+    def __init__(self, timeout=75, keepalive=30, command_timeout=None):
+        """
+        :param timeout: seconds to wait for connecting, the banner and
+                        opening a channel
+        :param keepalive: seconds between keepalive packets, 0 disables them
+        :param command_timeout: seconds to wait for output of a command
+                                without receiving anything, None waits for
+                                ever
+        """
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.command_timeout = command_timeout
+        # key: path to the private key file, value: paramiko.RSAKey
+        self.keys = {}
+        # key: (host, port, username), value: paramiko.Transport
+        self.transports = {}
+        self.lock = threading.Lock()
+        # number of transports connected, for testing and logging
+        self.num_connections = 0
+
+    def get_key(self, private_key_file):
+        private_key_file = os.path.expanduser(private_key_file)
+        if private_key_file not in self.keys:
+            self.keys[private_key_file] = paramiko.RSAKey.from_private_key_file(
+                private_key_file)
+        return self.keys[private_key_file]
+
+    def connect(self, host, port, username, pkey):
+        sock = socket.create_connection((host, port), self.timeout)
+        transport = paramiko.Transport(sock)
+        transport.banner_timeout = self.timeout
+        try:
+            transport.connect(username=username, pkey=pkey)
+        except:
+            transport.close()
+            raise
+        if self.keepalive:
+            transport.set_keepalive(self.keepalive)
+        self.num_connections += 1
+        logger.debug('connected to {0}@{1}:{2}'.format(username, host, port))
+        return transport
+
+    def get_transport(self, host, username, private_key_file='~/.ssh/id_rsa',
+                      port=22):
+        """an active transport to host, connected if there isn't one"""
+        key = (host, port, username)
+        with self.lock:
+            transport = self.transports.get(key)
+            if transport is not None and transport.is_active():
+                return transport
+            if transport is not None:
+                logger.info('connection to {0}@{1}:{2} is dead, '
+                            'reconnecting'.format(username, host, port))
+                transport.close()
+            pkey = self.get_key(private_key_file)
+            transport = self.connect(host, port, username, pkey)
+            self.transports[key] = transport
+            return transport
+
+    def discard(self, host, username, port=22):
+        with self.lock:
+            transport = self.transports.pop((host, port, username), None)
+        if transport is not None:
+            transport.close()
+
+    def exec_command(self, cmd, host, username,
+                     private_key_file='~/.ssh/id_rsa', port=22):
+        """
+        execute cmd on a new channel of the transport to host
+
+        :returns: the lines of stdout
+        """
+        return list(self.iter_command(cmd, host, username, private_key_file,
+                                      port))
+
+    def iter_command(self, cmd, host, username,
+                     private_key_file='~/.ssh/id_rsa', port=22):
+        """
+        the same as exec_command, but yields lines of stdout as they're
+        received, so a long output doesn't have to be kept in memory
+        """
+        # a cached transport may have been dropped by the server without
+        # being noticed, in which case it's connected again once
+        for attempt in [1, 2]:
+            transport = self.get_transport(host, username, private_key_file, port)
+            try:
+                session = transport.open_session()
+                break
+            except SSH_CONNECTION_ERRORS as err:
+                self.discard(host, username, port)
+                if attempt == 2:
+                    raise
+                logger.info('failed to open a channel to {0}@{1}:{2} ({3}), '
+                            'reconnecting'.format(username, host, port, err))
+        try:
+            session.settimeout(self.command_timeout)
+            session.exec_command(cmd)
+            for line in session.makefile('rb', -1):
+                yield line
+        finally:
+            session.close()
+
+    def close(self):
+        with self.lock:
+            transports, self.transports = self.transports.values(), {}
+        for transport in transports:
+            transport.close()
+
+
+_manager = SSHConnectionManager()
+atexit.register(_manager.close)
+
+
+def get_manager():
+    return _manager
@@ -0,0 +1,66 @@
+"""
+An in-memory index of the files in the GSM directories of rsem_output, built
+with a single walk of the rsem_output hierarchy, so that the completion status
+of all GSMs (the existence of their COMPLETE flags and 0_submit.sh) can be
+answered without a stat call per flag, which is slow on NFS
+"""
+
+import os
+import time
+import re
+import logging
+logger = logging.getLogger(__name__)
+
+from rsempipeline.utils.misc import list_dir
+
+
+class StatusIndex(object):
+    """
+    The index of files directly under each GSM directory, the dir hierarchy
+    is <rsem_output>/<GSE>/<species>/<GSM>
+    """
+    def __init__(self, rsem_outdir):
+        self.rsem_outdir = rsem_outdir
+        # key: normalized absolute path to a GSM dir
+        # value: a frozenset of the names of files and dirs directly under it
+        self.gsm_files = {}
+
+    @staticmethod
+    def normalize(path):
+        return os.path.normpath(os.path.abspath(path))
+
+    def build(self):
+        """walk the rsem_output hierarchy once"""
+        bt = time.time()
+        self.gsm_files = {}
+        if not os.path.isdir(self.rsem_outdir):
+            logger.info('{0} doesn\'t exist, nothing to index'.format(
+                self.rsem_outdir))
+            return self
+        top = self.normalize(self.rsem_outdir)
+        for gse in list_dir(top)[0]:
+            if not re.search(r'^GSE\d+$', gse):
+                continue
+            gse_dir = os.path.join(top, gse)
+            for species in list_dir(gse_dir)[0]:
+                species_dir = os.path.join(gse_dir, species)
+                for gsm in list_dir(species_dir)[0]:
+                    if not re.search(r'^GSM\d+$', gsm):
+                        continue
+                    gsm_dir = os.path.join(species_dir, gsm)
+                    dirs, files = list_dir(gsm_dir)
+                    self.gsm_files[gsm_dir] = frozenset(dirs + files)
+        logger.info('indexed {0} GSM directories in {1} in {2:.2f}s'.format(
+            len(self.gsm_files), self.rsem_outdir, time.time() - bt))
+        return self
+
+    def exists(self, path):
+        """
+        equivalent to os.path.exists for a path directly under a GSM dir, for
+        any path not covered by the index, os.path.exists is called instead
+        """
+        gsm_dir, name = os.path.split(self.normalize(path))
+        files = self.gsm_files.get(gsm_dir)
+        if files is None:
+            return os.path.exists(path)
+        return name in files
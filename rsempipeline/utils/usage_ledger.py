@@ -0,0 +1,231 @@
+"""
+A ledger of the disk usage of each GSM dir under LOCAL_TOP_OUTDIR, kept in an
+SQLite database, so the usage of LOCAL_TOP_OUTDIR is the sum of the ledger
+instead of a walk of the whole tree in every run of rp-run. The usage of a GSM
+dir is measured again when a task (download, sra2fastq, rsem) finishes on it,
+or when it's marked dirty, e.g. after rp-transfer removes its fastq.gz and sra
+files. A full walk reconciles the ledger with what's on disk periodically
+(USAGE_LEDGER_RECONCILE_HOURS), which also measures the usage outside GSM
+dirs (logs, soft files, etc.)
+"""
+
+import os
+import re
+import time
+import sqlite3
+import logging
+logger = logging.getLogger(__name__)
+
+from rsempipeline.utils.misc import (
+    disk_used, get_usage, list_dir, pretty_usage)
+from rsempipeline.conf.settings import (
+    USAGE_LEDGER_DB_BASENAME, RSEM_OUTPUT_BASENAME)
+
+
+# the key in the meta table for when the ledger was last reconciled and the
+# usage outside GSM dirs at that time
+RECONCILED_KEY = 'reconciled'
+OTHER_USAGE_KEY = 'other_usage'
+
+
+class UsageLedger(object):
+    """
+    usages of GSM dirs, keyed by the GSM dir relative to top_outdir, e.g.
+    rsem_output/GSE1/homo_sapiens/GSM1
+    """
+    def __init__(self, db_file, top_outdir, reconcile_interval=24 * 3600):
+        """
+        :param reconcile_interval: the max number of seconds between full
+                                   walks, 0 means a full walk every time
+        """
+        self.db_file = db_file
+        self.top_outdir = top_outdir
+        self.reconcile_interval = reconcile_interval
+
+    def connect(self):
+        # tasks of different processes update the ledger at the same time
+        conn = sqlite3.connect(self.db_file, timeout=60)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS usages ('
+            'gsm TEXT PRIMARY KEY, '
+            'usage INTEGER NOT NULL, '
+            'measured REAL NOT NULL, '
+            'dirty INTEGER NOT NULL DEFAULT 0)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS meta ('
+            'key TEXT PRIMARY KEY, '
+            'value REAL NOT NULL)')
+        return conn
+
+    def get_key(self, gsm_dir):
+        return os.path.relpath(gsm_dir, self.top_outdir)
+
+    def update(self, gsm_dirs, num_threads=1):
+        """measure the usages of gsm_dirs again, 0 if removed"""
+        items = []
+        for gsm_dir in gsm_dirs:
+            now = time.time()
+            usage = disk_used(gsm_dir, num_threads) if os.path.exists(gsm_dir) else 0
+            items.append((self.get_key(gsm_dir), usage, now))
+        conn = self.connect()
+        try:
+            with conn:
+                for key, usage, now in items:
+                    # only overwrite an older measurement, another process
+                    # may have measured it later than this one
+                    conn.execute(
+                        'UPDATE usages SET usage = ?, measured = ?, dirty = 0 '
+                        'WHERE gsm = ? AND measured <= ?',
+                        (usage, now, key, now))
+                    conn.execute(
+                        'INSERT OR IGNORE INTO usages VALUES (?, ?, ?, 0)',
+                        (key, usage, now))
+        finally:
+            conn.close()
+
+    def mark_dirty(self, gsm_dirs):
+        """usages of gsm_dirs are to be measured again when next needed"""
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'UPDATE usages SET dirty = 1 WHERE gsm = ?',
+                    [(self.get_key(_),) for _ in gsm_dirs])
+        finally:
+            conn.close()
+
+    def get_own_usage(self):
+        """
+        the usage of the ledger itself, which changes as it's written, so
+        it's always measured instead of kept in the ledger
+        """
+        res = 0
+        for path in [self.db_file, self.db_file + '-journal']:
+            try:
+                res += get_usage(os.lstat(path))
+            except OSError:
+                pass
+        return res
+
+    def get_meta(self, conn, key, default=None):
+        row = conn.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def is_reconcile_due(self, now=None):
+        if now is None:
+            now = time.time()
+        conn = self.connect()
+        try:
+            reconciled = self.get_meta(conn, RECONCILED_KEY)
+        finally:
+            conn.close()
+        return reconciled is None or now - reconciled >= self.reconcile_interval
+
+    def reconcile(self, num_threads=1):
+        """
+        replace the ledger with the usages of all GSM dirs on disk, and
+        record the usage outside them
+
+        :returns: the usage of top_outdir
+        """
+        bt = time.time()
+        total = disk_used(self.top_outdir, num_threads)
+        # measured before it's written again
+        own_usage = self.get_own_usage()
+        gsm_dirs = find_gsm_dirs(os.path.join(self.top_outdir, RSEM_OUTPUT_BASENAME))
+        usages = [(self.get_key(_), disk_used(_, num_threads), bt) for _ in gsm_dirs]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM usages')
+                other = total - sum(_[1] for _ in usages) - own_usage
+                conn.executemany(
+                    'INSERT INTO usages VALUES (?, ?, ?, 0)', usages)
+                conn.executemany(
+                    'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    [(RECONCILED_KEY, bt), (OTHER_USAGE_KEY, other)])
+        finally:
+            conn.close()
+        logger.info('reconciled usages of {0} GSM dirs in {1} with a full '
+                    'walk in {2:.2f}s: {3}'.format(
+                        len(usages), self.top_outdir, time.time() - bt,
+                        pretty_usage(total)))
+        return total
+
+    def get_total(self, gsm_dirs=(), num_threads=1, now=None):
+        """
+        the usage of top_outdir, with a full walk if the reconciliation is
+        due, otherwise by measuring only dirty GSM dirs and those of gsm_dirs
+        that are not in the ledger yet
+
+        :param gsm_dirs: GSM dirs that are expected to be in the ledger,
+                         e.g. sample.outdir of all samples
+        """
+        if self.is_reconcile_due(now):
+            return self.reconcile(num_threads)
+        conn = self.connect()
+        try:
+            known = set(_[0] for _ in conn.execute('SELECT gsm FROM usages'))
+            dirty = [_[0] for _ in conn.execute(
+                'SELECT gsm FROM usages WHERE dirty = 1')]
+        finally:
+            conn.close()
+        to_update = [os.path.join(self.top_outdir, _) for _ in dirty]
+        to_update.extend(_ for _ in gsm_dirs if self.get_key(_) not in known)
+        if to_update:
+            self.update(to_update, num_threads)
+        conn = self.connect()
+        try:
+            total = conn.execute('SELECT SUM(usage) FROM usages').fetchone()[0] or 0
+            total += self.get_meta(conn, OTHER_USAGE_KEY, 0)
+        finally:
+            conn.close()
+        total += self.get_own_usage()
+        logger.info('measured usages of {0} changed GSM dirs, {1} in total '
+                    'according to the ledger'.format(
+                        len(to_update), pretty_usage(total)))
+        return int(total)
+
+
+def find_gsm_dirs(rsem_outdir):
+    """GSM dirs in the hierarchy of <rsem_output>/<GSE>/<species>/<GSM>"""
+    res = []
+    if not os.path.isdir(rsem_outdir):
+        return res
+    for gse in list_dir(rsem_outdir)[0]:
+        if not re.search(r'^GSE\d+$', gse):
+            continue
+        gse_dir = os.path.join(rsem_outdir, gse)
+        for species in list_dir(gse_dir)[0]:
+            species_dir = os.path.join(gse_dir, species)
+            for gsm in list_dir(species_dir)[0]:
+                if re.search(r'^GSM\d+$', gsm):
+                    res.append(os.path.join(species_dir, gsm))
+    return res
+
+
+def get_ledger(top_outdir, reconcile_interval=24 * 3600):
+    return UsageLedger(os.path.join(top_outdir, USAGE_LEDGER_DB_BASENAME),
+                       top_outdir, reconcile_interval)
+
+
+def update_usage(top_outdir, gsm_dir):
+    """
+    measure the usage of gsm_dir again after a task finishes on it, a
+    failure is only logged, since the ledger is reconciled periodically anyway
+    """
+    try:
+        get_ledger(top_outdir).update([gsm_dir])
+    except (sqlite3.Error, OSError) as err:
+        logger.warning('failed to update the usage of {0} in the ledger: '
+                       '{1}'.format(gsm_dir, err))
+
+
+def mark_dirty(top_outdir, gsm_dirs):
+    """the same as update_usage, but only marks gsm_dirs to be measured"""
+    try:
+        get_ledger(top_outdir).mark_dirty(gsm_dirs)
+    except sqlite3.Error as err:
+        logger.warning('failed to mark usages of {0} GSM dirs dirty in the '
+                       'ledger: {1}'.format(len(gsm_dirs), err))
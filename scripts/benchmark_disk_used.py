@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare disk_used, which is how rp-run gets the usage of LOCAL_TOP_OUTDIR,
+with different numbers of threads (DISK_USED_THREADS) against the os.walk
+implementation it replaced and du -s, on an existing directory or a synthetic
+GSE/GSM tree. Results in bytes should agree with du -s -B1 (GNU du), while
+the old implementation reports the apparent size instead.
+
+example run of this script:
+python benchmark_disk_used.py --dir /path/to/batchx --threads 1 4 16
+python benchmark_disk_used.py --gses 50 --gsms 20 --files 10
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+from rsempipeline.utils.misc import disk_used, pretty_usage
+
+
+def walk_disk_used(dir):
+    """the implementation before scandir and threads"""
+    total_size = 0
+    for dirpath, _, filenames in os.walk(dir):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            total_size += os.path.getsize(fp)
+    return total_size
+
+
+def du(dir):
+    try:
+        output = subprocess.check_output(['du', '-s', '-B1', dir])
+        return int(output.split('\t')[0])
+    except (OSError, subprocess.CalledProcessError):
+        # e.g. -B isn't supported by BSD du
+        output = subprocess.check_output(['du', '-s', '-k', dir])
+        return int(output.split('\t')[0]) * 1024
+
+
+def gen_tree(root, num_gses, num_gsms, num_files):
+    """in the layout of rsem_output/GSExxx/species/GSMxxx"""
+    for i in xrange(num_gses):
+        for j in xrange(num_gsms):
+            outdir = os.path.join(root, 'rsem_output', 'GSE{0}'.format(i),
+                                  'homo_sapiens', 'GSM{0}{1:03d}'.format(i, j))
+            os.makedirs(outdir)
+            for k in xrange(num_files):
+                with open(os.path.join(outdir, '{0}.txt'.format(k)), 'wb') as opf:
+                    opf.write('x' * (k + 1) * 1000)
+
+
+def timeit(func, *args, **kwargs):
+    bt = time.time()
+    res = func(*args, **kwargs)
+    return time.time() - bt, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dir', help='an existing directory to measure, '
+                        'a synthetic tree is generated if not specified')
+    parser.add_argument('--gses', type=int, default=20)
+    parser.add_argument('--gsms', type=int, default=20)
+    parser.add_argument('--files', type=int, default=10,
+                        help='number of files per GSM')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    args = parser.parse_args()
+
+    root = None
+    if args.dir:
+        dir = args.dir
+    else:
+        root = dir = tempfile.mkdtemp()
+        gen_tree(root, args.gses, args.gsms, args.files)
+    try:
+        print '{0:16s} {1:>9s} {2:>16s} {3:>10s}'.format(
+            'method', 'time (s)', 'bytes', 'pretty')
+        runs = [('du -s', du, {}), ('os.walk (old)', walk_disk_used, {})]
+        runs.extend(('{0} thread(s)'.format(_), disk_used, {'num_threads': _})
+                    for _ in args.threads)
+        for name, func, kwargs in runs:
+            et, res = timeit(func, dir, **kwargs)
+            print '{0:16s} {1:9.3f} {2:16d} {3:>10s}'.format(
+                name, et, res, pretty_usage(res))
+    finally:
+        if root is not None:
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
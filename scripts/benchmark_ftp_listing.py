@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the FTP listing methods (FTP_LISTING) used to fetch sras_info, by the
+number of FTP commands (round-trips) per sample and the time taken, against a
+local FTP server that serves a synthetic SRX/SRR/sra tree. It requires
+pyftpdlib (pip install pyftpdlib), which is only needed by this script.
+
+example run of this script:
+python benchmark_ftp_listing.py -n 200 --srrs 3 --rtt 20
+"""
+
+import os
+import time
+import shutil
+import ftplib
+import tempfile
+import argparse
+import threading
+import logging
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+
+from rsempipeline.utils import pre_pipeline_run as PPR
+from rsempipeline.utils.ftp_listing import LISTING_METHODS
+
+
+SRX_PARENT_DIR = 'sra/sra-instant/reads/ByExp/sra/SRX/SRX029'
+
+
+class CountingFTP(ftplib.FTP):
+    """counts commands sent, and optionally waits rtt seconds for each to
+    simulate a remote server"""
+    rtt = 0
+
+    def __init__(self, *args, **kwargs):
+        self.num_commands = 0
+        ftplib.FTP.__init__(self, *args, **kwargs)
+
+    def putcmd(self, line):
+        self.num_commands += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+        ftplib.FTP.putcmd(self, line)
+
+
+def gen_tree(root, num_samples, num_srrs):
+    """sra files are sparse, so they take no space"""
+    srxs = []
+    for i in xrange(num_samples):
+        srx = 'SRX{0:06d}'.format(29000 + i)
+        for j in xrange(num_srrs):
+            srr = 'SRR{0:06d}{1}'.format(29000 + i, j)
+            srr_dir = os.path.join(root, SRX_PARENT_DIR, srx, srr)
+            os.makedirs(srr_dir)
+            with open(os.path.join(srr_dir, srr + '.sra'), 'wb') as opf:
+                opf.truncate(1024 ** 2 * (i + j + 1))
+        srxs.append(srx)
+    return srxs
+
+
+def start_server(root):
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(root)
+    class Handler(FTPHandler):
+        pass
+    Handler.authorizer = authorizer
+    server = FTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs={'handle_exit': False})
+    thread.daemon = True
+    thread.start()
+    return server, server.socket.getsockname()[1]
+
+
+def run(port, srxs, listing):
+    ftp_handler = CountingFTP()
+    ftp_handler.connect('127.0.0.1', port)
+    ftp_handler.login()
+    ftp_handler.num_commands = 0
+    bt = time.time()
+    results = []
+    for srx in srxs:
+        url = 'ftp://127.0.0.1/{0}/{1}'.format(SRX_PARENT_DIR, srx)
+        results.append(PPR.fetch_sras_info_per(url, ftp_handler, listing))
+    et = time.time() - bt
+    num_commands = ftp_handler.num_commands
+    ftp_handler.quit()
+    return et, num_commands, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num_samples', type=int, default=200)
+    parser.add_argument('--srrs', type=int, default=3,
+                        help='number of SRRs (i.e. sra files) per sample')
+    parser.add_argument('--rtt', type=float, default=0,
+                        help='simulated round-trip time in ms per command')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    CountingFTP.rtt = args.rtt / 1000.
+
+    root = tempfile.mkdtemp()
+    try:
+        srxs = gen_tree(root, args.num_samples, args.srrs)
+        server, port = start_server(root)
+        expected = None
+        print '{0} samples, {1} sra files per sample, rtt {2} ms'.format(
+            args.num_samples, args.srrs, args.rtt)
+        for listing in LISTING_METHODS:
+            et, num_commands, results = run(port, srxs, listing)
+            if expected is None:
+                expected = results
+            assert results == expected, listing
+            print '{0:5s}: {1:6.2f} commands/sample {2:8.3f}s'.format(
+                listing, float(num_commands) / args.num_samples, et)
+        server.close_all()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
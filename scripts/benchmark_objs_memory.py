@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the memory used by a large synthetic cohort of Series/Sample objects
+between the dict-based implementation used before (kept as LegacySeries and
+LegacySample below) and rsempipeline.utils.objs. Each implementation is
+measured in a separate process by the increase of its peak RSS.
+
+example run of this script:
+python benchmark_objs_memory.py --num-series 2000 --samples-per-series 50
+"""
+
+import resource
+import argparse
+import multiprocessing
+
+from rsempipeline.utils.objs import Series, Sample
+
+
+class LegacySeries(object):
+    def __init__(self, name, soft_file=''):
+        self.name = name
+        self.passed_samples = []
+        self.samples = []
+        self.soft_file = soft_file
+
+    def add_sample(self, sample):
+        self.samples.append(sample)
+
+    def add_passed_sample(self, sample):
+        self.add_sample(sample)
+        self.passed_samples.append(sample)
+
+
+class LegacySample(object):
+    def __init__(self, name, series, index=0, organism=None, url=None):
+        self.name = name
+        self.series = series
+        self.index = index
+        self.organism = organism
+        self.url = url
+        self.outdir = None
+
+
+def build_cohort(series_cls, sample_cls, num_series, samples_per_series):
+    organisms = ['Homo sapiens', 'Mus musculus', 'Rattus norvegicus']
+    cohort = []
+    for i in xrange(num_series):
+        series = series_cls('GSE{0}'.format(i),
+                            '/path/to/GSE{0}_family.soft.subset'.format(i))
+        for j in xrange(samples_per_series):
+            k = i * samples_per_series + j
+            # organisms are built from pieces, as they'd be when read from
+            # soft files, so they are distinct string objects
+            organism = ''.join(list(organisms[k % len(organisms)]))
+            sample = sample_cls(
+                'GSM{0}'.format(k), series, index=j + 1, organism=organism,
+                url=('ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/'
+                     'ByExp/sra/SRX/SRX{0:03d}/SRX{1:06d}'.format(k % 1000, k)))
+            sample.outdir = '/path/to/rsem_output/GSE{0}/{1}/GSM{2}'.format(
+                i, organism.lower().replace(' ', '_'), k)
+            series.add_passed_sample(sample)
+        cohort.append(series)
+    return cohort
+
+
+def max_rss():
+    """peak resident set size in bytes (ru_maxrss is in KB on Linux)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(queue, series_cls, sample_cls, num_series, samples_per_series):
+    before = max_rss()
+    cohort = build_cohort(series_cls, sample_cls, num_series, samples_per_series)
+    queue.put(max_rss() - before)
+    del cohort
+
+
+def run(series_cls, sample_cls, num_series, samples_per_series):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=measure,
+        args=(queue, series_cls, sample_cls, num_series, samples_per_series))
+    proc.start()
+    res = queue.get()
+    proc.join()
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-series', type=int, default=2000)
+    parser.add_argument('--samples-per-series', type=int, default=50)
+    args = parser.parse_args()
+
+    num_samples = args.num_series * args.samples_per_series
+    print 'cohort: {0} series, {1} samples'.format(args.num_series, num_samples)
+    legacy = run(LegacySeries, LegacySample,
+                 args.num_series, args.samples_per_series)
+    new = run(Series, Sample, args.num_series, args.samples_per_series)
+    mb = 1024. ** 2
+    print 'dict-based objects:  {0:8.1f} MB ({1:.0f} bytes/sample)'.format(
+        legacy / mb, float(legacy) / num_samples)
+    print '__slots__ objects:   {0:8.1f} MB ({1:.0f} bytes/sample)'.format(
+        new / mb, float(new) / num_samples)
+    print 'saved:               {0:8.1f}%'.format(
+        (1 - float(new) / legacy) * 100)
+
+
+if __name__ == '__main__':
+    main()
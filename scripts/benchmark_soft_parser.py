@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the speed of the line-by-line soft parser used before (kept as
+legacy_parse below) with rsempipeline.parsers.soft_parser.parse on a large
+synthetic _family.soft file
+
+example run of this script:
+python benchmark_soft_parser.py -n 5000 --table-rows 20
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import logging
+
+from rsempipeline.parsers import soft_parser
+from rsempipeline.utils.objs import Series, Sample
+
+
+SAMPLE_TEMPLATE = """^SAMPLE = GSM{gsm}
+!Sample_title = sample {gsm}
+!Sample_geo_accession = GSM{gsm}
+!Sample_status = Public on Jan 01 2014
+!Sample_type = SRA
+!Sample_source_name_ch1 = some tissue
+!Sample_organism_ch1 = {organism}
+!Sample_characteristics_ch1 = tissue: liver
+!Sample_characteristics_ch1 = age: 10 weeks
+!Sample_molecule_ch1 = total RNA
+!Sample_extract_protocol_ch1 = some protocol
+!Sample_taxid_ch1 = 9606
+!Sample_description = some description
+!Sample_data_processing = some processing
+!Sample_platform_id = GPL11154
+!Sample_instrument_model = Illumina HiSeq 2000
+!Sample_library_selection = cDNA
+!Sample_library_source = transcriptomic
+!Sample_library_strategy = RNA-Seq
+!Sample_supplementary_file_1 = ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX{srx3}/SRX{srx}
+"""
+
+
+def gen_soft(soft_file, num_samples, table_rows):
+    organisms = ['Homo sapiens', 'Mus musculus', 'Danio rerio']
+    with open(soft_file, 'wb') as opf:
+        opf.write('^SERIES = GSE99999\n')
+        for k in xrange(num_samples):
+            opf.write('!Series_sample_id = GSM{0}\n'.format(k))
+        for k in xrange(num_samples):
+            srx = '{0:06d}'.format(k)
+            opf.write(SAMPLE_TEMPLATE.format(
+                gsm=k, organism=organisms[k % len(organisms)],
+                srx3=srx[:3], srx=srx))
+            # a full soft file would contain lines like these, which would
+            # break legacy_parse, so they're written as label = value
+            for i in xrange(table_rows):
+                opf.write('!Sample_data_row = {0}\t{1}\n'.format(i, i * 0.5))
+
+
+def legacy_parse(soft_file, interested_organisms):
+    """the implementation of soft_parser.parse before the SoftParser"""
+    index, series, current_sample = 1, None, None
+    with open(soft_file, 'rb') as inf:
+        for line in inf:
+            label, value = [__.strip() for __ in line.split('=')]
+            if label == '^SERIES':
+                series = Series(value, os.path.abspath(soft_file))
+            elif label == '^SAMPLE':
+                index = soft_parser.add(current_sample, series, index)
+                current_sample = Sample(name=value, series=series)
+
+            if current_sample:
+                current_sample = soft_parser.update(
+                    current_sample, label, value, interested_organisms)
+        if series is not None:
+            soft_parser.add(current_sample, series, index)
+            return series
+
+
+def time_it(func, repeat, *args):
+    best = None
+    for _ in xrange(repeat):
+        bt = time.time()
+        res = func(*args)
+        et = time.time() - bt
+        best = et if best is None else min(best, et)
+    return best, res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--num_samples', type=int, default=5000)
+    parser.add_argument('--table-rows', type=int, default=20,
+                        help='number of extra uninteresting lines per sample')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # silence per-sample debug logging
+    logging.getLogger(soft_parser.__name__).setLevel(logging.WARNING)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        soft_file = os.path.join(tmp_dir, 'GSE99999_family.soft')
+        gen_soft(soft_file, args.num_samples, args.table_rows)
+        print 'soft file size: {0:.1f} MB'.format(
+            os.path.getsize(soft_file) / 1024. ** 2)
+        organisms = ['Homo sapiens', 'Mus musculus']
+        t_legacy, s_legacy = time_it(
+            legacy_parse, args.repeat, soft_file, organisms)
+        t_new, s_new = time_it(
+            soft_parser.parse, args.repeat, soft_file, organisms)
+        assert ([_.name for _ in s_legacy.passed_samples] ==
+                [_.name for _ in s_new.passed_samples])
+        print 'legacy parser: {0:.3f}s'.format(t_legacy)
+        print 'SoftParser:    {0:.3f}s'.format(t_new)
+        print 'speedup:       {0:.2f}x'.format(t_legacy / t_new)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
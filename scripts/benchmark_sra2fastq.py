@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Time each SRA2FASTQ_BACKEND converting the same sra with the commands rp-run
+would run (CMD_FASTQ_DUMP, and CMD_FASTERQ_DUMP + CMD_PIGZ with different
+SRA2FASTQ_THREADS). With --sra, the real fastq-dump and fasterq-dump are
+required. Without --sra, a stand-in sra of synthetic reads is generated,
+which the real converters can't read, so fake ones are always used, which
+treat the stand-in as uncompressed paired-end fastq: fastq-dump gzips it in a
+single thread, and fasterq-dump copies it. pigz is faked only if it isn't
+installed, by running gzip on files in parallel (i.e. up to 2 for
+paired-end), so only the compression part is compared then.
+
+example run of this script:
+python benchmark_sra2fastq.py --reads 2000000 --threads 1 4 8
+python benchmark_sra2fastq.py --sra /path/to/SRR1557065.sra --threads 4 16
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import subprocess
+from distutils.spawn import find_executable
+
+from rsempipeline.utils import sra2fastq as S2F
+from rsempipeline.utils.misc import pretty_usage
+
+
+CMD_FASTQ_DUMP = ('fastq-dump --minReadLen 25 --gzip --split-files '
+                  '--outdir {output_dir} {accession}')
+
+# both fake converters split reads of the stand-in alternately into
+# {run}_1 and {run}_2 as if they're paired
+FAKE_FASTQ_DUMP = """#!{python}
+import os, sys, gzip
+args = sys.argv[1:]
+outdir, sra = args[args.index('--outdir') + 1], args[-1]
+run = os.path.splitext(os.path.basename(sra))[0]
+opfs = [gzip.open(os.path.join(outdir, '{{0}}_{{1}}.fastq.gz'.format(run, _)), 'wb')
+        for _ in [1, 2]]
+with open(sra, 'rb') as inf:
+    for k, line in enumerate(inf):
+        opfs[k // 4 % 2].write(line)
+for _ in opfs:
+    _.close()
+"""
+
+FAKE_FASTERQ_DUMP = """#!{python}
+import os, sys
+args = sys.argv[1:]
+outdir, sra = args[args.index('--outdir') + 1], args[-1]
+run = os.path.splitext(os.path.basename(sra))[0]
+opfs = [open(os.path.join(outdir, '{{0}}_{{1}}.fastq'.format(run, _)), 'wb')
+        for _ in [1, 2]]
+with open(sra, 'rb') as inf:
+    for k, line in enumerate(inf):
+        opfs[k // 4 % 2].write(line)
+for _ in opfs:
+    _.close()
+"""
+
+FAKE_PIGZ = """#!/bin/bash
+force=
+threads=1
+while getopts fp: opt; do
+    case $opt in
+        f) force=-f ;;
+        p) threads=$OPTARG ;;
+    esac
+done
+shift $((OPTIND - 1))
+printf '%s\\n' "$@" | xargs -P ${threads} -n 1 gzip ${force}
+"""
+
+
+def gen_stand_in(sra, num_reads, read_len=100):
+    """reads in fastq format, which the fake converters take as an sra"""
+    random.seed(0)
+    with open(sra, 'wb') as opf:
+        for k in xrange(num_reads):
+            seq = ''.join(random.choice('ACGT') for _ in xrange(read_len))
+            opf.write('@read{0}\n{1}\n+\n{2}\n'.format(k, seq, 'I' * read_len))
+
+
+CONVERTERS = ('fastq-dump', 'fasterq-dump')
+
+
+def install_fakes(bin_dir, converters=True):
+    """
+    fake pigz if it isn't installed, and the converters if converters is
+    True, returns the names of the faked tools
+    """
+    fakes = []
+    for name, content in [('fastq-dump', FAKE_FASTQ_DUMP),
+                          ('fasterq-dump', FAKE_FASTERQ_DUMP),
+                          ('pigz', FAKE_PIGZ)]:
+        if name in CONVERTERS and not converters:
+            continue
+        if name not in CONVERTERS and find_executable(name):
+            continue
+        path = os.path.join(bin_dir, name)
+        with open(path, 'wb') as opf:
+            opf.write(content.format(python=sys.executable) if '{python}' in content
+                      else content)
+        os.chmod(path, 0o755)
+        fakes.append(name)
+    return fakes
+
+
+def run(sra, outdir, config, env):
+    """:returns: the time taken and the total size of fastq.gz files"""
+    cmd = S2F.gen_sra2fastq_cmd(sra, outdir, config)
+    bt = time.time()
+    subprocess.check_call(cmd, shell=True, executable='/bin/bash', env=env)
+    et = time.time() - bt
+    size = sum(os.path.getsize(os.path.join(outdir, _))
+               for _ in os.listdir(outdir) if _.endswith('.fastq.gz'))
+    return et, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sra', help='an sra file to convert, a stand-in is '
+                        'generated if not specified')
+    parser.add_argument('--reads', type=int, default=500000,
+                        help='number of reads in the stand-in sra')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8],
+                        help='SRA2FASTQ_THREADS for fasterq-dump')
+    args = parser.parse_args()
+    if args.sra:
+        missing = [_ for _ in CONVERTERS if not find_executable(_)]
+        if missing:
+            parser.error('--sra requires the real converters, not installed: '
+                         '{0}'.format(', '.join(missing)))
+
+    root = tempfile.mkdtemp()
+    try:
+        bin_dir = os.path.join(root, 'bin')
+        os.mkdir(bin_dir)
+        fakes = install_fakes(bin_dir, converters=not args.sra)
+        if fakes:
+            print 'faked: {0}'.format(', '.join(fakes))
+        env = dict(os.environ, PATH='{0}:{1}'.format(bin_dir, os.environ['PATH']))
+
+        sra = os.path.join(root, 'SRX1', 'SRR1', 'SRR1.sra')
+        os.makedirs(os.path.dirname(sra))
+        if args.sra:
+            shutil.copy(args.sra, sra)
+        else:
+            gen_stand_in(sra, args.reads)
+        print 'sra: {0}'.format(pretty_usage(os.path.getsize(sra)))
+
+        runs = [('fastq-dump', {'SRA2FASTQ_BACKEND': 'fastq-dump'})]
+        runs.extend(('fasterq-dump, {0} thread(s)'.format(_),
+                     {'SRA2FASTQ_BACKEND': 'fasterq-dump', 'SRA2FASTQ_THREADS': _})
+                    for _ in args.threads)
+        print '{0:28s} {1:>9s} {2:>10s}'.format('backend', 'time (s)', 'fastq.gz')
+        for name, config in runs:
+            config['CMD_FASTQ_DUMP'] = CMD_FASTQ_DUMP
+            outdir = os.path.join(root, 'out')
+            os.mkdir(outdir)
+            try:
+                et, size = run(sra, outdir, config, env)
+            finally:
+                shutil.rmtree(outdir)
+            print '{0:28s} {1:9.3f} {2:>10s}'.format(name, et, pretty_usage(size))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
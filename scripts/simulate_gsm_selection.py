@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Replay historical GSM usages through each GSM_SELECTION_STRATEGY over
+successive cron cycles, and report how well the free space is utilized and
+how many GSMs get through per cycle. In each cycle, GSMs are selected from
+the queue to fit the free space to use, and they're assumed to be processed
+and transferred (i.e. their space freed) by the next cycle.
+
+The usages are those estimated by rp-run, i.e. the sizes of sra files of each
+GSM times (1 + SRA2FASTQ_SIZE_RATIO), read from a sras_info store
+(LOCAL_TOP_OUTDIR/sras_info.sqlite) in the order of GSM dirs, or from a file
+with one usage per line (e.g. 1234567 or 2.4 GB). Without either, usages are
+drawn from a log-normal distribution.
+
+example run of this script:
+python simulate_gsm_selection.py --db /path/to/sras_info.sqlite --free-to-use '500 GB'
+python simulate_gsm_selection.py -n 2000 --free-to-use '300 GB' --arrivals 100
+"""
+
+import random
+import sqlite3
+import argparse
+
+from rsempipeline.utils import selection
+from rsempipeline.utils.misc import ugly_usage, pretty_usage
+from rsempipeline.conf.settings import SRA2FASTQ_SIZE_RATIO
+
+
+def read_usages_from_db(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute(
+            'SELECT gsm, SUM(size) FROM sras GROUP BY gsm ORDER BY gsm')
+        return [(1 + SRA2FASTQ_SIZE_RATIO) * size for _, size in rows]
+    finally:
+        conn.close()
+
+
+def read_usages_from_file(usages_file):
+    with open(usages_file) as inf:
+        return [ugly_usage(_.strip()) for _ in inf if _.strip()]
+
+
+def gen_usages(num, seed):
+    """median about 5 GB, with a long tail of large GSMs"""
+    rand = random.Random(seed)
+    return [rand.lognormvariate(0, 1.2) * 5 * 1024 ** 3 for _ in xrange(num)]
+
+
+def simulate(usages, free_to_use, strategy, arrivals=None):
+    """
+    :param arrivals: the number of GSMs joining the queue per cycle, all GSMs
+                     are queued in the first cycle if None
+    :returns: a dict of metrics
+    """
+    arrivals = arrivals or len(usages)
+    # (arrival cycle, usage) of each GSM that's ever going to fit
+    pending = []
+    next_arrival = 0
+    cycle = 0
+    utilizations, throughputs, waits = [], [], []
+    while next_arrival < len(usages) or pending:
+        for k in xrange(next_arrival, min(next_arrival + arrivals, len(usages))):
+            pending.append((cycle, usages[k]))
+        next_arrival += arrivals
+        selected = set(selection.select([_[1] for _ in pending], free_to_use,
+                                        strategy))
+        utilizations.append(
+            sum(pending[k][1] for k in selected) / float(free_to_use))
+        throughputs.append(len(selected))
+        waits.extend(cycle - pending[k][0] for k in selected)
+        pending = [_ for k, _ in enumerate(pending) if k not in selected]
+        cycle += 1
+    return {
+        'cycles': cycle,
+        'utilization': sum(utilizations) / len(utilizations),
+        'throughput': sum(throughputs) / float(len(throughputs)),
+        'mean_wait': sum(waits) / float(len(waits)) if waits else 0,
+        'max_wait': max(waits) if waits else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='a sras_info store to read usages from')
+    parser.add_argument('--usages-file',
+                        help='a file with one usage per line to read from')
+    parser.add_argument('-n', '--num-gsms', type=int, default=1000,
+                        help='number of GSMs to generate without --db or '
+                        '--usages-file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--free-to-use', default='300 GB',
+                        help='the free space to use per cycle')
+    parser.add_argument('--arrivals', type=int,
+                        help='number of GSMs queued per cycle, default all '
+                        'in the first cycle')
+    args = parser.parse_args()
+
+    if args.db:
+        usages = read_usages_from_db(args.db)
+    elif args.usages_file:
+        usages = read_usages_from_file(args.usages_file)
+    else:
+        usages = gen_usages(args.num_gsms, args.seed)
+    free_to_use = ugly_usage(args.free_to_use)
+    too_large = [_ for _ in usages if _ > free_to_use]
+    usages = [_ for _ in usages if _ <= free_to_use]
+
+    print '{0} GSMs ({1}), {2} larger than free_to_use ({3}) excluded'.format(
+        len(usages), pretty_usage(sum(usages)), len(too_large),
+        pretty_usage(free_to_use))
+    print '{0:22s} {1:>7s} {2:>12s} {3:>12s} {4:>10s} {5:>9s}'.format(
+        'strategy', 'cycles', 'utilization', 'GSMs/cycle', 'mean wait',
+        'max wait')
+    for strategy in ['first_fit', 'first_fit_decreasing', 'knapsack',
+                     'max_count']:
+        res = simulate(usages, free_to_use, strategy, args.arrivals)
+        print ('{0:22s} {cycles:7d} {utilization:12.1%} {throughput:12.2f} '
+               '{mean_wait:10.2f} {max_wait:9d}'.format(strategy, **res))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*
 
+import os
+import shutil
+import contextlib
+import tempfile
 import unittest
 import mock
 import types
@@ -31,11 +35,16 @@ class RPRunTestCase(unittest.TestCase):
         self.assertIsInstance(res, types.GeneratorType)
         self.assertEqual(list(res), return_val)
 
+    @mock.patch('rsempipeline.core.rp_run.misc.touch', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.verify_sra', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.get_sra_info', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.os', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
-    def test_download(self, mock_execute, mock_os, mock_config, mock_options):
+    def test_download(self, mock_execute, mock_os, mock_config, mock_options, mock_update_usage,
+                      mock_get_sra_info, mock_verify, mock_touch):
         series = Series('GSE31555', 'GSE31555_family.soft.subset')
         sample = Sample('GSM783253', series, url='ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321')
         outputs = ['some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831/SRR333831.sra',
@@ -51,19 +60,30 @@ class RPRunTestCase(unittest.TestCase):
 anonftp@ftp-trace.ncbi.nlm.nih.gov:/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321 some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831''',
         mock_config.__getitem__().format.return_value = cmd
         mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: default
         mock_execute.return_value = 0
+        mock_get_sra_info.return_value = {'size': 100, 'readable_size': '100 B'}
+        mock_verify.return_value = None
         rp_run.download(None, outputs, sample)
         mock_execute.assert_called_once_with(
-            cmd,
-            '<GSM783253 (0/0/0) of GSE31555 at None>',
-            'some_outdir/rsem_output/GSE31555/some_species/GSM1/SRR333831.sra.download.COMPLETE',
-            False)
+            cmd, '<GSM783253 (0/0/0) of GSE31555 at None>', debug=False)
+        mock_verify.assert_called_once_with(outputs[0], 100, None)
+        mock_touch.assert_called_once_with(outputs[1])
+        mock_update_usage.assert_called_once_with(
+            mock_config.__getitem__(), sample.outdir)
+        # no DOWNLOAD_BANDWIDTH
+        self.assertIsNone(mock_config.__getitem__().format.call_args[1]['rate_limit'])
 
+    @mock.patch('rsempipeline.core.rp_run.misc.touch', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.verify_sra', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.get_sra_info', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.os', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
-    def test_download_ascp_failed_use_cmd_instead(self, mock_execute, mock_os, mock_config, mock_options):
+    def test_download_ascp_failed_use_cmd_instead(self, mock_execute, mock_os, mock_config, mock_options, mock_update_usage,
+                                                  mock_get_sra_info, mock_verify, mock_touch):
         series = Series('GSE31555', 'GSE31555_family.soft.subset')
         sample = Sample('GSM783253', series, url='ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321')
         outputs = ['some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831/SRR333831.sra',
@@ -81,35 +101,203 @@ anonftp@ftp-trace.ncbi.nlm.nih.gov:/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/S
 -P some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831 -N'''
         mock_config.__getitem__().format.side_effect = [ascp_cmd, wget_cmd]
         mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: default
         # assume ascp fails with 1, wget succeeds with 0
         mock_execute.side_effect = [1, 0]
+        mock_get_sra_info.return_value = {}
+        mock_verify.return_value = None
         rp_run.download(None, outputs, sample)
         mock_execute.assert_has_calls([
-            mock.call(ascp_cmd,
-                      '<GSM783253 (0/0/0) of GSE31555 at None>',
-                      'some_outdir/rsem_output/GSE31555/some_species/GSM1/SRR333831.sra.download.COMPLETE',
-                      False),
-            mock.call(wget_cmd,
-                      '<GSM783253 (0/0/0) of GSE31555 at None>',
-                      'some_outdir/rsem_output/GSE31555/some_species/GSM1/SRR333831.sra.download.COMPLETE',
-                      False)])
+            mock.call(ascp_cmd, '<GSM783253 (0/0/0) of GSE31555 at None>', debug=False),
+            mock.call(wget_cmd, '<GSM783253 (0/0/0) of GSE31555 at None>', debug=False)])
+        mock_touch.assert_called_once_with(outputs[1])
 
+    @mock.patch('rsempipeline.core.rp_run.misc.touch', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.verify_sra', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.get_sra_info', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.os', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
+    def test_download_verification_failed(self, mock_execute, mock_os, mock_config, mock_options, mock_update_usage,
+                                          mock_get_sra_info, mock_verify, mock_touch):
+        series = Series('GSE31555', 'GSE31555_family.soft.subset')
+        sample = Sample('GSM783253', series, url='ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321')
+        outputs = ['some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831/SRR333831.sra',
+                   'some_outdir/rsem_output/GSE31555/some_species/GSM1/SRR333831.sra.download.COMPLETE']
+        mock_os.path.exists.return_value = True
+        mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: default
+        mock_execute.return_value = 0
+        mock_get_sra_info.return_value = {'size': 100}
+        # truncated the first time, downloaded again right away
+        mock_verify.side_effect = ['size is 50, expected 100', None]
+        rp_run.download(None, outputs, sample)
+        self.assertEqual(mock_execute.call_count, 2)
+        mock_os.remove.assert_called_once_with(outputs[0])
+        mock_touch.assert_called_once_with(outputs[1])
+
+        # truncated every time, given up after DOWNLOAD_VERIFY_RETRIES
+        mock_execute.reset_mock()
+        mock_os.remove.reset_mock()
+        mock_touch.reset_mock()
+        mock_verify.side_effect = None
+        mock_verify.return_value = 'size is 50, expected 100'
+        rp_run.download(None, outputs, sample)
+        self.assertEqual(mock_execute.call_count, 2)
+        self.assertEqual(mock_os.remove.call_count, 2)
+        self.assertFalse(mock_touch.called)
+        mock_update_usage.assert_called_with(mock_config.__getitem__(), sample.outdir)
+
+    @mock.patch('rsempipeline.core.rp_run.SE.record_sizes', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.misc.execute_log_stdout_stderr', autospec=True)
-    def test_sra2_fastq(self, mock_execute, mock_config, mock_options):
+    def test_sra2_fastq(self, mock_execute, mock_config, mock_options, mock_update_usage,
+                        mock_record_sizes):
         cmd = '''fastq-dump 
 --minReadLen 25 --gzip --split-files --outdir some_outdir/rsem_output/GSE99999/some_species/GSM999999 
 some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRX999999/SRR999999/SRR999999.sra'''
         flag_file = 'some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRX999999/SRR999999/SRR999999.sra.sra2fastq.COMPLETE'
         mock_config.__getitem__().format.return_value = cmd
+        mock_config.get.side_effect = lambda key, default=None: default
         mock_options.debug = False
         rp_run.sra2fastq(['some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRX999999/SRR999999/SRR999999.sra',
                           'some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRR999999.sra.download.COMPLETE'],
                          [flag_file])
         mock_execute.assert_called_once_with(cmd, flag_file=flag_file, debug=False)
+        mock_update_usage.assert_called_once_with(
+            mock_config.__getitem__(),
+            'some_outdir/rsem_output/GSE99999/some_species/GSM999999')
+        mock_record_sizes.assert_called_once_with(
+            mock_config.__getitem__(),
+            'some_outdir/rsem_output/GSE99999/some_species/GSM999999')
 
 
+    @mock.patch('rsempipeline.core.rp_run.RT.time.sleep', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.download_slot', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.RT.get_policy', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
+    def test_fetch_sra_releases_slot_between_retries(self, mock_execute, mock_config, mock_options,
+                                                     mock_get_policy, mock_slot, mock_sleep):
+        held = []
+
+        @contextlib.contextmanager
+        def slot(tool):
+            held.append(tool)
+            try:
+                yield
+            finally:
+                held.remove(tool)
+
+        mock_slot.side_effect = slot
+        mock_get_policy.return_value = rp_run.RT.RetryPolicy(max_attempts=2)
+        mock_options.debug = False
+        mock_execute.side_effect = lambda *args, **kwargs: 0 if held == ['wget'] else 1
+        mock_sleep.side_effect = lambda wait: self.assertEqual(held, [])
+        self.assertEqual(rp_run.fetch_sra('/url/path', 'sra_outdir', 'msg_id'), 0)
+        # ascp failed twice, wget succeeded the first time
+        self.assertEqual(mock_execute.call_count, 3)
+        self.assertEqual([_[0][0] for _ in mock_slot.call_args_list],
+                         ['ascp', 'ascp', 'wget'])
+        self.assertEqual(mock_sleep.call_count, 1)
+
+    @mock.patch('rsempipeline.core.rp_run.misc.touch', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.get_sra_info', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
+    def test_download_sra_not_found(self, mock_execute, mock_config, mock_options,
+                                    mock_update_usage, mock_get_sra_info, mock_touch):
+        tmp_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        series = Series('GSE31555', 'GSE31555_family.soft.subset')
+        sample = Sample('GSM783253', series, url='ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321')
+        sample.outdir = os.path.join(tmp_dir, 'GSM783253')
+        outputs = [os.path.join(sample.outdir, 'SRX093321/SRR333831/SRR333831.sra'),
+                   os.path.join(sample.outdir, 'SRR333831.sra.download.COMPLETE')]
+        mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: default
+        # ascp exits 0 without downloading anything
+        mock_execute.return_value = 0
+        mock_get_sra_info.return_value = {'size': 100}
+        rp_run.download(None, outputs, sample)
+        # downloaded again instead of failing to remove the missing sra
+        self.assertEqual(mock_execute.call_count, 2)
+        self.assertFalse(mock_touch.called)
+        self.assertTrue(os.path.isdir(os.path.dirname(outputs[0])))
+
+    @mock.patch('rsempipeline.core.rp_run.misc.touch', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.verify_sra', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.get_sra_info', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.convert_sra', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.os', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.misc.execute', autospec=True)
+    def test_download_pipelined(self, mock_execute, mock_os, mock_config, mock_options,
+                                mock_update_usage, mock_convert, mock_get_sra_info,
+                                mock_verify, mock_touch):
+        series = Series('GSE31555', 'GSE31555_family.soft.subset')
+        sample = Sample('GSM783253', series, url='ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX093/SRX093321')
+        outputs = ['some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRX093321/SRR333831/SRR333831.sra',
+                   'some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRR333831.sra.download.COMPLETE']
+        mock_os.path.exists.return_value = True
+        mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: {
+            'PIPELINE_SRA2FASTQ': True}.get(key, default)
+        mock_get_sra_info.return_value = {}
+        mock_verify.return_value = None
+        mock_execute.return_value = 1
+        rp_run.download(None, outputs, sample)
+        # neither ascp nor wget succeeded
+        self.assertFalse(mock_convert.called)
+        mock_execute.return_value = 0
+        mock_verify.return_value = 'not found'
+        rp_run.download(None, outputs, sample)
+        # not verified
+        self.assertFalse(mock_convert.called)
+        mock_verify.return_value = None
+        rp_run.download(None, outputs, sample)
+        mock_convert.assert_called_once_with(
+            outputs[0],
+            'some_outdir/rsem_output/GSE31555/some_species/GSM783253/SRR333831.sra.sra2fastq.COMPLETE')
+
+    @mock.patch('rsempipeline.core.rp_run.S2F.replace_with_placeholder', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.SE.record_sizes', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.UL.update_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.misc.execute_log_stdout_stderr', autospec=True)
+    def test_convert_sra_pipelined(self, mock_execute, mock_config, mock_options, mock_update_usage,
+                                   mock_record_sizes, mock_replace):
+        sra = 'some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRX999999/SRR999999/SRR999999.sra'
+        mock_options.debug = False
+        mock_config.get.side_effect = lambda key, default=None: {
+            'PIPELINE_SRA2FASTQ': True}.get(key, default)
+        mock_execute.return_value = 1
+        self.assertEqual(rp_run.convert_sra(sra, 'flag_file'), 1)
+        self.assertFalse(mock_replace.called)
+        mock_execute.return_value = 0
+        self.assertEqual(rp_run.convert_sra(sra, 'flag_file'), 0)
+        mock_replace.assert_called_once_with(sra)
+
+    @mock.patch('rsempipeline.core.rp_run.S2F.is_converted', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.convert_sra', autospec=True)
+    def test_sra2_fastq_converted_while_downloading(self, mock_convert, mock_is_converted):
+        mock_is_converted.return_value = True
+        rp_run.sra2fastq(['path/to/SRR1.sra', 'path/to/SRR1.sra.download.COMPLETE'],
+                         ['path/to/SRR1_1.fastq.gz', 'path/to/SRR1.sra.sra2fastq.COMPLETE'])
+        mock_is_converted.assert_called_once_with(
+            'path/to/SRR1.sra', 'path/to/SRR1.sra.sra2fastq.COMPLETE')
+        self.assertFalse(mock_convert.called)
+
     @mock.patch('rsempipeline.core.rp_run.options', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.config', autospec=True)
     @mock.patch('rsempipeline.core.rp_run.gen_fastq_gz_input', autospec=True)
@@ -134,3 +322,17 @@ some_outdir/rsem_output/GSE99999/some_species/GSM999999/SRX999999/SRR999999/SRR9
         mock_disk_used.return_value = 20
         res = rp_run.calc_local_free_space_to_use('top_outdir', 'df -k -P /local/path', 10, 50)
         self.assertEqual(res, 30)
+        mock_disk_used.assert_called_once_with('top_outdir', 1)
+        mock_disk_free.assert_called_once_with('df -k -P /local/path', 'top_outdir')
+
+    @mock.patch('rsempipeline.core.rp_run.PPR.disk_used', autospec=True)
+    @mock.patch('rsempipeline.core.rp_run.PPR.disk_free', autospec=True)
+    def test_calc_local_free_space_to_use_with_ledger(self, mock_disk_free, mock_disk_used):
+        mock_disk_free.return_value = 90
+        ledger = mock.Mock()
+        ledger.get_total.return_value = 20
+        res = rp_run.calc_local_free_space_to_use(
+            'top_outdir', 'df -k -P /local/path', 10, 50, 4, ledger, ['gsm_dir'])
+        self.assertEqual(res, 30)
+        ledger.get_total.assert_called_once_with(['gsm_dir'], 4)
+        self.assertFalse(mock_disk_used.called)
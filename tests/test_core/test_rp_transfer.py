@@ -1,4 +1,8 @@
+import os
+import shutil
 import datetime
+import tempfile
+import subprocess
 
 import unittest
 import mock
@@ -7,50 +11,44 @@ from testfixtures import log_capture
 
 from rsempipeline.core import rp_transfer as RP_T
 from rsempipeline.utils.objs import Series, Sample
+from rsempipeline.conf.settings import TEMPLATES_DIR
 
 
 class RPRunTestCase(unittest.TestCase):
-    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec', autospec=True)
-    def test_get_remote_free_disk(self, mock_sshexec):
-        mock_sshexec.return_value = [
-            'Filesystem         1024-blocks      Used Available Capacity Mounted on\n',
-            '/dev/analysis        16106127360 13106127360 3000000000      82% /extscratch\n']
-        cmd = 'df -k -P target_dir'
-        res = RP_T.get_remote_free_disk_space('remote', 'username', cmd)
-        self.assertEqual(res, 3072e9)
-
-    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec', autospec=True)
-    def test_fetch_remote_file_list(self, mock_sshexec):
-        mock_sshexec.return_value = [
+    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec_iter', autospec=True)
+    def test_fetch_remote_index(self, mock_sshexec_iter):
+        mock_sshexec_iter.return_value = iter([
                              '/path/to/rsemoutput\n',
                              '/path/to/rsemoutput/GSE1\n',
                              '/path/to/rsemoutput/GSE1/homo_sapiens\n',
                              '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1\n',
+                             '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1/rsem.COMPLETE\n',
                              '/path/to/rsemoutput/GSE2\n',
                              '/path/to/rsemoutput/GSE2/homo_sapiens\n',
-                             '/path/to/rsemoutput/GSE2/homo_sapiens/GSM2\n']
-        self.assertEqual(RP_T.fetch_remote_file_list('remote', 'username', 'r_dir'),
-                         [
-                            '/path/to/rsemoutput',
-                             '/path/to/rsemoutput/GSE1',
-                             '/path/to/rsemoutput/GSE1/homo_sapiens',
-                             '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1',
-                             '/path/to/rsemoutput/GSE2',
-                             '/path/to/rsemoutput/GSE2/homo_sapiens',
-                             '/path/to/rsemoutput/GSE2/homo_sapiens/GSM2'])
-
-    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec', autospec=True)
-    def test_fetch_remote_file_list_remote_down(self, mock_sshexec):
-        mock_sshexec.return_value = None
-        self.assertRaisesRegexp(
-            ValueError,
-            'cannot estimate current usage on remote host. Please check r_dir exists on remote, or remote may be down',
-            RP_T.fetch_remote_file_list, 'remote', 'username', 'r_dir')
+                             '/path/to/rsemoutput/GSE2/homo_sapiens/GSM2\n'])
+        index = RP_T.fetch_remote_index('remote', 'username', 'r_dir')
+        self.assertEqual(index.gsm_dirs, {
+            '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1': {'complete': True, 'empty': False},
+            '/path/to/rsemoutput/GSE2/homo_sapiens/GSM2': {'complete': False, 'empty': True}})
+        mock_sshexec_iter.assert_called_once_with('find r_dir', 'remote', 'username')
+
+    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec_iter', autospec=True)
+    def test_fetch_remote_index_filtered(self, mock_sshexec_iter):
+        mock_sshexec_iter.return_value = iter([
+            'D /path/to/rsemoutput/GSE1/homo_sapiens/GSM1\n',
+            'F /path/to/rsemoutput/GSE1/homo_sapiens/GSM1/rsem.COMPLETE\n',
+            'E /path/to/rsemoutput/GSE2/homo_sapiens/GSM2\n'])
+        index = RP_T.fetch_remote_index('remote', 'username', 'r_dir', 'filtered')
+        self.assertTrue(index.is_complete('/path/to/rsemoutput/GSE1/homo_sapiens/GSM1'))
+        self.assertTrue(index.is_empty('/path/to/rsemoutput/GSE2/homo_sapiens/GSM2'))
+        cmd = mock_sshexec_iter.call_args[0][0]
+        self.assertTrue(cmd.startswith('find r_dir '))
+        self.assertIn('-printf', cmd)
 
     @mock.patch('rsempipeline.core.rp_transfer.estimate_rsem_usage', autospec=True)
-    @mock.patch('rsempipeline.core.rp_transfer.fetch_remote_file_list', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.fetch_remote_index', autospec=True)
     def test_estimate_current_remote_usage(self, mock_fetch, mock_est):
-        mock_fetch.return_value = [
+        mock_fetch.return_value = RP_T.RemoteGSMIndex().update([
             '/path/to/rsemoutput',
             '/path/to/rsemoutput/GSE1',
             '/path/to/rsemoutput/GSE1/homo_sapiens', 
@@ -63,22 +61,29 @@ class RPRunTestCase(unittest.TestCase):
             '/path/to/rsemoutput/GSE3/homo_sapiens',
             '/path/to/rsemoutput/GSE3/homo_sapiens/GSM3',
             '/path/to/rsemoutput/GSE3/homo_sapiens/GSM3/some.fq.gz'
-        ]
+        ])
         mock_est.return_value = 1e3
         self.assertEqual(RP_T.estimate_current_remote_usage('remote', 'username', '/path/to', '/l_path/to', 5),
                          1e3)
-
-    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec', autospec=True)
-    def test_get_real_current_usage(self, mock_sshexec):
-        mock_sshexec.return_value = ['3096\t/path/to/top_outdir\n'] # in KB
-        self.assertEqual(RP_T.get_real_current_usage('remote', 'username', 'r_dir'),
-                         3170304) # in byte
+        mock_est.assert_called_once_with('/l_path/to/rsemoutput/GSE3/homo_sapiens/GSM3', 5)
+        mock_fetch.assert_called_once_with('remote', 'username', '/path/to', 'full')
+        # the index fetched already
+        self.assertEqual(RP_T.estimate_current_remote_usage(
+            'remote', 'username', '/path/to', '/l_path/to', 5, mock_fetch.return_value), 1e3)
+        self.assertEqual(mock_fetch.call_count, 1)
 
     @mock.patch('rsempipeline.core.rp_transfer.PPR.estimate_sra2fastq_usage', autospec=True)
     def test_estimate_rsem_usage(self, mock_estimate_sra2fastq_usage):
         mock_estimate_sra2fastq_usage.return_value = 1e5
         self.assertEqual(RP_T.estimate_rsem_usage('gsm_dir', 5), 5e5)
 
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.estimate_sra2fastq_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.SE.estimate_rsem_usage', autospec=True)
+    def test_estimate_rsem_usage_learned(self, mock_learned, mock_estimate_sra2fastq_usage):
+        mock_learned.return_value = 3e5
+        self.assertEqual(RP_T.estimate_rsem_usage('gsm_dir', 5), 3e5)
+        self.assertFalse(mock_estimate_sra2fastq_usage.called)
+
     def test_get_gsms_transferred_record_file_not_exist(self):
         self.assertEqual(RP_T.get_gsms_transferred('nonexistent_transferred_GSMs.txt'), [])
 
@@ -193,6 +198,23 @@ class RPRunTestCase(unittest.TestCase):
                 all_gsms, transferred_gsms, 'l_top_outdir', 1e6, 5), [m1])
 
 
+    @mock.patch('rsempipeline.core.rp_transfer.estimate_rsem_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.is_processed', autospec=True)
+    def test_select_gsms_to_transfer_with_strategy(self, mock_is_processed,
+                                                   mock_estimate_rsem_usage):
+        mock_is_processed.return_value = True
+        mock_estimate_rsem_usage.side_effect = [6e5, 5e5, 5e5]
+        gsms = []
+        for k in range(3):
+            m = mock.Mock()
+            m.outdir = 'l_top_outdir/rsemoutput/GSE1/homo_sapiens/GSM{0}'.format(k)
+            m.name = 'GSM{0}'.format(k)
+            gsms.append(m)
+        self.assertEqual(
+            RP_T.select_gsms_to_transfer(
+                gsms, [], 'l_top_outdir', 1e6, 5, strategy='knapsack'),
+            gsms[1:])
+
     @mock.patch.object(RP_T.os, 'mkdir', autospec=True)
     @mock.patch.object(RP_T.os.path, 'exists', autospec=True)
     def test_create_transfer_sh_dir(self, mock_exists, mock_mkdir):
@@ -220,37 +242,119 @@ class RPRunTestCase(unittest.TestCase):
             'r_username', 'r_host', 'r_top_outdir'),
                          'l_top_outdir/transfer_scripts/transfer.15-01-01_01:01:01.sh')
 
-    @mock.patch('rsempipeline.core.rp_transfer.get_real_current_usage', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.create_transfer_sh_dir', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.datetime', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.write', autospec=True)
+    def test_write_transfer_sh_shard(self, mock_write, mock_datetime, mock_create):
+        mock_create.return_value = 'l_top_outdir/transfer_scripts'
+        mock_datetime.datetime.now.return_value = datetime.datetime(2015, 1, 1, 1, 1, 1)
+        self.assertEqual(RP_T.write_transfer_sh(
+            ['rsem_output/GSE56743/rattus_norvegicus/GSM1367849'],
+            'rsync_template', 'l_top_outdir', 'r_username', 'r_host',
+            'r_top_outdir', 1),
+                         'l_top_outdir/transfer_scripts/transfer.15-01-01_01:01:01.1.sh')
+
+    def test_shard_gsms(self):
+        self.assertEqual(
+            RP_T.shard_gsms(['GSM1', 'GSM2', 'GSM3', 'GSM4', 'GSM5'],
+                            [10, 70, 30, 20, 40], 2),
+            [['GSM2', 'GSM4'], ['GSM5', 'GSM3', 'GSM1']])
+        # fewer GSMs than shards
+        self.assertEqual(RP_T.shard_gsms(['GSM1', 'GSM2'], [1, 2], 4),
+                         [['GSM2'], ['GSM1']])
+
+    @mock.patch('rsempipeline.core.rp_transfer.misc.execute_log_stdout_stderr', autospec=True)
+    def test_run_transfer_scripts(self, mock_execute):
+        mock_execute.side_effect = lambda script: {'s0.sh': 0, 's1.sh': 1}.get(script)
+        self.assertEqual(RP_T.run_transfer_scripts(['s0.sh']), [0])
+        self.assertEqual(RP_T.run_transfer_scripts(['s0.sh', 's1.sh', 's2.sh']),
+                         [0, 1, None])
+        self.assertEqual(mock_execute.call_count, 4)
+
     @mock.patch('rsempipeline.core.rp_transfer.estimate_current_remote_usage', autospec=True)
-    @mock.patch('rsempipeline.core.rp_transfer.get_remote_free_disk_space', autospec=True)
-    def test_calc_remote_free_space_to_use(
-            self, mock_get_real, mock_estimate_current, mock_get_remote_free):
+    @mock.patch('rsempipeline.core.rp_transfer.probe_remote', autospec=True)
+    def test_calc_remote_free_space_to_use(self, mock_probe, mock_estimate_current):
         """numbers are intentionally made small for convenience, in real scenario,
         just image multiplying them by a constant factor"""
-        mock_get_real.return_value = 1234
+        mock_probe.return_value = (90, 1234, ['r_top_outdir/GSE1'])
         mock_estimate_current.return_value = 10
-        mock_get_remote_free.return_value = 90
         r_max_usage = 50
         r_min_free = 20
         res = RP_T.calc_remote_free_space_to_use(
             'r_host', 'r_username', 'r_top_outdir',
             'l_top_outdir', 'r_cmd_df', r_max_usage, r_min_free, 5)
         self.assertEqual(res, 40)
+        mock_probe.assert_called_once_with('r_host', 'r_username', 'r_top_outdir', 'r_cmd_df', 'full')
+        mock_estimate_current.assert_called_once_with(
+            'r_host', 'r_username', 'r_top_outdir', 'l_top_outdir', 5,
+            ['r_top_outdir/GSE1'])
+
+    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec_iter', autospec=True)
+    def test_probe_remote(self, mock_sshexec_iter):
+        mock_sshexec_iter.return_value = iter([
+            '__RP_TRANSFER_PROBE_df__\n',
+            'Filesystem         1024-blocks      Used Available Capacity Mounted on\n',
+            '/dev/analysis        16106127360 13106127360 3000000000      82% /extscratch\n',
+            '__RP_TRANSFER_PROBE_du__\n',
+            '3096\t/path/to/rsemoutput\n',
+            '__RP_TRANSFER_PROBE_find__\n',
+            '/path/to/rsemoutput\n',
+            '/path/to/rsemoutput/GSE1\n',
+            '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1\n',
+            '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1/some.fastq.gz\n'])
+        free, real, index = RP_T.probe_remote(
+            'remote', 'username', '/path/to/rsemoutput', 'df -k -P /path')
+        self.assertEqual((free, real), (3072e9, 3170304))
+        self.assertEqual(index.gsm_dirs, {
+            '/path/to/rsemoutput/GSE1/homo_sapiens/GSM1': {'complete': False, 'empty': False}})
+        mock_sshexec_iter.assert_called_once_with(
+            'echo __RP_TRANSFER_PROBE_df__; df -k -P /path; '
+            'echo __RP_TRANSFER_PROBE_du__; du -s /path/to/rsemoutput; '
+            'echo __RP_TRANSFER_PROBE_find__; find /path/to/rsemoutput',
+            'remote', 'username')
+
+    @mock.patch('rsempipeline.core.rp_transfer.misc.sshexec_iter', autospec=True)
+    def test_probe_remote_failed(self, mock_sshexec_iter):
+        # no output at all, e.g. the remote is down
+        mock_sshexec_iter.return_value = iter([])
+        self.assertRaisesRegexp(
+            ValueError, 'failed to parse the output of',
+            RP_T.probe_remote, 'remote', 'username', 'r_dir', 'df -k -P /path')
+        # e.g. du failed
+        mock_sshexec_iter.return_value = iter([
+            '__RP_TRANSFER_PROBE_df__\n',
+            'Filesystem         1024-blocks      Used Available Capacity Mounted on\n',
+            '/dev/analysis        16106127360 13106127360 3000000000      82% /extscratch\n',
+            '__RP_TRANSFER_PROBE_du__\n',
+            '__RP_TRANSFER_PROBE_find__\n'])
+        self.assertRaisesRegexp(
+            ValueError, 'failed to parse the output of',
+            RP_T.probe_remote, 'remote', 'username', 'r_dir', 'df -k -P /path')
+
+    def test_probe_remote_unknown_listing(self):
+        self.assertRaisesRegexp(
+            ValueError, 'unknown REMOTE_LISTING: ls',
+            RP_T.probe_remote, 'remote', 'username', 'r_dir', 'df -k -P /path', 'ls')
 
+    @mock.patch('rsempipeline.core.rp_transfer.get_gsms_done', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.UL.mark_dirty', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.os', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.append_transfer_record', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.execute_log_stdout_stderr', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.write_transfer_sh', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.select_gsms_to_transfer', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.get_gsms_transferred', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_size_estimator', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sras_info_store', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sample_outdirs', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.gen_all_samples_from_soft_and_isamp', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.calc_remote_free_space_to_use', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.get_config', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.parse_args_for_rp_transfer', autospec=True)
-    def test_main(self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init,
+    def test_main(self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init, mock_init_store, mock_init_estimator,
                   mock_get_gsms_transferred, mock_find_gsms, mock_write_transfer_script,
-                  mock_execute, mock_append, mock_os):
+                  mock_execute, mock_append, mock_os, mock_mark_dirty, mock_get_done):
+        mock_get_done.side_effect = lambda tf_script, gsms, rcode: gsms if rcode == 0 else []
         mock_get_config.return_value = {
             'LOCAL_TOP_OUTDIR': 'l_top_outdir',
             'REMOTE_TOP_OUTDIR': 'r_top_outdir',
@@ -273,20 +377,74 @@ class RPRunTestCase(unittest.TestCase):
         RP_T.main()
         self.assertTrue(mock_execute.called)
         self.assertTrue(mock_append.called)
+        mock_mark_dirty.assert_called_once_with('l_top_outdir', [m1.outdir, m2.outdir])
 
+    @mock.patch('rsempipeline.core.rp_transfer.get_gsms_done', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.SE.scan_gsm_dir', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.UL.mark_dirty', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.os', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.append_transfer_record', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.execute_log_stdout_stderr', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.write_transfer_sh', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.select_gsms_to_transfer', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.get_gsms_transferred', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_size_estimator', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sras_info_store', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sample_outdirs', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.gen_all_samples_from_soft_and_isamp', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.calc_remote_free_space_to_use', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.misc.get_config', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.parse_args_for_rp_transfer', autospec=True)
+    def test_main_multiple_streams(self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init, mock_init_store, mock_init_estimator,
+                                   mock_get_gsms_transferred, mock_find_gsms, mock_write_transfer_script,
+                                   mock_execute, mock_append, mock_os, mock_mark_dirty, mock_scan, mock_get_done):
+        mock_get_done.side_effect = lambda tf_script, gsms, rcode: gsms if rcode == 0 else []
+        mock_get_config.return_value = {
+            'LOCAL_TOP_OUTDIR': 'l_top_outdir',
+            'REMOTE_TOP_OUTDIR': 'r_top_outdir',
+            'REMOTE_HOST': 'remote',
+            'USERNAME': 'username',
+            'REMOTE_CMD_DF': 'df -k -P target_dir',
+            'REMOTE_MAX_USAGE': '50 GB',
+            'REMOTE_MIN_FREE': '20 GB',
+            'FASTQ2RSEM_RATIO': 5,
+            'TRANSFER_STREAMS': 2,
+        }
+        mock_calc.return_value = 40
+        gsms = []
+        for k, size in enumerate([10, 30, 20]):
+            gsm = mock.Mock()
+            gsm.outdir = 'l_top_outdir/rsemoutput/GSE1/homo_sapiens/GSM{0}'.format(k)
+            gsm.name = 'GSM{0}'.format(k)
+            gsms.append(gsm)
+        mock_find_gsms.return_value = gsms
+        mock_os.path.relpath.side_effect = lambda path, start: path.replace('l_top_outdir/', '')
+        mock_scan.side_effect = lambda outdir: {'fastq_gz': {'0': 10, '1': 30, '2': 20}[outdir[-1]]}
+        mock_write_transfer_script.side_effect = lambda shard, *args: 'transfer.{0}.sh'.format(args[-1])
+        # the second shard failed
+        mock_execute.side_effect = lambda script: {'transfer.0.sh': 0}.get(script, 1)
+        RP_T.main()
+        self.assertEqual(mock_write_transfer_script.call_count, 2)
+        self.assertEqual(mock_execute.call_count, 2)
+        mock_append.assert_called_once_with(
+            ['rsemoutput/GSE1/homo_sapiens/GSM1'], mock.ANY)
+        mock_mark_dirty.assert_called_once_with('l_top_outdir', [_.outdir for _ in gsms])
+
+    @mock.patch('rsempipeline.core.rp_transfer.os', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.append_transfer_record', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.misc.execute_log_stdout_stderr', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.write_transfer_sh', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.select_gsms_to_transfer', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.get_gsms_transferred', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_size_estimator', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sras_info_store', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sample_outdirs', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.gen_all_samples_from_soft_and_isamp', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.calc_remote_free_space_to_use', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.get_config', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.parse_args_for_rp_transfer', autospec=True)
     def test_main_no_GSM_found_for_transfer(
-            self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init,
+            self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init, mock_init_store, mock_init_estimator,
             mock_get_gsms_transferred, mock_find_gsms, mock_write_transfer_script,
             mock_execute, mock_append, mock_os):
         mock_get_config.return_value = {
@@ -306,21 +464,26 @@ class RPRunTestCase(unittest.TestCase):
         self.assertFalse(mock_write_transfer_script.called)
         self.assertFalse(mock_execute.called)
 
+    @mock.patch('rsempipeline.core.rp_transfer.get_gsms_done', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.UL.mark_dirty', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.os', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.append_transfer_record', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.execute_log_stdout_stderr', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.write_transfer_sh', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.select_gsms_to_transfer', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.get_gsms_transferred', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_size_estimator', autospec=True)
+    @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sras_info_store', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.init_sample_outdirs', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.PPR.gen_all_samples_from_soft_and_isamp', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.calc_remote_free_space_to_use', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.misc.get_config', autospec=True)
     @mock.patch('rsempipeline.core.rp_transfer.parse_args_for_rp_transfer', autospec=True)
     def test_main_transfer_unsuccessfull(
-            self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init,
+            self, mock_parse, mock_get_config, mock_calc, mock_gen, mock_init, mock_init_store, mock_init_estimator,
             mock_get_gsms_transferred, mock_find_gsms, mock_write_transfer_script,
-            mock_execute, mock_append, mock_os):
+            mock_execute, mock_append, mock_os, mock_mark_dirty, mock_get_done):
+        mock_get_done.return_value = []
         mock_get_config.return_value = {
             'LOCAL_TOP_OUTDIR': 'l_top_outdir',
             'REMOTE_TOP_OUTDIR': 'r_top_outdir',
@@ -343,3 +506,52 @@ class RPRunTestCase(unittest.TestCase):
         RP_T.main()
         self.assertTrue(mock_execute.called)
         self.assertFalse(mock_append.called)
+        # files may have been removed even if the transfer failed
+        self.assertTrue(mock_mark_dirty.called)
+
+
+class TransferScriptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.l_top_outdir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.gsms = ['rsem_output/GSE1/homo_sapiens/GSM1',
+                     'rsem_output/GSE1/homo_sapiens/GSM2']
+        for gsm in self.gsms:
+            os.makedirs(os.path.join(self.l_top_outdir, gsm))
+            with open(os.path.join(self.l_top_outdir, gsm, 'a_1.fastq.gz'), 'wb') as opf:
+                opf.write('x')
+        # fake rsync failing for GSM2, and ssh doing nothing
+        self.bin_dir = os.path.join(self.l_top_outdir, 'bin')
+        os.mkdir(self.bin_dir)
+        for name, content in [('rsync', 'case "$*" in *GSM2*) exit 23;; esac'),
+                              ('ssh', 'exit 0')]:
+            path = os.path.join(self.bin_dir, name)
+            with open(path, 'wb') as opf:
+                opf.write('#! /bin/bash\n{0}\n'.format(content))
+            os.chmod(path, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.l_top_outdir)
+
+    def test_get_gsms_done(self):
+        tf_script = os.path.join(self.l_top_outdir, 'transfer.sh')
+        # no done file
+        self.assertEqual(RP_T.get_gsms_done(tf_script, self.gsms, 0), self.gsms)
+        self.assertEqual(RP_T.get_gsms_done(tf_script, self.gsms, 1), [])
+        with open(RP_T.get_done_file(tf_script), 'wb') as opf:
+            opf.write('{0}\n'.format(self.gsms[1]))
+        self.assertEqual(RP_T.get_gsms_done(tf_script, self.gsms, 1), self.gsms[1:])
+
+    def test_rsync_template(self):
+        tf_script = RP_T.write_transfer_sh(
+            self.gsms, os.path.join(TEMPLATES_DIR, 'rsync.sh'),
+            self.l_top_outdir, 'r_username', 'r_host', '/r_top_outdir')
+        env = dict(os.environ, PATH='{0}:{1}'.format(self.bin_dir, os.environ['PATH']))
+        rcode = subprocess.call(['/bin/bash', tf_script], env=env,
+                                stdout=open(os.devnull, 'wb'))
+        self.assertEqual(rcode, 1)
+        self.assertEqual(RP_T.get_gsms_done(tf_script, self.gsms, rcode), self.gsms[:1])
+        # only fastq.gz of the GSM transferred are removed
+        self.assertFalse(os.path.exists(os.path.join(
+            self.l_top_outdir, self.gsms[0], 'a_1.fastq.gz')))
+        self.assertTrue(os.path.exists(os.path.join(
+            self.l_top_outdir, self.gsms[1], 'a_1.fastq.gz')))
@@ -34,3 +34,31 @@ INVALID_GSE43770_FAMILY_SOFT_SUBSET_CONTENT = """^SERIES = GSE00000
 !Sample_library_source = transcriptomic
 !Sample_library_strategy = RNA-Seq
 !Sample_supplementary_file_1 = ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX219/SRX219901"""
+
+
+# a full (non-subset) soft file contains lines that are not of "label = value"
+# format, e.g. data tables
+GSE43770_FAMILY_SOFT_CONTENT = """^DATABASE = GeoMiame
+!Database_name = Gene Expression Omnibus (GEO)
+^SERIES = GSE43770
+!Series_title = some title with = in it
+!Series_sample_id = GSM1070765
+!Series_sample_id = GSM1070766
+^PLATFORM = GPL11154
+!Platform_organism = Homo sapiens
+^SAMPLE = GSM1070765
+!Sample_type = SRA
+!Sample_characteristics_ch1 = a=b
+!Sample_organism_ch1 = Homo sapiens
+!Sample_instrument_model = Illumina HiSeq 2000
+!Sample_library_source = transcriptomic
+!Sample_library_strategy = RNA-Seq
+!Sample_supplementary_file_1 = ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX219/SRX219901
+!sample_table_begin
+ID_REF\tVALUE
+1\t0.5
+!sample_table_end
+^SAMPLE = GSM1070766
+!Sample_type = SRA
+!Sample_organism_ch1 = Danio rerio
+!Sample_supplementary_file_1 = ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX219/SRX219902"""
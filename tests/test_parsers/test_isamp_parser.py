@@ -85,6 +85,48 @@ class IsampParserTestCase(unittest.TestCase):
             L.check(('rsempipeline.parsers.isamp_parser', 'ERROR',
                      "Ignored invalid row (1): ['GSE1', 'Homo sapiens', 'GSM']"))
 
+    def mock_open_csv(self, lines):
+        m  = mock.mock_open(read_data=os.linesep.join(lines))
+        m.return_value.__iter__ = lambda self: StringIO.StringIO(self.read())
+        m.return_value.__next__ = lambda self: self.readline()
+        return mock.patch('rsempipeline.parsers.isamp_parser.open', m)
+
+    @log_capture()
+    def test_read_csv_gse_as_key_with_priorities(self, L):
+        with self.mock_open_csv([
+                'GSE1,Homo sapiens,GSM1,10',
+                'GSE1,Homo sapiens,GSM2,',
+                'GSE2,Homo sapiens,GSM3',
+                'GSE2,Homo sapiens,GSM4,high']):
+            res = isamp_parser.read_csv_gse_as_key('infile.csv')
+        self.assertEqual(res, {
+            'GSE1': ['GSM1', 'GSM2'],
+            'GSE2': ['GSM3']
+        })
+        L.check(('rsempipeline.parsers.isamp_parser', 'ERROR',
+                 "Ignored invalid row (4): ['GSE2', 'Homo sapiens', 'GSM4', 'high']"))
+
+    def test_read_csv_priorities(self):
+        with self.mock_open_csv([
+                '# GSE,species,GSM,priority',
+                'GSE1,Homo sapiens,GSM1,10',
+                'GSE1,Homo sapiens,GSM2,20',
+                'GSE2,Homo sapiens,GSM3',
+                'GSE3,Homo sapiens,GSM4,-1',
+                'GSE4,Homo sapiens,GSM5,']):
+            res = isamp_parser.read_csv_priorities('infile.csv')
+        self.assertEqual(res, {'GSE1': 20, 'GSE3': -1})
+
+    @mock.patch('rsempipeline.parsers.isamp_parser.read_csv_priorities')
+    @mock.patch('rsempipeline.parsers.isamp_parser.os.path.exists')
+    def test_get_isamp_priorities(self, mock_exists, mock_read):
+        mock_exists.return_value = True
+        mock_read.return_value = {'GSE1': 1}
+        self.assertEqual(isamp_parser.get_isamp_priorities('GSE_species_GSM.csv'),
+                         {'GSE1': 1})
+        mock_exists.return_value = False
+        self.assertEqual(isamp_parser.get_isamp_priorities('GSE1 GSM1'), {})
+
     def test_gen_isamp_from_csv(self):
         m  = mock.mock_open(read_data=os.linesep.join(
             [
@@ -1,3 +1,4 @@
+import types
 import unittest
 import logging
 import logging.config
@@ -60,6 +61,40 @@ class SoftParserTestCase(unittest.TestCase):
                 ValueError, 'GSE00000 \(passed samples\: 0\/0\) != GSE43770', soft_parser.parse,
                 'GSE43770_family.soft.subset', ['Homo sapiens', 'Mus musculus'])
 
+    def test_split_line(self):
+        self.assertEqual(soft_parser.split_line('!Sample_type = SRA\n'),
+                         ('!Sample_type', 'SRA'))
+        self.assertEqual(soft_parser.split_line('!Sample_title = a=b'),
+                         ('!Sample_title', 'a=b'))
+
+    def test_iter_samples(self):
+        m = mock.mock_open()
+        with mock.patch('rsempipeline.parsers.soft_parser.open', m):
+            m.return_value.__iter__.return_value = settings.GSE43770_FAMILY_SOFT_SUBSET_CONTENT.splitlines()
+            parser = soft_parser.SoftParser('GSE43770_family.soft.subset',
+                                            ['Homo sapiens'])
+            res = parser.iter_samples()
+            self.assertIsInstance(res, types.GeneratorType)
+            first = next(res)
+            # samples are yielded incrementally
+            self.assertEqual(first.name, 'GSM1070765')
+            self.assertEqual(parser.series.num_samples(), 1)
+            self.assertEqual([_.name for _ in res], ['GSM1070766', 'GSM1070767'])
+            self.assertEqual(parser.series.num_passed_samples(), 2)
+
+    def test_parse_full_soft_file(self):
+        m = mock.mock_open()
+        with mock.patch('rsempipeline.parsers.soft_parser.open', m):
+            m.return_value.__iter__.return_value = settings.GSE43770_FAMILY_SOFT_CONTENT.splitlines()
+            series = soft_parser.parse('GSE43770_family.soft',
+                                       ['Homo sapiens', 'Mus musculus'])
+            self.assertEqual(series.name, 'GSE43770')
+            # GSM1070766 is discarded because of its organism
+            self.assertEqual([__.name for __ in series.samples], ['GSM1070765'])
+            sample = series.passed_samples[0]
+            self.assertEqual(sample.organism, 'Homo sapiens')
+            self.assertEqual(sample.url, 'ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX219/SRX219901')
+
 
 # class SOFTDownloaderTestCase(unittest.TestCase):
 #     gse1 = 'GSE45284'           # a real one
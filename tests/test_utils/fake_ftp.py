@@ -0,0 +1,143 @@
+"""
+An in-memory stand-in for an FTP server such as ftp-trace.ncbi.nlm.nih.gov,
+with the subset of the ftplib.FTP interface used by rsempipeline
+"""
+
+import os
+import ftplib
+import threading
+
+
+SRX_PARENT_DIR = '/sra/sra-instant/reads/ByExp/sra/SRX/SRX029'
+
+
+def gen_tree(num_srxs, num_srrs=2, size=1024 ** 2):
+    """
+    generate files of SRX029000, SRX029001, ..., each with num_srrs SRRs of
+    one sra file, keyed by absolute path
+    """
+    files = {}
+    for i in xrange(num_srxs):
+        srx = 'SRX{0:06d}'.format(29000 + i)
+        for j in xrange(num_srrs):
+            srr = 'SRR{0:06d}{1}'.format(29000 + i, j)
+            path = os.path.join(SRX_PARENT_DIR, srx, srr, srr + '.sra')
+            files[path] = size + i + j
+    return files
+
+
+class FakeFTPServer(object):
+    def __init__(self, files):
+        """
+        :param files: a dict of file sizes keyed by absolute path
+        """
+        self.files = files
+        self.dirs = set()
+        for path in files:
+            dir_ = os.path.dirname(path)
+            while dir_ not in self.dirs and dir_ != '/':
+                self.dirs.add(dir_)
+                dir_ = os.path.dirname(dir_)
+        self.lock = threading.Lock()
+        self.num_connections = 0
+        self.num_commands = 0
+        # the number of commands before the next dropped connection, None
+        # means never drop
+        self.drop_after = None
+        self.mlsd = True
+
+    def connect(self, host=''):
+        with self.lock:
+            self.num_connections += 1
+        return FakeFTP(self, host or 'ftp-trace.ncbi.nlm.nih.gov')
+
+    def command(self):
+        with self.lock:
+            self.num_commands += 1
+            if self.drop_after is not None:
+                if self.drop_after == 0:
+                    self.drop_after = None
+                    raise EOFError('connection dropped')
+                self.drop_after -= 1
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/'
+        names = set()
+        for _ in self.dirs.union(self.files):
+            if _.startswith(prefix):
+                names.add(_[len(prefix):].split('/')[0])
+        return sorted(names)
+
+
+class FakeFTP(object):
+    def __init__(self, server, host='ftp-trace.ncbi.nlm.nih.gov'):
+        self.server = server
+        self.host = host
+        self.pwd = '/'
+        self.closed = False
+
+    def abspath(self, path):
+        return os.path.normpath(os.path.join(self.pwd, path))
+
+    def command(self):
+        if self.closed:
+            raise EOFError('connection closed')
+        self.server.command()
+
+    def login(self, *args):
+        self.command()
+
+    def cwd(self, path):
+        self.command()
+        path = self.abspath(path)
+        if path not in self.server.dirs:
+            raise ftplib.error_perm('550 {0}: No such directory'.format(path))
+        self.pwd = path
+
+    def nlst(self, path):
+        """like the NCBI server, names are prefixed with the path listed"""
+        self.command()
+        return [os.path.join(path, _)
+                for _ in self.server.listdir(self.abspath(path))]
+
+    def retrlines(self, cmd, callback):
+        """MLSD and LIST, like vsftpd, LIST is in the ls -l format"""
+        self.command()
+        verb, _, path = cmd.partition(' ')
+        if verb == 'MLSD' and not self.server.mlsd:
+            raise ftplib.error_perm('500 Unknown command.')
+        path = self.abspath(path)
+        if path not in self.server.dirs:
+            raise ftplib.error_perm('550 Failed to open directory.')
+        if verb == 'MLSD':
+            callback('type=cdir;modify=20140829161604; .')
+        for name in self.server.listdir(path):
+            child = os.path.join(path, name)
+            if verb == 'MLSD':
+                if child in self.server.dirs:
+                    callback('type=dir;modify=20140829161604; {0}'.format(name))
+                else:
+                    callback('type=file;size={0};modify=20140829161604; '
+                             '{1}'.format(self.server.files[child], name))
+            elif child in self.server.dirs:
+                callback('drwxr-xr-x    2 ftp      ftp          4096 Aug 29  '
+                         '2014 {0}'.format(name))
+            else:
+                callback('-r--r--r--    1 ftp      ftp    {0:>10d} Aug 29  '
+                         '2014 {1}'.format(self.server.files[child], name))
+        return '226 Transfer complete.'
+
+    def sendcmd(self, cmd):
+        self.command()
+        return '200 {0}'.format(cmd)
+
+    def size(self, path):
+        self.command()
+        return self.server.files[self.abspath(path)]
+
+    def quit(self):
+        self.command()
+        self.closed = True
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,101 @@
+"""
+A local ssh server stub built with paramiko, which accepts a single public key
+and answers commands from a dict instead of executing them
+"""
+
+import time
+import socket
+import threading
+
+import paramiko
+
+
+class StubServerInterface(paramiko.ServerInterface):
+    def __init__(self, server):
+        self.server = server
+        self.event = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        if username == self.server.username and key == self.server.client_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_exec_request(self, channel, command):
+        self.server.commands.append(command)
+        output = self.server.outputs.get(command, '')
+        # answered in a thread, since the reply to the exec request is only
+        # sent after this returns
+        thread = threading.Thread(target=self.reply, args=(channel, output))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def reply(self, channel, output):
+        # give the transport time to send the reply to the exec request,
+        # otherwise the client may see the channel closed before it
+        time.sleep(0.05)
+        channel.sendall(output)
+        channel.send_exit_status(0)
+        channel.close()
+
+
+class StubSSHServer(object):
+    """
+    :param client_key: the paramiko.RSAKey clients authenticate with
+    :param outputs: a dict of the stdout of each command
+    """
+    host_key = None
+
+    def __init__(self, client_key, username='username', outputs=None):
+        if StubSSHServer.host_key is None:
+            StubSSHServer.host_key = paramiko.RSAKey.generate(1024)
+        self.client_key = client_key
+        self.username = username
+        self.outputs = outputs or {}
+        self.commands = []
+        self.transports = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(10)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def num_connections(self):
+        return len(self.transports)
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=StubServerInterface(self))
+            self.transports.append(transport)
+
+    def drop_connections(self):
+        """close connections from the server side"""
+        for transport in self.transports:
+            transport.close()
+
+    def close(self):
+        self.drop_connections()
+        try:
+            # wakes up accept in serve
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
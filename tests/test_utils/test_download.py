@@ -1,3 +1,10 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
 import mock
 import unittest
 
@@ -32,7 +39,7 @@ class UtilsDownloadTestCase(unittest.TestCase):
         sample.outdir = 'some_outdir/GSE123456/some_species/GSM1'
         series.add_passed_sample(sample)
 
-        with mock.patch('rsempipeline.utils.download.open',
+        with mock.patch('rsempipeline.utils.sras_info_store.open',
                         mock.mock_open(read_data=SRA_INFO_YAML_SINGLE_SRA)):
             vals = download.gen_orig_params_per(sample)
         self.assertEqual(vals, [
@@ -47,7 +54,7 @@ class UtilsDownloadTestCase(unittest.TestCase):
         sample.outdir = 'some_outdir/GSE123456/some_species/GSM1'
         series.add_passed_sample(sample)
 
-        with mock.patch('rsempipeline.utils.download.open',
+        with mock.patch('rsempipeline.utils.sras_info_store.open',
                         mock.mock_open(read_data=SRA_INFO_YAML_MULTIPLE_SRAS)):
             vals = download.gen_orig_params_per(sample)
         self.assertEqual(vals, [
@@ -65,3 +72,97 @@ class UtilsDownloadTestCase(unittest.TestCase):
         self.assertEqual(download.gen_orig_params(mock_samples),
                          [None, ['path/to/sra', 'path/to/sra.download.COMPLETE'], 'mock_sample',
                           None, ['path/to/sra', 'path/to/sra.download.COMPLETE'], 'mock_sample'])
+
+    def test_get_sra_info(self):
+        gsm_dir = 'some_outdir/GSE123456/some_species/GSM1'
+        with mock.patch('rsempipeline.utils.sras_info_store.open',
+                        mock.mock_open(read_data=SRA_INFO_YAML_MULTIPLE_SRAS)):
+            self.assertEqual(
+                download.get_sra_info(gsm_dir, os.path.join(gsm_dir, 'SRX135160/SRR453142/SRR453142.sra')),
+                {'readable_size': '3.8 GB', 'size': 4106298857})
+        with mock.patch('rsempipeline.utils.sras_info_store.open',
+                        mock.mock_open(read_data=SRA_INFO_YAML_MULTIPLE_SRAS)):
+            self.assertEqual(
+                download.get_sra_info(gsm_dir, os.path.join(gsm_dir, 'SRX1/SRR1/SRR1.sra')), {})
+
+
+class VerifySRATestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.sra = os.path.join(self.tmp_dir, 'SRR1.sra')
+        with open(self.sra, 'wb') as opf:
+            opf.write('x' * 100)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_verified(self):
+        self.assertIsNone(download.verify_sra(self.sra))
+        self.assertIsNone(download.verify_sra(self.sra, 100))
+        self.assertIsNone(download.verify_sra(
+            self.sra, 100, hashlib.md5('x' * 100).hexdigest()))
+
+    def test_not_found(self):
+        self.assertEqual(download.verify_sra(self.sra + '.missing', 100), 'not found')
+
+    def test_size_mismatch(self):
+        self.assertEqual(download.verify_sra(self.sra, 200),
+                         'size is 100, expected 200')
+
+    def test_md5_mismatch(self):
+        self.assertEqual(download.verify_sra(self.sra, 100, 'abc'),
+                         'md5 is {0}, expected abc'.format(hashlib.md5('x' * 100).hexdigest()))
+
+
+class DownloadSchedulerTestCase(unittest.TestCase):
+    def tearDown(self):
+        download._scheduler = None
+
+    def test_parse_rate(self):
+        self.assertEqual(download.parse_rate('300m'), 300000)
+        self.assertEqual(download.parse_rate('1.5G'), 1500000)
+        self.assertEqual(download.parse_rate('800'), 800)
+        self.assertEqual(download.parse_rate('100 Mbps'), 100000)
+        self.assertRaisesRegexp(ValueError, 'invalid rate: fast',
+                                download.parse_rate, 'fast')
+
+    def test_rate_limit(self):
+        self.assertIsNone(download.get_rate_limit())
+        download.init_scheduler(ascp_jobs=4, bandwidth='300m')
+        self.assertEqual(download.get_rate_limit(), '75000k')
+        download.init_scheduler(bandwidth='300m')
+        self.assertEqual(download.get_rate_limit(), '300000k')
+        # without ASCP_JOBS, up to -j ascp run at the same time
+        download.init_scheduler(bandwidth='300m', jobs=6)
+        self.assertEqual(download.get_rate_limit(), '50000k')
+        download.init_scheduler(ascp_jobs=4, bandwidth='300m', jobs=6)
+        self.assertEqual(download.get_rate_limit(), '75000k')
+        download.init_scheduler(ascp_jobs=4)
+        self.assertIsNone(download.get_rate_limit())
+
+    def test_download_slot_without_scheduler(self):
+        with download.download_slot('ascp'):
+            pass
+
+    def test_download_slot(self):
+        download.init_scheduler(ascp_jobs=2, wget_jobs=1)
+        lock = threading.Lock()
+        running = {'ascp': 0, 'wget': 0}
+        max_running = {'ascp': 0, 'wget': 0}
+
+        def run(tool):
+            with download.download_slot(tool):
+                with lock:
+                    running[tool] += 1
+                    max_running[tool] = max(max_running[tool], running[tool])
+                time.sleep(0.02)
+                with lock:
+                    running[tool] -= 1
+
+        threads = [threading.Thread(target=run, args=(tool,))
+                   for tool in ['ascp', 'wget'] * 5]
+        for _ in threads:
+            _.start()
+        for _ in threads:
+            _.join()
+        self.assertEqual(max_running, {'ascp': 2, 'wget': 1})
@@ -0,0 +1,83 @@
+import ftplib
+import unittest
+
+import mock
+
+from rsempipeline.utils import ftp_listing
+
+from fake_ftp import FakeFTPServer, gen_tree, SRX_PARENT_DIR
+
+
+class FTPListingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeFTPServer(gen_tree(1))
+        self.ftp = self.server.connect()
+
+    def tearDown(self):
+        ftp_listing.NO_MLSD_HOSTS.clear()
+
+    def test_parse_mlsd_line(self):
+        self.assertEqual(
+            ftp_listing.parse_mlsd_line(
+                'Type=File;Size=1443785368;Modify=20140829161604; SRR1557065.sra'),
+            ('SRR1557065.sra',
+             {'type': 'file', 'size': '1443785368', 'modify': '20140829161604'}))
+
+    def test_parse_mlsd_line_name_with_spaces(self):
+        self.assertEqual(ftp_listing.parse_mlsd_line('type=dir; some dir'),
+                         ('some dir', {'type': 'dir'}))
+
+    def test_parse_list_line(self):
+        self.assertEqual(
+            ftp_listing.parse_list_line(
+                '-r--r--r--   1 ftp      anonymous 1443785368 Aug 29  2014 SRR1557065.sra'),
+            ('SRR1557065.sra', {'type': 'file', 'size': '1443785368'}))
+
+    def test_parse_list_line_dir(self):
+        self.assertEqual(
+            ftp_listing.parse_list_line(
+                'drwxr-xr-x   4 ftp      anonymous 4096 Aug 29 16:04 SRR1557065'),
+            ('SRR1557065', {'type': 'dir', 'size': '4096'}))
+
+    def test_parse_list_line_link(self):
+        self.assertEqual(
+            ftp_listing.parse_list_line(
+                'lrwxrwxrwx   1 ftp      anonymous 10 Aug 29  2014 a -> b'),
+            ('a', {'type': 'link', 'size': '10'}))
+
+    def test_parse_list_line_invalid(self):
+        self.assertIsNone(ftp_listing.parse_list_line('total 8'))
+
+    def test_listdir_mlsd(self):
+        res = ftp_listing.listdir(self.ftp, SRX_PARENT_DIR + '/SRX029000')
+        self.assertEqual(res, [
+            ('SRR0290000', {'type': 'dir', 'modify': '20140829161604'}),
+            ('SRR0290001', {'type': 'dir', 'modify': '20140829161604'})])
+        self.assertEqual(self.server.num_commands, 1)
+
+    def test_listdir_list(self):
+        res = ftp_listing.listdir(
+            self.ftp, SRX_PARENT_DIR + '/SRX029000/SRR0290000', 'list')
+        self.assertEqual(res, [
+            ('SRR0290000.sra', {'type': 'file', 'size': '1048576'})])
+
+    def test_listdir_falls_back_to_list(self):
+        self.server.mlsd = False
+        path = SRX_PARENT_DIR + '/SRX029000/SRR0290000'
+        with mock.patch.object(self.ftp, 'retrlines',
+                               wraps=self.ftp.retrlines) as mock_retrlines:
+            res1 = ftp_listing.listdir(self.ftp, path)
+            res2 = ftp_listing.listdir(self.ftp, path)
+        self.assertEqual(res1, [
+            ('SRR0290000.sra', {'type': 'file', 'size': '1048576'})])
+        self.assertEqual(res1, res2)
+        # MLSD isn't tried again after the first failure
+        self.assertEqual([_[0][0] for _ in mock_retrlines.call_args_list],
+                         ['MLSD ' + path, 'LIST ' + path, 'LIST ' + path])
+        self.assertEqual(ftp_listing.NO_MLSD_HOSTS,
+                         set(['ftp-trace.ncbi.nlm.nih.gov']))
+
+    def test_listdir_mlsd_other_error(self):
+        self.assertRaises(ftplib.error_perm, ftp_listing.listdir,
+                          self.ftp, '/non_existent')
+        self.assertEqual(ftp_listing.NO_MLSD_HOSTS, set())
@@ -0,0 +1,79 @@
+import ftplib
+import threading
+import unittest
+
+import mock
+
+from rsempipeline.utils.ftp_pool import FTPPool
+
+from fake_ftp import FakeFTPServer, gen_tree
+
+
+class FTPPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeFTPServer(gen_tree(2))
+        self.pool = FTPPool(self.server.connect, size=2, max_retries=2)
+
+    def test_get_lazily(self):
+        self.assertEqual(self.server.num_connections, 0)
+        ftp = self.pool.get()
+        self.assertEqual(self.server.num_connections, 1)
+        self.assertEqual(self.pool.num_sessions, 1)
+        self.pool.put(ftp)
+        self.assertIs(self.pool.get(), ftp)
+        self.assertEqual(self.server.num_connections, 1)
+
+    def test_get_waits_when_full(self):
+        ftp1, ftp2 = self.pool.get(), self.pool.get()
+        self.assertIsNot(ftp1, ftp2)
+        res = []
+        thread = threading.Thread(target=lambda: res.append(self.pool.get()))
+        thread.start()
+        thread.join(0.05)
+        self.assertTrue(thread.is_alive())
+        self.pool.put(ftp1)
+        thread.join(1)
+        self.assertEqual(res, [ftp1])
+        self.assertEqual(self.server.num_connections, 2)
+
+    def test_get_connect_failure(self):
+        pool = FTPPool(mock.Mock(side_effect=EOFError), size=1)
+        self.assertRaises(EOFError, pool.get)
+        self.assertEqual(pool.num_sessions, 0)
+
+    def test_run(self):
+        res = self.pool.run(lambda path, ftp: ftp.nlst(path), '/sra')
+        self.assertEqual(res, ['/sra/sra-instant'])
+        self.assertEqual(self.pool.idle.qsize(), 1)
+
+    def test_run_reconnect(self):
+        ftp = self.pool.get()
+        self.pool.put(ftp)
+        self.server.drop_after = 0
+        res = self.pool.run(lambda path, ftp: ftp.nlst(path), '/sra')
+        self.assertEqual(res, ['/sra/sra-instant'])
+        self.assertTrue(ftp.closed)
+        self.assertEqual(self.server.num_connections, 2)
+        self.assertEqual(self.pool.num_sessions, 1)
+
+    def test_run_reconnect_exhausted(self):
+        func = mock.Mock(side_effect=EOFError)
+        self.assertRaises(EOFError, self.pool.run, func)
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(self.pool.num_sessions, 0)
+
+    def test_run_other_error(self):
+        self.assertRaises(ftplib.error_perm, self.pool.run,
+                          lambda path, ftp: ftp.cwd(path), '/non_existent')
+        # the session is still usable, so it's returned to the pool
+        self.assertEqual(self.pool.idle.qsize(), 1)
+        self.assertEqual(self.pool.num_sessions, 1)
+
+    def test_close(self):
+        ftp1, ftp2 = self.pool.get(), self.pool.get()
+        self.pool.put(ftp1)
+        self.pool.put(ftp2)
+        self.pool.close()
+        self.assertTrue(ftp1.closed)
+        self.assertTrue(ftp2.closed)
+        self.assertEqual(self.pool.num_sessions, 0)
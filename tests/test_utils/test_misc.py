@@ -268,6 +268,18 @@ class MiscTestCase(unittest.TestCase):
         # exabyte is not handled yet
         self.assertRaises(ValueError, misc.ugly_usage, '1.5 EB')
 
+    def test_list_dir(self):
+        fake_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(fake_dir, 'sub_dir'))
+        open(os.path.join(fake_dir, 'some_file'), 'wb').close()
+        os.symlink(os.path.join(fake_dir, 'sub_dir'), os.path.join(fake_dir, 'link'))
+        dirs, files = misc.list_dir(fake_dir)
+        self.assertEqual((dirs, sorted(files)), (['sub_dir'], ['link', 'some_file']))
+        with mock.patch('rsempipeline.utils.misc.scandir', None):
+            dirs, files = misc.list_dir(fake_dir)
+        self.assertEqual((dirs, sorted(files)), (['sub_dir'], ['link', 'some_file']))
+        shutil.rmtree(fake_dir)
+
     def test_disk_used(self):
         fake_dir = tempfile.mkdtemp(suffix='_rsem_testing')
         # Good to know: that the size of a directory can be very different on
@@ -287,10 +299,80 @@ class MiscTestCase(unittest.TestCase):
         self.assertEqual(size_fake_f2, 1)
         self.assertEqual(size_fake_f3, 3)
         # NOTE: the size of directory is not included!
-        self.assertEqual(misc.disk_used(fake_dir), 4)
+        self.assertEqual(misc.disk_used(fake_dir, apparent_size=True), 4)
         shutil.rmtree(fake_dir)
         self.assertFalse(os.path.exists(fake_dir))
 
+    def gen_tree(self):
+        top_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.addCleanup(shutil.rmtree, top_dir)
+        for i in range(3):
+            sub_dir = os.path.join(top_dir, 'GSE{0}'.format(i), 'GSM{0}'.format(i))
+            os.makedirs(sub_dir)
+            for j in range(i + 1):
+                with open(os.path.join(sub_dir, '{0}.sra'.format(j)), 'wb') as opf:
+                    opf.write('1' * 5000 * (j + 1))
+        return top_dir
+
+    def test_disk_used_counts_blocks(self):
+        top_dir = self.gen_tree()
+        expected = 0
+        for dirpath, dirnames, filenames in os.walk(top_dir):
+            for name in [dirpath] + [os.path.join(dirpath, _) for _ in filenames]:
+                expected += os.lstat(name).st_blocks * 512
+        self.assertEqual(misc.disk_used(top_dir), expected)
+
+    def test_disk_used_with_threads(self):
+        top_dir = self.gen_tree()
+        self.assertEqual(misc.disk_used(top_dir, num_threads=4),
+                         misc.disk_used(top_dir))
+        self.assertEqual(misc.disk_used(top_dir, num_threads=4, apparent_size=True),
+                         5000 + 5000 * 3 + 5000 * 6)
+
+    def test_disk_used_counts_hard_links_once(self):
+        top_dir = self.gen_tree()
+        src = os.path.join(top_dir, 'GSE2', 'GSM2', '2.sra')
+        before = misc.disk_used(top_dir)
+        os.link(src, os.path.join(top_dir, 'GSE0', 'GSM0', 'linked.sra'))
+        self.assertEqual(misc.disk_used(top_dir), before)
+
+    def test_disk_used_skips_vanished_entries(self):
+        top_dir = self.gen_tree()
+        gone = os.path.join(top_dir, 'GSE0', 'gone.sra')
+        expected = misc.disk_used(top_dir)
+
+        def remove_gone(dir_):
+            # gone.sra is listed, but removed before it's stat'ed
+            if dir_ == os.path.dirname(gone) and os.path.exists(gone):
+                os.remove(gone)
+
+        real_scandir, real_listdir = misc.scandir, os.listdir
+
+        def fake_scandir(dir_):
+            entries = list(real_scandir(dir_))
+            remove_gone(dir_)
+            return entries
+
+        def fake_listdir(dir_):
+            names = real_listdir(dir_)
+            remove_gone(dir_)
+            return names
+
+        for scandir in [fake_scandir, None]:
+            with open(gone, 'wb') as opf:
+                opf.write('1')
+            with mock.patch.object(misc, 'scandir', scandir), \
+                    mock.patch.object(misc.os, 'listdir', side_effect=fake_listdir):
+                # GSE0/GSM0 next to it is still counted
+                self.assertEqual(misc.disk_used(top_dir), expected)
+            self.assertFalse(os.path.exists(gone))
+
+    def test_disk_used_skips_unreadable_dirs(self):
+        top_dir = self.gen_tree()
+        with mock.patch.object(misc, 'scandir', side_effect=OSError('gone')):
+            self.assertEqual(misc.disk_used(top_dir),
+                             os.lstat(top_dir).st_blocks * 512)
+
 
     @mock.patch('rsempipeline.utils.misc.subprocess')
     def test_get_local_free_disk_space(self, mock_subprocess):
@@ -301,6 +383,15 @@ class MiscTestCase(unittest.TestCase):
             None)
         self.assertEqual(misc.disk_free(fake_df_cmd), 3333333333 * 1024)
 
+    @mock.patch('rsempipeline.utils.misc.subprocess')
+    def test_get_local_free_disk_space_with_statvfs(self, mock_subprocess):
+        fake_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.addCleanup(shutil.rmtree, fake_dir)
+        st = os.statvfs(fake_dir)
+        self.assertEqual(misc.disk_free(None, fake_dir), st.f_bavail * st.f_frsize)
+        self.assertEqual(misc.disk_free('', fake_dir), st.f_bavail * st.f_frsize)
+        self.assertFalse(mock_subprocess.Popen.called)
+
     def test_calc_free_space_to_use(self):
         # The following 3 assertions correspond to 3 cases where max_usage
         # could point to
@@ -310,25 +401,12 @@ class MiscTestCase(unittest.TestCase):
         # when free < min_free
         self.assertEqual(misc.calc_free_space_to_use(10, 90, 100, 200), 0)
 
-    def test_is_empty_dir(self):
-        self.assertFalse(misc.is_empty_dir('/p', ['/p', '/p/a.txt']))
-        self.assertTrue(misc.is_empty_dir('/p', ['/p', '/s', '/s/a.txt']))
-
-    @mock.patch('rsempipeline.utils.misc.paramiko')
-    def test_sshexec(self, mock_paramiko):
-        mock_paramiko.Transport().open_session().makefile().readlines.return_value = ['some_output\n']
+    @mock.patch('rsempipeline.utils.misc.ssh_pool.get_manager')
+    def test_sshexec(self, mock_get_manager):
+        mock_get_manager().exec_command.return_value = ['some_output\n']
         self.assertEqual(misc.sshexec('cmd', 'host', 'username'), ['some_output\n'])
-        # interestingly, Transpost is called twice while in the code, it's
-        # explicitly called only once
-        self.assertEqual(mock_paramiko.Transport.call_args_list,
-                         [mock.call(), mock.call(('host', 22))])
-
-    @mock.patch('rsempipeline.utils.misc.paramiko')
-    def test_sshexec_execution_failed_remotely(self, mock_paramiko):
-        mock_paramiko.Transport().open_session().makefile().readlines.return_value = None
-        self.assertIsNone(misc.sshexec('cmd', 'host', 'username'))
-        self.assertEqual(mock_paramiko.Transport.call_args_list,
-                         [mock.call(), mock.call(('host', 22))])
+        mock_get_manager().exec_command.assert_called_once_with(
+            'cmd', 'host', 'username', '~/.ssh/id_rsa')
 
 
 if __name__ == "__main__":
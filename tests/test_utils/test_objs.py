@@ -1,3 +1,4 @@
+import pickle
 import unittest
 
 import mock
@@ -30,6 +31,33 @@ class SeriesTestCase(unittest.TestCase):
         self.assertEqual(self.series.num_samples(), 2)
         self.assertEqual(self.series.num_passed_samples(), 1)
 
+    def test_passed_samples_keep_order(self):
+        samples = [Sample('GSM{0}'.format(_), self.series) for _ in range(5)]
+        for k, sample in enumerate(samples):
+            if k % 2 == 0:
+                self.series.add_passed_sample(sample)
+            else:
+                self.series.add_sample(sample)
+        self.assertEqual(self.series.samples, samples)
+        self.assertEqual(self.series.passed_samples, samples[::2])
+        self.assertEqual(self.series.num_passed_samples(), 3)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.series, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.series, 'whatever', 1)
+
+    def test_pickle(self):
+        sample1 = Sample('GSM1', self.series, organism='Homo sapiens')
+        sample2 = Sample('GSM2', self.series)
+        self.series.add_passed_sample(sample1)
+        self.series.add_sample(sample2)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            series = pickle.loads(pickle.dumps(self.series, protocol))
+            self.assertEqual(str(series), 'GSE123456 (passed samples: 1/2)')
+            self.assertEqual([_.name for _ in series.passed_samples], ['GSM1'])
+            self.assertIs(series.samples[0].series, series)
+            self.assertIs(series.samples[0].organism, intern('Homo sapiens'))
+
     def test___str__(self):
         self.assertEqual(str(self.series), 'GSE123456 (passed samples: 0/0)')
 
@@ -50,6 +78,17 @@ class SampleTestCase(unittest.TestCase):
         self.sample.url = 'ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX000/SRX000000'
         self.assertTrue(self.sample.is_info_complete())
 
+    def test_organism_interned(self):
+        organism = ''.join(['Mus', ' ', 'musculus'])
+        self.sample.organism = organism
+        other = Sample('GSM2', self.series, organism='Mus musculus')
+        self.assertIs(self.sample.organism, other.organism)
+        self.sample.organism = None
+        self.assertIsNone(self.sample.organism)
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.sample, '__dict__'))
+
     @mock.patch('rsempipeline.utils.objs.Sample.is_info_complete')
     def test_gen_outdir(self, mock_is_info_complete):
         self.sample.organism = 'Mus musculus'
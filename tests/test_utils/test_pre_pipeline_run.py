@@ -6,6 +6,8 @@ from testfixtures import log_capture
 from rsempipeline.utils.objs import Series, Sample
 from rsempipeline.utils import pre_pipeline_run as ppr
 
+from fake_ftp import FakeFTPServer, gen_tree, SRX_PARENT_DIR
+
 
 SRA_INFO_YAML_SINGLE_SRA = """- SRX685892/SRR1557065/SRR1557065.sra:
     readable_size: 2.4 GB
@@ -29,12 +31,12 @@ class PrePipelineRunTestCase(unittest.TestCase):
         mock_FTP.assert_called_once_with('ftp-trace.ncbi.nlm.nih.gov')
         self.assertEqual(mock_FTP.return_value.login.call_count, 1)
 
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.write', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.get_ftp_handler', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_per', autospec=True)
-    def test_fetch_sras_info_from_scratch(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_os):
-        mock_os.path.exists.return_value = False
+    def test_fetch_sras_info_from_scratch(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_has):
+        mock_has.return_value = False
         mock_fetch.return_value = PARSED_SRA_INFO_YAML_SINGLE_SRA
         ppr.fetch_sras_info(samples=[mock.Mock(), mock.Mock()],
                             flag_recreate_sras_info=False)
@@ -42,25 +44,25 @@ class PrePipelineRunTestCase(unittest.TestCase):
         self.assertEqual(mock_fetch.call_count, 2)
         self.assertEqual(mock_write.call_count, 2)
 
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.write', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.get_ftp_handler', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_per', autospec=True)
-    def test_fetch_sras_info_with_already_existent_yml(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_os):
-        mock_os.path.exists.return_value = True
+    def test_fetch_sras_info_with_already_existent_yml(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_has):
+        mock_has.return_value = True
         mock_fetch.return_value = PARSED_SRA_INFO_YAML_SINGLE_SRA
         ppr.fetch_sras_info(samples=[mock.Mock(), mock.Mock()],
                             flag_recreate_sras_info=False)
-        self.assertEqual(mock_get_ftp_handler.call_count, 1)
+        self.assertEqual(mock_get_ftp_handler.call_count, 0)
         self.assertEqual(mock_fetch.call_count, 0)
         self.assertEqual(mock_write.call_count, 0)
 
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.write', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.get_ftp_handler', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_per', autospec=True)
-    def test_fetch_sras_info_recreate(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_os):
-        mock_os.path.exists.return_value = True
+    def test_fetch_sras_info_recreate(self, mock_fetch, mock_get_ftp_handler, mock_write, mock_has):
+        mock_has.return_value = True
         mock_fetch.return_value = PARSED_SRA_INFO_YAML_SINGLE_SRA
         ppr.fetch_sras_info(samples=[mock.Mock(), mock.Mock()],
                             flag_recreate_sras_info=True)
@@ -68,6 +70,158 @@ class PrePipelineRunTestCase(unittest.TestCase):
         self.assertEqual(mock_fetch.call_count, 2)
         self.assertEqual(mock_write.call_count, 2)
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
+    def test_fetch_sras_info_with_fake_ftp_server(self, mock_save, mock_has):
+        mock_has.return_value = False
+        server = FakeFTPServer(gen_tree(10))
+        # one dropped connection in the middle
+        server.drop_after = 20
+        samples = []
+        for k in range(10):
+            sample = mock.Mock()
+            sample.url = 'ftp://ftp-trace.ncbi.nlm.nih.gov{0}/SRX{1:06d}'.format(
+                SRX_PARENT_DIR, 29000 + k)
+            sample.outdir = 'GSM{0}'.format(k)
+            samples.append(sample)
+        with mock.patch('rsempipeline.utils.pre_pipeline_run.FTP',
+                        side_effect=server.connect):
+            ppr.fetch_sras_info(samples, False, num_sessions=3)
+        self.assertLessEqual(server.num_connections, 4)
+        saved = dict(_[0] for _ in mock_save.call_args_list)
+        self.assertEqual(sorted(saved.keys()), ['GSM{0}'.format(_) for _ in range(10)])
+        self.assertEqual(saved['GSM1'], [
+            {'SRX029001/SRR0290010/SRR0290010.sra': {
+                'size': 1048577, 'readable_size': '1.0 MB'}},
+            {'SRX029001/SRR0290011/SRR0290011.sra': {
+                'size': 1048578, 'readable_size': '1.0 MB'}}])
+
+    def test_fetch_sras_info_with_pool_failed(self):
+        ftp_pool = mock.Mock()
+        ftp_pool.run.side_effect = EOFError
+        sample = mock.Mock()
+        self.assertEqual(ppr.fetch_sras_info_with_pool(sample, ftp_pool),
+                         (sample, None))
+
+    def test_fetch_sras_info_per_connection_error(self):
+        mock_ftp_handler = mock.Mock()
+        mock_ftp_handler.nlst.side_effect = EOFError
+        fake_sample_url = 'ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX029/SRX029242'
+        self.assertRaises(EOFError, ppr.fetch_sras_info_per,
+                          fake_sample_url, mock_ftp_handler)
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.time', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.record_fetch_failures', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_ftp_handler', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_per', autospec=True)
+    def test_fetch_sras_info_retry(self, mock_fetch, mock_get_ftp_handler,
+                                   mock_save, mock_has, mock_record, mock_time):
+        mock_has.return_value = False
+        mock_time.time.return_value = 1000
+        s1, s2 = mock.Mock(outdir='GSM1'), mock.Mock(outdir='GSM2')
+        results = {'GSM1': [None, None, PARSED_SRA_INFO_YAML_SINGLE_SRA],
+                   'GSM2': [PARSED_SRA_INFO_YAML_SINGLE_SRA]}
+        mock_fetch.side_effect = lambda url, ftp, listing: results[url].pop(0)
+        s1.url, s2.url = 'GSM1', 'GSM2'
+        res = ppr.fetch_sras_info([s1, s2], False, retries=3, backoff=10)
+        self.assertEqual(res, [])
+        self.assertEqual(mock_fetch.call_count, 4)
+        self.assertEqual(mock_save.call_args_list, [
+            mock.call('GSM2', PARSED_SRA_INFO_YAML_SINGLE_SRA),
+            mock.call('GSM1', PARSED_SRA_INFO_YAML_SINGLE_SRA)])
+        self.assertEqual(mock_time.sleep.call_args_list,
+                         [mock.call(10), mock.call(20)])
+        self.assertEqual(mock_record.call_args_list, [
+            mock.call(['GSM1']), mock.call(['GSM1']), mock.call([])])
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.time', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.record_fetch_failures', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.save_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_ftp_handler', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_per', autospec=True)
+    def test_fetch_sras_info_retry_exhausted(self, mock_fetch, mock_get_ftp_handler,
+                                             mock_save, mock_has, mock_record, mock_time):
+        mock_has.return_value = False
+        mock_time.time.return_value = 1000
+        mock_fetch.return_value = None
+        sample = mock.Mock(outdir='GSM1')
+        res = ppr.fetch_sras_info([sample], False, retries=2, backoff=10)
+        self.assertEqual(res, [sample])
+        self.assertEqual(mock_fetch.call_count, 3)
+        self.assertEqual(mock_time.sleep.call_args_list,
+                         [mock.call(10), mock.call(20)])
+        self.assertEqual(mock_record.call_count, 3)
+        self.assertFalse(mock_save.called)
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.time', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.get_fetch_failures', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.get_fetch_retry_time', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.record_fetch_failures', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.fetch_sras_info_pass', autospec=True)
+    def test_fetch_sras_info_backed_off_across_runs(self, mock_pass, mock_has, mock_record,
+                                                    mock_retry_time, mock_failures, mock_time):
+        mock_has.return_value = False
+        mock_time.time.return_value = 1000
+        s1, s2, s3 = [mock.Mock(outdir=_) for _ in ['GSM1', 'GSM2', 'GSM3']]
+        # GSM1 failed recently, GSM2 failed long ago, GSM3 never failed
+        mock_retry_time.side_effect = lambda gsm_dir, backoff, max_backoff: {
+            'GSM1': 1060, 'GSM2': 900, 'GSM3': 0}[gsm_dir]
+        mock_failures.side_effect = lambda gsm_dir: {'GSM1': 2, 'GSM2': 5, 'GSM3': 0}[gsm_dir]
+        mock_pass.return_value = []
+        res = ppr.fetch_sras_info([s1, s2, s3], False, backoff=30, max_backoff=600)
+        # the deferred one is returned as failed
+        self.assertEqual(res, [s1])
+        mock_pass.assert_called_once_with([s3, s2], 1, 'nlst')
+        mock_retry_time.assert_any_call('GSM1', 30, 600)
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.has_sras_info', autospec=True)
+    def test_skip_samples_without_sras_info(self, mock_has):
+        s1, s2 = mock.Mock(outdir='GSM1'), mock.Mock(outdir='GSM2')
+        mock_has.side_effect = lambda gsm_dir: gsm_dir == 'GSM2'
+        self.assertEqual(ppr.skip_samples_without_sras_info([s1, s2]), [s2])
+
+    def test_fetch_sras_info_unknown_listing(self):
+        self.assertRaises(ValueError, ppr.fetch_sras_info,
+                          [mock.Mock()], False, listing='unknown')
+
+    def fetch_sras_info_per_with_fake_ftp_server(self, listing, mlsd=True):
+        server = FakeFTPServer(gen_tree(3, num_srrs=3))
+        server.mlsd = mlsd
+        ftp_handler = server.connect()
+        sample_url = 'ftp://ftp-trace.ncbi.nlm.nih.gov{0}/SRX029001'.format(
+            SRX_PARENT_DIR)
+        res = ppr.fetch_sras_info_per(sample_url, ftp_handler, listing)
+        return res, server.num_commands
+
+    def test_fetch_sras_info_per_listings(self):
+        res_nlst, num_cmds_nlst = self.fetch_sras_info_per_with_fake_ftp_server('nlst')
+        res_mlsd, num_cmds_mlsd = self.fetch_sras_info_per_with_fake_ftp_server('mlsd')
+        res_list, num_cmds_list = self.fetch_sras_info_per_with_fake_ftp_server('list')
+        self.assertEqual(len(res_nlst), 3)
+        self.assertEqual(res_nlst[0], {'SRX029001/SRR0290010/SRR0290010.sra': {
+            'size': 1048577, 'readable_size': '1.0 MB'}})
+        self.assertEqual(res_nlst, res_mlsd)
+        self.assertEqual(res_nlst, res_list)
+        # cwd + nlst(srx) + 3 * nlst(srr) + TYPE i + 3 * size
+        self.assertEqual(num_cmds_nlst, 9)
+        # cwd + listdir(srx) + 3 * listdir(srr)
+        self.assertEqual(num_cmds_mlsd, 5)
+        self.assertEqual(num_cmds_list, 5)
+
+    def test_fetch_sras_info_per_mlsd_unsupported(self):
+        try:
+            res, num_cmds = self.fetch_sras_info_per_with_fake_ftp_server(
+                'mlsd', mlsd=False)
+        finally:
+            ppr.ftp_listing.NO_MLSD_HOSTS.clear()
+        self.assertEqual(len(res), 3)
+        # one more for the failed MLSD
+        self.assertEqual(num_cmds, 6)
+
     def test_fetch_sras_info_per(self):
         mock_ftp_handler = mock.Mock()
         mock_ftp_handler.nlst.side_effect = [['SRX0/SRR0'], ['SRX0/SRR0/SRR0.sra']]
@@ -116,6 +270,46 @@ class PrePipelineRunTestCase(unittest.TestCase):
             ['soft1'], 'isamp_file_or_str', {'INTERESTED_ORGANISMS': ['Homo Sapiens']}),
             sample_list)
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.multiprocessing', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.sanity_check', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_isamp', autospec=True)
+    def test_gen_all_samples_from_soft_and_isamp_in_parallel(
+            self, mock_get_isamp, mock_sanity_check, mock_mp):
+        isamp = self.gen_fake_isamp()
+        mock_get_isamp.return_value = isamp
+        series0, series1 = Series('GSE0'), Series('GSE1')
+        samples0 = [Sample('GSM10', series0), Sample('GSM20', series0)]
+        samples1 = [Sample('GSM11', series1)]
+        mock_pool = mock_mp.Pool.return_value
+        mock_pool.map.return_value = [samples0, None, samples1]
+        config = {'INTERESTED_ORGANISMS': ['Homo sapiens'],
+                  'SOFT_PARSE_JOBS': 4}
+        res = ppr.gen_all_samples_from_soft_and_isamp(
+            ['soft0', 'soft_invalid', 'soft1'], 'isamp_file_or_str', config)
+        mock_mp.Pool.assert_called_once_with(4)
+        mock_pool.map.assert_called_once_with(ppr.analyze_one_star, [
+            ('soft0', isamp, ['Homo sapiens'], None),
+            ('soft_invalid', isamp, ['Homo sapiens'], None),
+            ('soft1', isamp, ['Homo sapiens'], None)])
+        self.assertEqual(res, samples0 + samples1)
+        self.assertTrue(mock_pool.close.called)
+        self.assertTrue(mock_pool.join.called)
+
+        # n_jobs from the command line overwrites that in config
+        mock_mp.reset_mock()
+        with mock.patch('rsempipeline.utils.pre_pipeline_run.analyze_one') as mock_analyze_one:
+            mock_analyze_one.side_effect = [samples0, None, samples1]
+            res = ppr.gen_all_samples_from_soft_and_isamp(
+                ['soft0', 'soft_invalid', 'soft1'], 'isamp_file_or_str',
+                config, n_jobs=1)
+        self.assertFalse(mock_mp.Pool.called)
+        self.assertEqual(res, samples0 + samples1)
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.analyze_one', autospec=True)
+    def test_analyze_one_star(self, mock_analyze_one):
+        ppr.analyze_one_star(('soft', 'isamp', ['Homo sapiens']))
+        mock_analyze_one.assert_called_once_with('soft', 'isamp', ['Homo sapiens'])
+
     @mock.patch('rsempipeline.utils.pre_pipeline_run.parse', autospec=True)
     @log_capture()
     def test_analyze_one(self, mock_parse, L):
@@ -132,6 +326,24 @@ class PrePipelineRunTestCase(unittest.TestCase):
                  'Discrepancy for GSE0: 1 GSMs in soft, 2 GSMs in isamp, and only 1 left after intersection.'),)
 
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.parse', autospec=True)
+    def test_analyze_one_with_soft_cache(self, mock_parse):
+        fake_isamp = self.gen_fake_isamp()
+        fake_series = Series('GSE1')
+        sample = Sample('GSM11', fake_series)
+        fake_series.add_passed_sample(sample)
+        mock_soft_cache = mock.Mock()
+        mock_soft_cache.parse.return_value = fake_series
+        self.assertEqual(ppr.analyze_one('GSE1_family.soft.subset', fake_isamp,
+                                         ['Homo sapiens'], mock_soft_cache),
+                         [sample])
+        mock_soft_cache.parse.assert_called_once_with(
+            'GSE1_family.soft.subset', ['Homo sapiens'])
+        self.assertFalse(mock_parse.called)
+
+    def test_get_soft_cache_dir(self):
+        self.assertEqual(ppr.get_soft_cache_dir('some_outdir'), 'some_outdir/soft_cache')
+
     def test_analyze_one_invalid_filename(self):
         self.assertIsNone(
             ppr.analyze_one('invalid_soft_filename', 'some_fake_isamp', ['']))
@@ -206,6 +418,24 @@ class PrePipelineRunTestCase(unittest.TestCase):
     #     mock_options.ignore_disk_usage_rule = False
     #     ppr.select_samples_to_process(mock_samples, mock_config, mock_options)
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.is_processed', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.Scheduler', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_isamp_priorities', autospec=True)
+    def test_schedule_samples(self, mock_get_priorities, mock_scheduler, mock_is_processed):
+        mock_get_priorities.return_value = {'GSE1': 1, 'GSE2': 2}
+        config = {'GSE_PRIORITIES': {'GSE2': 5}, 'PRIORITY_AGING_PER_DAY': 0.5}
+        samples = [mock.Mock(outdir='GSM1_dir'), mock.Mock(outdir='GSM2_dir')]
+        samples[0].name, samples[1].name = 'GSM1', 'GSM2'
+        mock_is_processed.side_effect = lambda gsm_dir, status_index: gsm_dir == 'GSM2_dir'
+        res = ppr.schedule_samples(samples, 'top_outdir', 'isamp.csv', config, 'status_index')
+        mock_get_priorities.assert_called_once_with('isamp.csv')
+        mock_scheduler.assert_called_once_with(
+            {'GSE1': 1, 'GSE2': 5}, 'top_outdir/gsm_first_seen.txt', 0.5)
+        scheduler = mock_scheduler.return_value.load.return_value
+        scheduler.schedule.assert_called_once_with(samples, done=set(['GSM2']))
+        mock_is_processed.assert_any_call('GSM1_dir', 'status_index')
+        self.assertEqual(res, scheduler.schedule.return_value)
+
     @mock.patch('rsempipeline.utils.pre_pipeline_run.is_processed', autospec=True)
     def test_select_gsms_to_process_all_processed(self, mock_is_processed):
         mock_is_processed.return_value = True
@@ -226,6 +456,19 @@ class PrePipelineRunTestCase(unittest.TestCase):
         samples = [mock.Mock(), mock.Mock()]
         self.assertEqual(ppr.select_gsms_to_process(samples, 1024, False), [samples[0]])
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.estimate_sra2fastq_usage', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.is_processed', autospec=True)
+    def test_select_gsms_to_process_with_strategy(self, mock_is_processed, mock_estimate_sra2fastq_usage):
+        mock_is_processed.side_effect = [False, True, False, False]
+        mock_estimate_sra2fastq_usage.side_effect = [600, 500, 500]
+        samples = [mock.Mock(), mock.Mock(), mock.Mock(), mock.Mock()]
+        self.assertEqual(
+            ppr.select_gsms_to_process(samples, 1000, False, strategy='max_count'),
+            [samples[2], samples[3]])
+        mock_estimate_sra2fastq_usage.assert_has_calls(
+            [mock.call(samples[0].outdir, None, 0, 1), mock.call(samples[2].outdir, None, 0, 1),
+             mock.call(samples[3].outdir, None, 0, 1)])
+
     @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
     def test_is_gen_qsub_script_complete(self, mock_os):
         mock_os.path.exists.return_value = True
@@ -233,13 +476,47 @@ class PrePipelineRunTestCase(unittest.TestCase):
         mock_os.path.exists.return_value = False
         self.assertFalse(ppr.is_gen_qsub_script_complete('some_gsm_dir'))
         
-    @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
-    def test_get_sras_info(self, _):
-        with mock.patch('rsempipeline.utils.pre_pipeline_run.open',
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.os.path.exists', autospec=True)
+    def test_is_gen_qsub_script_complete_with_status_index(self, mock_exists):
+        mock_index = mock.Mock()
+        mock_index.exists.return_value = True
+        self.assertTrue(ppr.is_gen_qsub_script_complete('some_gsm_dir', mock_index))
+        mock_index.exists.assert_called_once_with('some_gsm_dir/0_submit.sh')
+        self.assertFalse(mock_exists.called)
+
+    def test_is_download_and_sra2fastq_complete_with_status_index(self):
+        mock_index = mock.Mock()
+        mock_index.exists.side_effect = lambda x: x.endswith('SRR1.sra.download.COMPLETE')
+        sra_files = ['some_gsm_dir/SRX1/SRR1/SRR1.sra']
+        self.assertTrue(ppr.is_download_complete('some_gsm_dir', sra_files, mock_index))
+        self.assertFalse(ppr.is_sra2fastq_complete('some_gsm_dir', sra_files, mock_index))
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.StatusIndex', autospec=True)
+    def test_build_status_index(self, mock_status_index):
+        ppr.build_status_index('some_top_outdir')
+        mock_status_index.assert_called_once_with('some_top_outdir/rsem_output')
+        self.assertTrue(mock_status_index.return_value.build.called)
+
+    def test_get_sras_info(self):
+        with mock.patch('rsempipeline.utils.sras_info_store.open',
                         mock.mock_open(read_data=SRA_INFO_YAML_SINGLE_SRA)):
             res = ppr.get_sras_info('some_dir')
         self.assertEqual(res, PARSED_SRA_INFO_YAML_SINGLE_SRA)
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SIS.init_store', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.os', autospec=True)
+    def test_init_sras_info_store(self, mock_os, mock_init_store):
+        mock_os.path.exists.return_value = True
+        mock_os.path.join.return_value = 'top_outdir/sras_info.sqlite'
+        sample = mock.Mock()
+        sample.outdir = 'top_outdir/rsem_output/GSE1/homo_sapiens/GSM1'
+        ppr.init_sras_info_store('top_outdir', [sample], False, 10)
+        mock_os.path.join.assert_called_once_with('top_outdir', 'sras_info.sqlite')
+        mock_init_store.assert_called_once_with(
+            'top_outdir/sras_info.sqlite', 'top_outdir', False, 10)
+        mock_init_store.return_value.import_yaml.assert_called_once_with(
+            ['top_outdir/rsem_output/GSE1/homo_sapiens/GSM1'])
+
     @mock.patch('rsempipeline.utils.pre_pipeline_run.get_sras_info', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.SRA2FASTQ_SIZE_RATIO', autospec=True)
     def test_estimate_sra2fastq_usage(self, mock_ratio, mock_get_sras_info):
@@ -247,6 +524,40 @@ class PrePipelineRunTestCase(unittest.TestCase):
         mock_get_sras_info.return_value = PARSED_SRA_INFO_YAML_SINGLE_SRA
         self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir'), 2546696608 * mock_ratio)
 
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SE.get_sra2fastq_ratio', autospec=True)
+    def test_estimate_sra2fastq_usage_with_learned_ratio(self, mock_get_ratio, mock_get_sras_info):
+        mock_get_ratio.return_value = 0.5
+        mock_get_sras_info.return_value = PARSED_SRA_INFO_YAML_SINGLE_SRA
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir'), 2546696608 * 1.5)
+        mock_get_ratio.assert_called_once_with('some_gsm_dir')
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SE.get_sra2fastq_ratio', autospec=True)
+    def test_estimate_sra2fastq_usage_with_sras_on_disk(self, mock_get_ratio, mock_get_sras_info):
+        mock_get_ratio.return_value = 0.5
+        mock_get_sras_info.return_value = [
+            {'SRX1/SRR1/SRR1.sra': {'size': 100}},
+            {'SRX1/SRR2/SRR2.sra': {'size': 300}},
+            {'SRX1/SRR3/SRR3.sra': {'size': 200}}]
+        # fastq.gz files: 0.5 * 600, plus the two biggest sras on disk
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir', 2), 800)
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir', 5), 900)
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir'), 900)
+
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.get_sras_info', autospec=True)
+    @mock.patch('rsempipeline.utils.pre_pipeline_run.SE.get_sra2fastq_ratio', autospec=True)
+    def test_estimate_sra2fastq_usage_with_intermediate(self, mock_get_ratio, mock_get_sras_info):
+        mock_get_ratio.return_value = 0.5
+        mock_get_sras_info.return_value = [
+            {'SRX1/SRR1/SRR1.sra': {'size': 100}},
+            {'SRX1/SRR2/SRR2.sra': {'size': 300}},
+            {'SRX1/SRR3/SRR3.sra': {'size': 200}}]
+        # plus 4 times the biggest sra being converted
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir', None, 4), 2100)
+        # plus 4 times the two biggest ones
+        self.assertEqual(ppr.estimate_sra2fastq_usage('some_gsm_dir', 2, 4, 2), 2800)
+
     @mock.patch('rsempipeline.utils.pre_pipeline_run.get_sras_info', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.is_gen_qsub_script_complete', autospec=True)
     @mock.patch('rsempipeline.utils.pre_pipeline_run.is_sra2fastq_complete', autospec=True)
@@ -0,0 +1,61 @@
+import unittest
+
+from rsempipeline.utils import remote_listing as RL
+
+
+class RemoteListingTestCase(unittest.TestCase):
+    def test_get_find_cmd(self):
+        self.assertEqual(RL.get_find_cmd('/r_dir'), 'find /r_dir')
+        self.assertEqual(
+            RL.get_find_cmd('/r_dir', 'filtered'),
+            "find /r_dir "
+            "\\( -type d -name '*GSM[0-9]*' -empty -printf 'E %p\\n' \\) -o "
+            "\\( -type d -name '*GSM[0-9]*' -printf 'D %p\\n' \\) -o "
+            "\\( -type f \\( -name rsem.COMPLETE -o -name '*.fastq.gz' \\) "
+            "-printf 'F %p\\n' \\)")
+        self.assertRaisesRegexp(ValueError, 'unknown REMOTE_LISTING: ls',
+                                RL.get_find_cmd, '/r_dir', 'ls')
+
+    def test_full(self):
+        index = RL.RemoteGSMIndex().update([
+            '/r_dir\n',
+            '/r_dir/GSE1\n',
+            '/r_dir/GSE1/homo_sapiens\n',
+            '/r_dir/GSE1/homo_sapiens/GSM1\n',
+            '/r_dir/GSE1/homo_sapiens/GSM1/rsem.COMPLETE\n',
+            '/r_dir/GSE1/homo_sapiens/GSM2\n',
+            '/r_dir/GSE1/homo_sapiens/GSM3\n',
+            '/r_dir/GSE1/homo_sapiens/GSM3/SRX1/SRR1/SRR1.sra\n',
+            '\n'])
+        self.assertEqual(index.num_lines, 8)
+        self.assertEqual(sorted(index.gsm_dirs), [
+            '/r_dir/GSE1/homo_sapiens/GSM1',
+            '/r_dir/GSE1/homo_sapiens/GSM2',
+            '/r_dir/GSE1/homo_sapiens/GSM3'])
+        self.assertTrue(index.is_complete('/r_dir/GSE1/homo_sapiens/GSM1'))
+        self.assertTrue(index.is_empty('/r_dir/GSE1/homo_sapiens/GSM2'))
+        self.assertFalse(index.is_complete('/r_dir/GSE1/homo_sapiens/GSM3'))
+        self.assertFalse(index.is_empty('/r_dir/GSE1/homo_sapiens/GSM3'))
+
+    def test_file_listed_before_its_dir(self):
+        index = RL.RemoteGSMIndex().update([
+            '/r_dir/GSE1/homo_sapiens/GSM1/rsem.COMPLETE',
+            '/r_dir/GSE1/homo_sapiens/GSM1'])
+        self.assertEqual(index.gsm_dirs, {
+            '/r_dir/GSE1/homo_sapiens/GSM1': {'complete': True, 'empty': False}})
+
+    def test_filtered(self):
+        index = RL.RemoteGSMIndex('filtered').update([
+            'D /r_dir/GSE1/homo_sapiens/GSM1\n',
+            'F /r_dir/GSE1/homo_sapiens/GSM1/rsem.COMPLETE\n',
+            'E /r_dir/GSE1/homo_sapiens/GSM2\n',
+            # not empty, but without any files of interest
+            'D /r_dir/GSE1/homo_sapiens/GSM3\n',
+            'F /r_dir/GSE1/homo_sapiens/GSM4/SRR4_1.fastq.gz\n',
+            'D /r_dir/GSE1/homo_sapiens/GSM4\n',
+            'find: permission denied\n'])
+        self.assertEqual(index.gsm_dirs, {
+            '/r_dir/GSE1/homo_sapiens/GSM1': {'complete': True, 'empty': False},
+            '/r_dir/GSE1/homo_sapiens/GSM2': {'complete': False, 'empty': True},
+            '/r_dir/GSE1/homo_sapiens/GSM3': {'complete': False, 'empty': False},
+            '/r_dir/GSE1/homo_sapiens/GSM4': {'complete': False, 'empty': False}})
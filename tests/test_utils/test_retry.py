@@ -0,0 +1,85 @@
+import unittest
+
+import mock
+
+from rsempipeline.utils import retry
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.execute = mock.Mock()
+        patcher = mock.patch('rsempipeline.utils.retry.time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_succeeded_first_time(self):
+        self.execute.return_value = 0
+        policy = retry.RetryPolicy(max_attempts=3)
+        self.assertEqual(policy.call(self.execute, 'cmd', 'msg_id', debug=False), 0)
+        self.execute.assert_called_once_with('cmd', 'msg_id', debug=False)
+        self.assertFalse(self.mock_sleep.called)
+
+    def test_retried_until_succeeded(self):
+        self.execute.side_effect = [1, 1, 0]
+        policy = retry.RetryPolicy(max_attempts=5, backoff=10, jitter=0)
+        self.assertEqual(policy.call(self.execute, 'cmd', flag_file='flag'), 0)
+        self.assertEqual(self.execute.call_args_list,
+                         [mock.call('cmd', flag_file='flag')] * 3)
+        self.assertEqual(self.mock_sleep.call_args_list,
+                         [mock.call(10), mock.call(20)])
+
+    def test_gave_up(self):
+        self.execute.return_value = 1
+        policy = retry.RetryPolicy(max_attempts=3, jitter=0)
+        self.assertEqual(policy.call(self.execute, 'cmd'), 1)
+        self.assertEqual(self.execute.call_count, 3)
+        self.assertEqual(self.mock_sleep.call_count, 2)
+
+    def test_not_retryable(self):
+        policy = retry.RetryPolicy(max_attempts=3, returncodes=[1, 255])
+        for returncode in [2, None]:
+            self.execute.reset_mock()
+            self.execute.return_value = returncode
+            self.assertEqual(policy.call(self.execute, 'cmd'), returncode)
+            self.execute.assert_called_once_with('cmd')
+        self.assertFalse(self.mock_sleep.called)
+
+    def test_get_wait(self):
+        policy = retry.RetryPolicy(backoff=30, max_backoff=100, jitter=0)
+        self.assertEqual([policy.get_wait(_) for _ in [1, 2, 3, 4]],
+                         [30, 60, 100, 100])
+        policy = retry.RetryPolicy(backoff=30, jitter=0.5)
+        with mock.patch('rsempipeline.utils.retry.random.random', return_value=1):
+            self.assertEqual(policy.get_wait(2), 30)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, retry.RetryPolicy, max_attempts=0)
+        self.assertRaises(ValueError, retry.RetryPolicy, jitter=2)
+
+
+class InitPoliciesTestCase(unittest.TestCase):
+    def tearDown(self):
+        retry._policies = {}
+
+    def test_not_initialized(self):
+        self.assertEqual(retry.get_policy('download').max_attempts, 1)
+
+    def test_task_overrides_default(self):
+        retry.init_policies({'default': {'max_attempts': 2, 'backoff': 5},
+                             'download': {'max_attempts': 4, 'returncodes': [1]}})
+        download = retry.get_policy('download')
+        self.assertEqual((download.max_attempts, download.backoff, download.returncodes),
+                         (4, 5, [1]))
+        rsem = retry.get_policy('rsem')
+        self.assertEqual((rsem.max_attempts, rsem.backoff, rsem.returncodes),
+                         (2, 5, None))
+
+    def test_none(self):
+        retry.init_policies(None)
+        self.assertEqual(retry.get_policy('sra2fastq').max_attempts, 1)
+
+    def test_unknown_task(self):
+        self.assertRaises(ValueError, retry.init_policies, {'gen_qsub_script': {}})
+
+    def test_unknown_key(self):
+        self.assertRaises(ValueError, retry.init_policies, {'default': {'retries': 2}})
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from rsempipeline.utils.objs import Series, Sample
+from rsempipeline.utils.scheduling import Scheduler, SECONDS_PER_DAY
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.first_seen_file = os.path.join(self.tmp_dir, 'gsm_first_seen.txt')
+        gse1, gse2 = Series('GSE1'), Series('GSE2')
+        self.samples = [Sample('GSM1', gse1), Sample('GSM2', gse1),
+                        Sample('GSM3', gse2), Sample('GSM4', gse2)]
+        self.now = 1400000000.
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def names(self, samples):
+        return [_.name for _ in samples]
+
+    def test_schedule_without_priorities(self):
+        scheduler = Scheduler()
+        self.assertEqual(scheduler.schedule(self.samples, self.now),
+                         self.samples)
+
+    def test_schedule_with_priorities(self):
+        scheduler = Scheduler({'GSE2': 10})
+        self.assertEqual(self.names(scheduler.schedule(self.samples, self.now)),
+                         ['GSM3', 'GSM4', 'GSM1', 'GSM2'])
+
+    def test_schedule_with_aging(self):
+        scheduler = Scheduler({'GSE2': 10}, aging_per_day=1)
+        scheduler.first_seen = {'GSM2': self.now - 11 * SECONDS_PER_DAY}
+        self.assertEqual(self.names(scheduler.schedule(self.samples, self.now)),
+                         ['GSM2', 'GSM3', 'GSM4', 'GSM1'])
+        self.assertEqual(scheduler.get_priority(self.samples[1], self.now), 11)
+
+    def test_first_seen_persisted(self):
+        scheduler = Scheduler(first_seen_file=self.first_seen_file)
+        scheduler.schedule(self.samples[:2], self.now)
+        scheduler = Scheduler(first_seen_file=self.first_seen_file).load()
+        scheduler.schedule(self.samples, self.now + SECONDS_PER_DAY)
+        scheduler = Scheduler(first_seen_file=self.first_seen_file).load()
+        self.assertEqual(scheduler.first_seen, {
+            'GSM1': self.now, 'GSM2': self.now,
+            'GSM3': self.now + SECONDS_PER_DAY,
+            'GSM4': self.now + SECONDS_PER_DAY})
+        with open(self.first_seen_file) as inf:
+            self.assertEqual(inf.readline(), 'GSM1\t1400000000\n')
+
+    def test_done_pruned(self):
+        scheduler = Scheduler(first_seen_file=self.first_seen_file)
+        scheduler.schedule(self.samples, self.now)
+        scheduler = Scheduler(first_seen_file=self.first_seen_file).load()
+        scheduler.schedule(self.samples, self.now + SECONDS_PER_DAY,
+                           done=set(['GSM1', 'GSM3']))
+        scheduler = Scheduler(first_seen_file=self.first_seen_file).load()
+        self.assertEqual(scheduler.first_seen, {'GSM2': self.now, 'GSM4': self.now})
+
+    def test_load_non_existent(self):
+        scheduler = Scheduler(first_seen_file=self.first_seen_file).load()
+        self.assertEqual(scheduler.first_seen, {})
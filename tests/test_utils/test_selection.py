@@ -0,0 +1,67 @@
+import itertools
+import random
+import unittest
+
+from rsempipeline.utils import selection
+
+
+class SelectionTestCase(unittest.TestCase):
+    def setUp(self):
+        # a large GSM early in the list
+        self.usages = [60, 50, 30, 20, 15, 10]
+        self.free_to_use = 100
+
+    def test_first_fit(self):
+        self.assertEqual(selection.select(self.usages, self.free_to_use),
+                         [0, 2, 5])
+
+    def test_first_fit_decreasing(self):
+        self.assertEqual(selection.select(self.usages, self.free_to_use,
+                                          'first_fit_decreasing'),
+                         [0, 2, 5])
+        self.assertEqual(selection.select([10, 30, 70], 100,
+                                          'first_fit_decreasing'), [1, 2])
+
+    def test_knapsack(self):
+        res = selection.select(self.usages, self.free_to_use, 'knapsack')
+        self.assertEqual(sum(self.usages[_] for _ in res), 100)
+
+    def test_max_count(self):
+        self.assertEqual(selection.select(self.usages, self.free_to_use,
+                                          'max_count'), [2, 3, 4, 5])
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, selection.select,
+                          self.usages, self.free_to_use, 'unknown')
+
+    def test_nothing_fits(self):
+        for strategy in selection.STRATEGIES:
+            self.assertEqual(selection.select([200, 300], 100, strategy), [])
+            self.assertEqual(selection.select([], 100, strategy), [])
+            self.assertEqual(selection.select([10], 0, strategy), [])
+
+    def test_knapsack_exact_fit(self):
+        self.assertEqual(selection.knapsack([1e6], 1e6), [0])
+        for free_to_use in [0.3, 0.7, 1.1, 3.3, 1e-5]:
+            self.assertEqual(selection.knapsack([free_to_use], free_to_use), [0])
+
+    def test_knapsack_never_exceeds_free_to_use(self):
+        rand = random.Random(0)
+        for _ in range(20):
+            usages = [rand.uniform(1, 50) * 1024 ** 3 for __ in range(30)]
+            free_to_use = rand.uniform(50, 500) * 1024 ** 3
+            res = selection.knapsack(usages, free_to_use)
+            self.assertLessEqual(sum(usages[k] for k in res), free_to_use)
+            # at least as good as the greedy strategies
+            for strategy in [selection.first_fit, selection.first_fit_decreasing]:
+                self.assertGreaterEqual(
+                    sum(usages[k] for k in res),
+                    sum(usages[k] for k in strategy(usages, free_to_use)))
+
+    def test_knapsack_optimal(self):
+        rand = random.Random(1)
+        usages = [rand.randint(1, 100) for _ in range(10)]
+        best = max(sum(_) for n in range(len(usages) + 1)
+                   for _ in itertools.combinations(usages, n) if sum(_) <= 200)
+        res = selection.knapsack(usages, 200, resolution=200)
+        self.assertEqual(sum(usages[k] for k in res), best)
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import LogCapture
+
+from rsempipeline.utils import size_estimator as SE
+
+
+class SizeEstimatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.top_outdir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.db_file = os.path.join(self.top_outdir, 'size_history.sqlite')
+        self.estimator = SE.SizeEstimator(
+            self.db_file, self.top_outdir, quantile=0.9, min_samples=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.top_outdir)
+        SE._estimator = None
+
+    def gsm_dir(self, species, k):
+        return os.path.join(self.top_outdir, 'rsem_output', 'GSE1', species,
+                            'GSM{0}'.format(k))
+
+    def test_quantile(self):
+        self.assertIsNone(SE.quantile([], 0.9))
+        self.assertEqual(SE.quantile([3, 1, 2], 0.5), 2)
+        self.assertEqual(SE.quantile(range(1, 11), 0.9), 9)
+        self.assertEqual(SE.quantile(range(1, 11), 1), 10)
+        self.assertEqual(SE.quantile([5], 0), 5)
+
+    def test_get_species(self):
+        self.assertEqual(SE.get_species(self.gsm_dir('homo_sapiens', 1)),
+                         'homo_sapiens')
+        self.assertIsNone(SE.get_species('/path/to/somewhere'))
+
+    def test_record_and_load(self):
+        self.estimator.record(self.gsm_dir('homo_sapiens', 1), sra=100,
+                              fastq_gz=150, layout=SE.PAIRED)
+        self.estimator.record(self.gsm_dir('homo_sapiens', 1), rsem=600)
+        estimator = SE.SizeEstimator(self.db_file, self.top_outdir).load()
+        self.assertEqual(estimator.sizes, {
+            'rsem_output/GSE1/homo_sapiens/GSM1': {
+                'species': 'homo_sapiens', 'layout': 'paired', 'sra': 100,
+                'fastq_gz': 150, 'rsem': 600}})
+
+    def test_get_ratio_falls_back(self):
+        for k, ratio in enumerate([1.2, 1.4, 1.6]):
+            self.estimator.record(self.gsm_dir('homo_sapiens', k), sra=100,
+                                  fastq_gz=int(100 * ratio), layout=SE.PAIRED)
+        self.estimator.record(self.gsm_dir('mus_musculus', 9), sra=100,
+                              fastq_gz=300, layout=SE.SINGLE)
+        # enough observations of paired homo_sapiens
+        self.assertEqual(
+            self.estimator.get_ratio('sra2fastq', 'homo_sapiens', SE.PAIRED), 1.6)
+        # falls back to all homo_sapiens
+        self.assertEqual(
+            self.estimator.get_ratio('sra2fastq', 'homo_sapiens', SE.SINGLE), 1.6)
+        # falls back to all GSMs
+        self.assertEqual(
+            self.estimator.get_ratio('sra2fastq', 'mus_musculus', SE.SINGLE), 3)
+        self.assertIsNone(self.estimator.get_ratio('rsem', 'homo_sapiens'))
+
+    def test_get_ratio_without_history(self):
+        self.assertIsNone(SE.get_sra2fastq_ratio(self.gsm_dir('homo_sapiens', 1)))
+        SE.init_estimator(self.db_file, self.top_outdir)
+        self.assertIsNone(SE.get_sra2fastq_ratio(self.gsm_dir('homo_sapiens', 1)))
+        self.assertIsNone(SE.estimate_rsem_usage(self.gsm_dir('homo_sapiens', 1)))
+
+    def test_estimate_rsem_usage(self):
+        for k, rsem in enumerate([100, 200, 300]):
+            self.estimator.record(self.gsm_dir('homo_sapiens', k), sra=100,
+                                  fastq_gz=100, rsem=rsem, layout=SE.SINGLE)
+        gsm_dir = self.gsm_dir('homo_sapiens', 5)
+        self.assertIsNone(self.estimator.estimate_rsem_usage(gsm_dir))
+        self.estimator.record(gsm_dir, sra=400, fastq_gz=500, layout=SE.SINGLE)
+        # ratio: (100 + 300) / 100
+        self.assertEqual(self.estimator.estimate_rsem_usage(gsm_dir), 2000)
+
+    def write(self, path, size):
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as opf:
+            opf.write('x' * size)
+
+    def test_record_sizes(self):
+        gsm_dir = self.gsm_dir('homo_sapiens', 1)
+        self.write(os.path.join(gsm_dir, 'SRX1', 'SRR1', 'SRR1.sra'), 100)
+        self.write(os.path.join(gsm_dir, 'SRX1', 'SRR2', 'SRR2.sra'), 50)
+        self.write(os.path.join(gsm_dir, 'SRR1_1.fastq.gz'), 80)
+        self.write(os.path.join(gsm_dir, 'SRR1_2.fastq.gz'), 80)
+        self.write(os.path.join(gsm_dir, 'SRR1.sra.sra2fastq.COMPLETE'), 0)
+        # not all sra files have been converted
+        SE.record_sizes(self.top_outdir, gsm_dir)
+        self.assertFalse(os.path.exists(self.db_file))
+
+        self.write(os.path.join(gsm_dir, 'SRR2_1.fastq.gz'), 40)
+        self.write(os.path.join(gsm_dir, 'SRR2.sra.sra2fastq.COMPLETE'), 0)
+        SE.record_sizes(self.top_outdir, gsm_dir)
+        # rsem is done, and sra and fastq.gz files are removed
+        shutil.rmtree(os.path.join(gsm_dir, 'SRX1'))
+        for _ in ['SRR1_1', 'SRR1_2', 'SRR2_1']:
+            os.remove(os.path.join(gsm_dir, _ + '.fastq.gz'))
+        self.write(os.path.join(gsm_dir, 'GSM1.genes.results'), 300)
+        self.write(os.path.join(gsm_dir, 'rsem.COMPLETE'), 0)
+        SE.record_sizes(self.top_outdir, gsm_dir)
+
+        estimator = SE.SizeEstimator(self.db_file, self.top_outdir).load()
+        self.assertEqual(
+            estimator.sizes['rsem_output/GSE1/homo_sapiens/GSM1'],
+            {'species': 'homo_sapiens', 'layout': 'paired', 'sra': 150,
+             'fastq_gz': 200, 'rsem': 300})
+
+    @mock.patch('rsempipeline.utils.size_estimator.SIS.get_sras_info', autospec=True)
+    def test_record_sizes_with_placeholders(self, mock_get_sras_info):
+        gsm_dir = self.gsm_dir('homo_sapiens', 1)
+        mock_get_sras_info.return_value = [
+            {'SRX1/SRR1/SRR1.sra': {'size': 100}},
+            {'SRX1/SRR2/SRR2.sra': {'size': 50}}]
+        # SRR1.sra has been replaced with a placeholder once converted
+        self.write(os.path.join(gsm_dir, 'SRX1', 'SRR1', 'SRR1.sra'), 0)
+        self.write(os.path.join(gsm_dir, 'SRX1', 'SRR2', 'SRR2.sra'), 50)
+        self.write(os.path.join(gsm_dir, 'SRR1_1.fastq.gz'), 80)
+        self.write(os.path.join(gsm_dir, 'SRR2_1.fastq.gz'), 40)
+        self.write(os.path.join(gsm_dir, 'SRR1.sra.sra2fastq.COMPLETE'), 0)
+        self.write(os.path.join(gsm_dir, 'SRR2.sra.sra2fastq.COMPLETE'), 0)
+        SE.record_sizes(self.top_outdir, gsm_dir)
+        mock_get_sras_info.assert_called_once_with(gsm_dir)
+        estimator = SE.SizeEstimator(self.db_file, self.top_outdir).load()
+        self.assertEqual(
+            estimator.sizes['rsem_output/GSE1/homo_sapiens/GSM1'],
+            {'species': 'homo_sapiens', 'layout': 'single', 'sra': 150,
+             'fastq_gz': 120, 'rsem': None})
+
+    def test_record_sizes_failure_is_logged(self):
+        gsm_dir = self.gsm_dir('homo_sapiens', 1)
+        self.write(os.path.join(gsm_dir, 'rsem.COMPLETE'), 0)
+        with mock.patch.object(SE.SizeEstimator, 'record',
+                               side_effect=SE.sqlite3.OperationalError('locked')):
+            with LogCapture() as L:
+                SE.record_sizes(self.top_outdir, gsm_dir)
+        L.check(('rsempipeline.utils.size_estimator', 'WARNING',
+                 'failed to record sizes of {0}: locked'.format(gsm_dir)))
@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import LogCapture
+
+from rsempipeline.utils import soft_cache
+from rsempipeline.utils.soft_cache import SoftCache
+
+
+SOFT_CONTENT = """^SERIES = GSE43770
+!Series_sample_id = GSM1070765
+^SAMPLE = GSM1070765
+!Sample_type = SRA
+!Sample_organism_ch1 = Homo sapiens
+!Sample_instrument_model = Illumina HiSeq 2000
+!Sample_library_source = transcriptomic
+!Sample_library_strategy = RNA-Seq
+!Sample_supplementary_file_1 = ftp://ftp-trace.ncbi.nlm.nih.gov/sra/sra-instant/reads/ByExp/sra/SRX/SRX219/SRX219901
+"""
+
+
+class SoftCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.soft_file = os.path.join(self.tmp_dir, 'GSE43770_family.soft.subset')
+        with open(self.soft_file, 'wb') as opf:
+            opf.write(SOFT_CONTENT)
+        self.cache_dir = os.path.join(self.tmp_dir, 'top_outdir', 'soft_cache')
+        self.organisms = ['Homo sapiens']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def patch_parse(self):
+        return mock.patch('rsempipeline.utils.soft_cache.parse',
+                          wraps=soft_cache.parse)
+
+    def test_md5sum(self):
+        self.assertEqual(soft_cache.md5sum(self.soft_file),
+                         soft_cache.hashlib.md5(SOFT_CONTENT).hexdigest())
+
+    def test_get_cache_file(self):
+        cache = SoftCache('some_cache_dir')
+        cache_file = cache.get_cache_file('some_dir/GSE1_family.soft.subset')
+        self.assertRegexpMatches(
+            cache_file, r'^some_cache_dir/GSE1_family\.soft\.subset\.[0-9a-f]{8}\.pickle$')
+        self.assertNotEqual(
+            cache_file, cache.get_cache_file('other_dir/GSE1_family.soft.subset'))
+
+    def test_gen_stamp(self):
+        stamp = SoftCache(self.cache_dir).gen_stamp(self.soft_file, self.organisms)
+        self.assertEqual(stamp['size'], len(SOFT_CONTENT))
+        self.assertNotIn('md5', stamp)
+        stamp = SoftCache(self.cache_dir, check_hash=True).gen_stamp(
+            self.soft_file, self.organisms)
+        self.assertIn('md5', stamp)
+
+    def test_parse_miss_then_hit(self):
+        cache = SoftCache(self.cache_dir)
+        with LogCapture('rsempipeline.utils.soft_cache') as L:
+            series = cache.parse(self.soft_file, self.organisms)
+        self.assertEqual(series.name, 'GSE43770')
+        self.assertTrue(os.path.exists(cache.get_cache_file(self.soft_file)))
+        self.assertIn('soft cache miss', str(L))
+
+        with self.patch_parse() as mock_parse:
+            with LogCapture('rsempipeline.utils.soft_cache') as L:
+                series = cache.parse(self.soft_file, self.organisms)
+            self.assertFalse(mock_parse.called)
+        self.assertIn('soft cache hit', str(L))
+        self.assertEqual([_.name for _ in series.passed_samples], ['GSM1070765'])
+        # the samples still refer to the series they belong to
+        self.assertIs(series.passed_samples[0].series, series)
+
+    def test_parse_outdated_cache(self):
+        cache = SoftCache(self.cache_dir)
+        cache.parse(self.soft_file, self.organisms)
+        with open(self.soft_file, 'ab') as opf:
+            opf.write('!Sample_description = something\n')
+        with self.patch_parse() as mock_parse:
+            with LogCapture('rsempipeline.utils.soft_cache') as L:
+                cache.parse(self.soft_file, self.organisms)
+            self.assertTrue(mock_parse.called)
+        self.assertIn('is outdated', str(L))
+
+    def test_parse_with_different_interested_organisms(self):
+        cache = SoftCache(self.cache_dir)
+        cache.parse(self.soft_file, self.organisms)
+        with self.patch_parse() as mock_parse:
+            cache.parse(self.soft_file, ['Mus musculus'])
+            self.assertTrue(mock_parse.called)
+
+    def test_parse_with_check_hash(self):
+        SoftCache(self.cache_dir).parse(self.soft_file, self.organisms)
+        cache = SoftCache(self.cache_dir, check_hash=True)
+        with self.patch_parse() as mock_parse:
+            # md5 wasn't recorded in the previous cache
+            cache.parse(self.soft_file, self.organisms)
+            cache.parse(self.soft_file, self.organisms)
+            self.assertEqual(mock_parse.call_count, 1)
+
+        # same size and mtime, but different content
+        stat = os.stat(self.soft_file)
+        with open(self.soft_file, 'wb') as opf:
+            opf.write(SOFT_CONTENT.replace('HiSeq', 'HiSEQ'))
+        os.utime(self.soft_file, (stat.st_atime, stat.st_mtime))
+        with self.patch_parse() as mock_parse:
+            cache.parse(self.soft_file, self.organisms)
+            self.assertTrue(mock_parse.called)
+
+    def test_parse_invalidate(self):
+        SoftCache(self.cache_dir).parse(self.soft_file, self.organisms)
+        cache = SoftCache(self.cache_dir, invalidate=True)
+        with self.patch_parse() as mock_parse:
+            cache.parse(self.soft_file, self.organisms)
+            self.assertTrue(mock_parse.called)
+
+    def test_load_corrupted_cache(self):
+        cache = SoftCache(self.cache_dir)
+        stamp = cache.gen_stamp(self.soft_file, self.organisms)
+        os.makedirs(self.cache_dir)
+        with open(cache.get_cache_file(self.soft_file), 'wb') as opf:
+            opf.write('not a pickle')
+        with LogCapture('rsempipeline.utils.soft_cache') as L:
+            self.assertIsNone(cache.load(self.soft_file, stamp))
+        self.assertIn('failed to load', str(L))
+
+    @mock.patch('rsempipeline.utils.soft_cache.os.rename', autospec=True)
+    def test_parse_fail_to_write_cache(self, mock_rename):
+        mock_rename.side_effect = OSError('permission denied')
+        cache = SoftCache(self.cache_dir)
+        with LogCapture('rsempipeline.utils.soft_cache') as L:
+            series = cache.parse(self.soft_file, self.organisms)
+        self.assertEqual(series.name, 'GSE43770')
+        self.assertIn('failed to write soft cache', str(L))
@@ -0,0 +1,137 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from rsempipeline.utils import misc
+from rsempipeline.utils import retry as RT
+from rsempipeline.utils import sra2fastq as S2F
+
+
+class Sra2fastqTestCase(unittest.TestCase):
+    def setUp(self):
+        self.gsm_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.sra = os.path.join(self.gsm_dir, 'SRX1', 'SRR1', 'SRR1.sra')
+        os.makedirs(os.path.dirname(self.sra))
+        with open(self.sra, 'wb') as opf:
+            opf.write('x' * 100)
+        os.utime(self.sra, (1000000000, 1000000000))
+
+    def tearDown(self):
+        shutil.rmtree(self.gsm_dir)
+
+    def test_get_flag_file(self):
+        self.assertEqual(S2F.get_gsm_dir(self.sra), self.gsm_dir)
+        self.assertEqual(S2F.get_flag_file(self.sra),
+                         os.path.join(self.gsm_dir, 'SRR1.sra.sra2fastq.COMPLETE'))
+
+    def test_replace_with_placeholder(self):
+        flag_file = S2F.get_flag_file(self.sra)
+        self.assertFalse(S2F.is_placeholder(self.sra))
+        S2F.replace_with_placeholder(self.sra)
+        self.assertTrue(S2F.is_placeholder(self.sra))
+        self.assertEqual(os.path.getmtime(self.sra), 1000000000)
+        self.assertFalse(S2F.is_converted(self.sra, flag_file))
+        open(flag_file, 'wb').close()
+        self.assertTrue(S2F.is_converted(self.sra, flag_file))
+
+    def test_get_intermediate_ratio(self):
+        self.assertEqual(S2F.get_intermediate_ratio({}), 0)
+        self.assertEqual(S2F.get_intermediate_ratio({'SRA2FASTQ_BACKEND': 'fasterq-dump'}),
+                         S2F.DEFAULT_FASTERQ_DUMP_INTERMEDIATE_RATIO)
+        self.assertEqual(S2F.get_intermediate_ratio({'SRA2FASTQ_BACKEND': 'fasterq-dump',
+                                                     'FASTERQ_DUMP_INTERMEDIATE_RATIO': 5}), 5)
+
+    def test_get_backend(self):
+        self.assertEqual(S2F.get_backend('fasterq-dump'), 'fasterq-dump')
+        backends = {'default': 'fastq-dump', 'host1': 'fasterq-dump'}
+        self.assertEqual(S2F.get_backend(backends, 'host1'), 'fasterq-dump')
+        self.assertEqual(S2F.get_backend(backends, 'host2'), 'fastq-dump')
+        self.assertEqual(S2F.get_backend({}, 'host2'), 'fastq-dump')
+        self.assertRaisesRegexp(ValueError, 'unknown SRA2FASTQ_BACKEND: sratools',
+                                S2F.get_backend, 'sratools')
+
+    def test_gen_sra2fastq_cmd(self):
+        config = {'CMD_FASTQ_DUMP': 'fastq-dump --gzip --outdir {output_dir} {accession}'}
+        self.assertEqual(
+            S2F.gen_sra2fastq_cmd('gsm/SRX1/SRR1/SRR1.sra', 'gsm', config),
+            'fastq-dump --gzip --outdir gsm gsm/SRX1/SRR1/SRR1.sra')
+        config.update(SRA2FASTQ_BACKEND='fasterq-dump', SRA2FASTQ_THREADS=4)
+        self.assertEqual(
+            S2F.gen_sra2fastq_cmd('gsm/SRX1/SRR1/SRR1.sra', 'gsm', config),
+            'fasterq-dump --force --min-read-len 25 --split-files --threads 4 '
+            '--temp gsm/SRX1/SRR1 --outdir gsm gsm/SRX1/SRR1/SRR1.sra && '
+            'if [ -f gsm/SRR1.fastq ]; then mv gsm/SRR1.fastq gsm/SRR1_1.fastq; fi && '
+            'rm -f gsm/SRR1_1.fastq.gz gsm/SRR1_2.fastq.gz && '
+            'pigz -f -p 4 gsm/SRR1_[12].fastq')
+
+
+# writes the reads of the "sra" into {run}_1.fastq and {run}_2.fastq
+FAKE_FASTERQ_DUMP = """#!/bin/bash
+outdir=${@: -2:1}
+run=$(basename ${@: -1} .sra)
+cp ${@: -1} ${outdir}/${run}_1.fastq
+cp ${@: -1} ${outdir}/${run}_2.fastq
+"""
+
+# fails the first time after leaving a partial fastq.gz, like an
+# interrupted pigz, and then runs as gzip does, which doesn't overwrite an
+# existing fastq.gz without -f
+FAKE_PIGZ = """#!/bin/bash
+if [ -f {interrupt} ]; then
+    rm {interrupt}
+    echo partial > ${{@: -2:1}}.gz
+    exit 1
+fi
+force=
+while getopts fp: opt; do
+    if [ $opt = f ]; then force=-f; fi
+done
+shift $((OPTIND - 1))
+gzip $force "$@"
+"""
+
+
+class Sra2fastqRetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        bin_dir = os.path.join(self.tmp_dir, 'bin')
+        os.mkdir(bin_dir)
+        self.interrupt = os.path.join(self.tmp_dir, 'interrupt')
+        open(self.interrupt, 'wb').close()
+        for name, content in [('fasterq-dump', FAKE_FASTERQ_DUMP),
+                              ('pigz', FAKE_PIGZ.format(interrupt=self.interrupt))]:
+            path = os.path.join(bin_dir, name)
+            with open(path, 'wb') as opf:
+                opf.write(content)
+            os.chmod(path, 0o755)
+        patcher = mock.patch.dict(os.environ, {
+            'PATH': '{0}:{1}'.format(bin_dir, os.environ['PATH'])})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gsm_dir = os.path.join(self.tmp_dir, 'GSM1')
+        self.sra = os.path.join(self.gsm_dir, 'SRX1', 'SRR1', 'SRR1.sra')
+        os.makedirs(os.path.dirname(self.sra))
+        with open(self.sra, 'wb') as opf:
+            opf.write('@read1\nACGT\n+\nIIII\n')
+
+    @mock.patch('rsempipeline.utils.retry.time.sleep')
+    def test_retried_after_partial_fastq_gz(self, mock_sleep):
+        config = {'SRA2FASTQ_BACKEND': 'fasterq-dump'}
+        # also when a CMD_PIGZ in the config doesn't overwrite
+        for cmd_pigz in [S2F.DEFAULT_CMD_PIGZ, 'pigz -p {threads} {fastqs}']:
+            open(self.interrupt, 'wb').close()
+            config['CMD_PIGZ'] = cmd_pigz
+            cmd = S2F.gen_sra2fastq_cmd(self.sra, self.gsm_dir, config)
+            policy = RT.RetryPolicy(max_attempts=2, backoff=0)
+            self.assertEqual(policy.call(misc.execute, cmd), 0)
+            for k in [1, 2]:
+                fastq_gz = os.path.join(self.gsm_dir, 'SRR1_{0}.fastq.gz'.format(k))
+                with gzip.open(fastq_gz) as inf:
+                    self.assertEqual(inf.read(), '@read1\nACGT\n+\nIIII\n')
+            self.assertEqual(mock_sleep.call_count, 1)
+            mock_sleep.reset_mock()
@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import LogCapture
+
+from rsempipeline.utils import sras_info_store as SIS
+from rsempipeline.utils.sras_info_store import SrasInfoStore, SrasInfoLoader
+
+
+SRAS_INFO = [
+    {'SRX685916/SRR1557065/SRR1557065.sra': {
+        'readable_size': '1.4 GB', 'size': 1443785368}},
+    {'SRX685916/SRR1557066/SRR1557066.sra': {
+        'readable_size': '1.8 GB', 'size': 1840088204}}
+]
+
+
+class SrasInfoStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.top_outdir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.top_outdir, 'sras_info.sqlite')
+        self.gsm_dir = os.path.join(
+            self.top_outdir, 'rsem_output', 'GSE1', 'homo_sapiens', 'GSM1')
+        os.makedirs(self.gsm_dir)
+        self.yml = os.path.join(self.gsm_dir, 'sras_info.yaml')
+
+    def tearDown(self):
+        SIS._store = None
+        SIS._loader = SrasInfoLoader()
+        shutil.rmtree(self.top_outdir)
+
+    def test_get_key(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir)
+        self.assertEqual(store.get_key(self.gsm_dir),
+                         'rsem_output/GSE1/homo_sapiens/GSM1')
+
+    def test_put_and_load(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir, export_yaml=False)
+        store.put(self.gsm_dir, SRAS_INFO)
+        self.assertTrue(store.has(self.gsm_dir))
+        self.assertFalse(os.path.exists(self.yml))
+
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.get(self.gsm_dir), SRAS_INFO)
+
+    def test_put_replaces_existing_sras_info(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir, export_yaml=False)
+        store.put(self.gsm_dir, SRAS_INFO)
+        store.put(self.gsm_dir, SRAS_INFO[:1])
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.get(self.gsm_dir), SRAS_INFO[:1])
+
+    def test_get_non_existent(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertFalse(store.has(self.gsm_dir))
+        self.assertIsNone(store.get(self.gsm_dir))
+        self.assertEqual((store.hits, store.misses), (0, 1))
+
+    def test_put_exports_yaml(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir)
+        store.put(self.gsm_dir, SRAS_INFO)
+        self.assertEqual(SIS.read_yaml(self.yml), SRAS_INFO)
+
+    def test_import_yaml(self):
+        SIS.write_yaml(SRAS_INFO, self.yml)
+        other_gsm_dir = os.path.join(os.path.dirname(self.gsm_dir), 'GSM2')
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.import_yaml([self.gsm_dir, other_gsm_dir]), 1)
+        self.assertFalse(store.has(other_gsm_dir))
+        # already imported
+        self.assertEqual(store.import_yaml([self.gsm_dir]), 0)
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.get(self.gsm_dir), SRAS_INFO)
+
+    def test_record_failures(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir, export_yaml=False)
+        store.record_failures([self.gsm_dir])
+        store.record_failures([self.gsm_dir])
+        self.assertEqual(store.get_failures(self.gsm_dir), 2)
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.get_failures(self.gsm_dir), 2)
+        # cleared once sras_info is fetched
+        store.export_yaml = False
+        store.put(self.gsm_dir, SRAS_INFO)
+        self.assertEqual(store.get_failures(self.gsm_dir), 0)
+        store = SrasInfoStore(self.db_file, self.top_outdir).load()
+        self.assertEqual(store.get_failures(self.gsm_dir), 0)
+
+    def test_get_retry_time(self):
+        store = SrasInfoStore(self.db_file, self.top_outdir, export_yaml=False)
+        self.assertEqual(store.get_retry_time(self.gsm_dir, 30, 100), 0)
+        with mock.patch('rsempipeline.utils.sras_info_store.time.time', return_value=1000):
+            store.record_failures([self.gsm_dir])
+            self.assertEqual(store.get_retry_time(self.gsm_dir, 30, 100), 1030)
+            store.record_failures([self.gsm_dir])
+            self.assertEqual(store.get_retry_time(self.gsm_dir, 30, 100), 1060)
+            store.record_failures([self.gsm_dir])
+            # capped by max_backoff
+            self.assertEqual(store.get_retry_time(self.gsm_dir, 30, 100), 1100)
+
+    def test_record_fetch_failures_without_store(self):
+        # no-op
+        SIS.record_fetch_failures([self.gsm_dir])
+
+    def test_record_fetch_failures(self):
+        store = SIS.init_store(self.db_file, self.top_outdir)
+        SIS.record_fetch_failures([self.gsm_dir])
+        self.assertEqual(store.get_failures(self.gsm_dir), 1)
+        self.assertEqual(SIS.get_fetch_failures(self.gsm_dir), 1)
+        self.assertGreater(SIS.get_fetch_retry_time(self.gsm_dir, 30, 100), 0)
+
+    def test_iter_sras(self):
+        self.assertEqual(
+            [_[0] for _ in SIS.iter_sras(SRAS_INFO)],
+            ['SRX685916/SRR1557065/SRR1557065.sra',
+             'SRX685916/SRR1557066/SRR1557066.sra'])
+
+    def test_module_functions_without_store(self):
+        self.assertFalse(SIS.has_sras_info(self.gsm_dir))
+        SIS.save_sras_info(self.gsm_dir, SRAS_INFO)
+        self.assertTrue(os.path.exists(self.yml))
+        self.assertTrue(SIS.has_sras_info(self.gsm_dir))
+        self.assertEqual(SIS.get_sras_info(self.gsm_dir), SRAS_INFO)
+
+    def test_module_functions_with_store(self):
+        store = SIS.init_store(self.db_file, self.top_outdir, export_yaml=False)
+        self.assertIs(SIS.get_store(), store)
+        SIS.save_sras_info(self.gsm_dir, SRAS_INFO)
+        self.assertFalse(os.path.exists(self.yml))
+        self.assertTrue(SIS.has_sras_info(self.gsm_dir))
+        self.assertEqual(SIS.get_sras_info(self.gsm_dir), SRAS_INFO)
+
+    def test_get_sras_info_falls_back_to_yaml(self):
+        SIS.init_store(self.db_file, self.top_outdir)
+        SIS.write_yaml(SRAS_INFO, self.yml)
+        self.assertEqual(SIS.get_sras_info(self.gsm_dir), SRAS_INFO)
+
+
+class SrasInfoLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ymls = []
+        for k in range(3):
+            yml = os.path.join(self.tmp_dir, 'sras_info{0}.yaml'.format(k))
+            SIS.write_yaml(SRAS_INFO[:1], yml)
+            self.ymls.append(yml)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def patch_read_yaml(self):
+        return mock.patch('rsempipeline.utils.sras_info_store.read_yaml',
+                          wraps=SIS.read_yaml)
+
+    def test_load_cached(self):
+        loader = SrasInfoLoader()
+        with self.patch_read_yaml() as mock_read_yaml:
+            self.assertEqual(loader.load(self.ymls[0]), SRAS_INFO[:1])
+            self.assertEqual(loader.load(self.ymls[0]), SRAS_INFO[:1])
+        mock_read_yaml.assert_called_once_with(self.ymls[0])
+        self.assertEqual((loader.hits, loader.misses), (1, 1))
+
+    def test_load_modified(self):
+        loader = SrasInfoLoader()
+        loader.load(self.ymls[0])
+        SIS.write_yaml(SRAS_INFO, self.ymls[0])
+        mtime = os.path.getmtime(self.ymls[0]) + 10
+        os.utime(self.ymls[0], (mtime, mtime))
+        self.assertEqual(loader.load(self.ymls[0]), SRAS_INFO)
+        self.assertEqual((loader.hits, loader.misses), (0, 2))
+        self.assertEqual(len(loader.cache), 1)
+
+    def test_load_evicts_least_recently_used(self):
+        loader = SrasInfoLoader(maxsize=2)
+        loader.load(self.ymls[0])
+        loader.load(self.ymls[1])
+        loader.load(self.ymls[0])
+        loader.load(self.ymls[2])
+        self.assertEqual(list(loader.cache.keys()), [self.ymls[0], self.ymls[2]])
+        loader.load(self.ymls[1])
+        self.assertEqual((loader.hits, loader.misses), (1, 4))
+
+    def test_load_with_caching_disabled(self):
+        loader = SrasInfoLoader(maxsize=0)
+        loader.load(self.ymls[0])
+        loader.load(self.ymls[0])
+        self.assertEqual(loader.cache, {})
+        self.assertEqual((loader.hits, loader.misses), (0, 2))
+
+    def test_load_non_existent(self):
+        loader = SrasInfoLoader()
+        self.assertRaises(IOError, loader.load,
+                          os.path.join(self.tmp_dir, 'non_existent.yaml'))
+        self.assertEqual(loader.misses, 1)
+
+
+class StatsTestCase(unittest.TestCase):
+    def tearDown(self):
+        SIS._store = None
+        SIS._loader = SrasInfoLoader()
+
+    def test_get_stats(self):
+        SIS._store = mock.Mock(hits=6)
+        SIS._loader = mock.Mock(hits=2, misses=2)
+        self.assertEqual(SIS.get_stats(), {
+            'store_hits': 6, 'cache_hits': 2, 'cache_misses': 2,
+            'total': 10, 'hit_rate': 0.8})
+
+    def test_get_stats_without_reads(self):
+        self.assertEqual(SIS.get_stats()['hit_rate'], 0.)
+
+    def test_log_stats(self):
+        SIS._loader = mock.Mock(hits=1, misses=3)
+        with LogCapture() as L:
+            SIS.log_stats()
+        L.check(('rsempipeline.utils.sras_info_store', 'INFO',
+                 'sras_info reads: 4 in total, 0 from store, 1 from cached '
+                 'sras_info.yaml, 3 parsed from sras_info.yaml '
+                 '(hit rate: 25.0%)'))
@@ -0,0 +1,103 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import mock
+import paramiko
+
+from rsempipeline.utils import ssh_pool
+
+from fake_ssh import StubSSHServer
+
+
+class SSHConnectionManagerTestCase(unittest.TestCase):
+    client_key = None
+
+    def setUp(self):
+        if SSHConnectionManagerTestCase.client_key is None:
+            SSHConnectionManagerTestCase.client_key = paramiko.RSAKey.generate(1024)
+        self.tmp_dir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.key_file = os.path.join(self.tmp_dir, 'id_rsa')
+        self.client_key.write_private_key_file(self.key_file)
+        self.server = StubSSHServer(self.client_key, outputs={
+            'du -s /r_dir': '3096\t/r_dir\n',
+            'find /r_dir': '/r_dir\n/r_dir/GSE1\n'})
+        self.manager = ssh_pool.SSHConnectionManager(timeout=5, keepalive=30)
+
+    def tearDown(self):
+        self.manager.close()
+        self.server.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def exec_command(self, cmd):
+        return self.manager.exec_command(
+            cmd, '127.0.0.1', 'username', self.key_file, self.server.port)
+
+    def test_exec_command(self):
+        self.assertEqual(self.exec_command('du -s /r_dir'), ['3096\t/r_dir\n'])
+        self.assertEqual(self.exec_command('find /r_dir'),
+                         ['/r_dir\n', '/r_dir/GSE1\n'])
+        self.assertEqual(self.exec_command('unknown'), [])
+        self.assertEqual(self.server.commands,
+                         ['du -s /r_dir', 'find /r_dir', 'unknown'])
+
+    def test_iter_command(self):
+        lines = self.manager.iter_command(
+            'find /r_dir', '127.0.0.1', 'username', self.key_file, self.server.port)
+        self.assertEqual(next(lines), '/r_dir\n')
+        self.assertEqual(list(lines), ['/r_dir/GSE1\n'])
+
+    def test_connection_is_reused(self):
+        with mock.patch.object(ssh_pool.paramiko.RSAKey, 'from_private_key_file',
+                               wraps=paramiko.RSAKey.from_private_key_file) as mock_load:
+            for _ in range(3):
+                self.exec_command('du -s /r_dir')
+        self.assertEqual(self.server.num_connections, 1)
+        self.assertEqual(self.manager.num_connections, 1)
+        mock_load.assert_called_once_with(self.key_file)
+
+    def test_keepalive(self):
+        with mock.patch.object(ssh_pool.paramiko.Transport, 'set_keepalive',
+                               autospec=True) as mock_set_keepalive:
+            self.exec_command('du -s /r_dir')
+        transport = self.manager.transports[('127.0.0.1', self.server.port, 'username')]
+        mock_set_keepalive.assert_called_once_with(transport, 30)
+
+    def test_reconnect_after_connection_dropped(self):
+        self.exec_command('du -s /r_dir')
+        self.server.drop_connections()
+        # wait for the client to notice
+        transport = self.manager.transports[('127.0.0.1', self.server.port, 'username')]
+        for _ in range(50):
+            if not transport.is_active():
+                break
+            time.sleep(0.1)
+        self.assertEqual(self.exec_command('find /r_dir'),
+                         ['/r_dir\n', '/r_dir/GSE1\n'])
+        self.assertEqual(self.server.num_connections, 2)
+
+    def test_reconnect_when_open_session_fails(self):
+        self.exec_command('du -s /r_dir')
+        transport = self.manager.transports[('127.0.0.1', self.server.port, 'username')]
+        with mock.patch.object(transport, 'open_session',
+                               side_effect=paramiko.SSHException('stale')):
+            self.assertEqual(self.exec_command('du -s /r_dir'), ['3096\t/r_dir\n'])
+        self.assertEqual(self.server.num_connections, 2)
+
+    def test_authentication_failure(self):
+        paramiko.RSAKey.generate(1024).write_private_key_file(self.key_file)
+        self.assertRaises(paramiko.AuthenticationException,
+                          self.exec_command, 'du -s /r_dir')
+        self.assertEqual(self.manager.transports, {})
+
+    def test_connection_refused(self):
+        # a port that nothing listens on
+        sock = ssh_pool.socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.assertRaises(ssh_pool.socket.error, self.manager.exec_command,
+                          'du -s /r_dir', '127.0.0.1', 'username',
+                          self.key_file, port)
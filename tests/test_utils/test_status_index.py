@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from rsempipeline.utils.status_index import StatusIndex
+
+
+class StatusIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.top_outdir = tempfile.mkdtemp()
+        self.rsem_outdir = os.path.join(self.top_outdir, 'rsem_output')
+        self.gsm_dir1 = os.path.join(self.rsem_outdir, 'GSE1', 'homo_sapiens', 'GSM1')
+        self.gsm_dir2 = os.path.join(self.rsem_outdir, 'GSE2', 'mus_musculus', 'GSM2')
+        for gsm_dir in [self.gsm_dir1, self.gsm_dir2]:
+            os.makedirs(os.path.join(gsm_dir, 'SRX1', 'SRR1'))
+        for name in ['sras_info.yaml', 'SRR1.sra.download.COMPLETE', '0_submit.sh']:
+            open(os.path.join(self.gsm_dir1, name), 'wb').close()
+        # not a GSE dir, so ignored
+        os.makedirs(os.path.join(self.rsem_outdir, 'some_dir', 'homo_sapiens', 'GSM3'))
+
+    def tearDown(self):
+        shutil.rmtree(self.top_outdir)
+
+    def test_build(self):
+        index = StatusIndex(self.rsem_outdir).build()
+        self.assertEqual(index.gsm_files, {
+            self.gsm_dir1: frozenset(['SRX1', 'sras_info.yaml',
+                                      'SRR1.sra.download.COMPLETE', '0_submit.sh']),
+            self.gsm_dir2: frozenset(['SRX1'])
+        })
+
+    def test_build_nonexistent_rsem_outdir(self):
+        index = StatusIndex(os.path.join(self.top_outdir, 'nonexistent')).build()
+        self.assertEqual(index.gsm_files, {})
+
+    @mock.patch('rsempipeline.utils.status_index.os.path.exists', autospec=True)
+    def test_exists(self, mock_exists):
+        index = StatusIndex(self.rsem_outdir).build()
+        flag = os.path.join(self.gsm_dir1, 'SRR1.sra.download.COMPLETE')
+        self.assertTrue(index.exists(flag))
+        # relative paths work, too
+        self.assertTrue(index.exists(os.path.relpath(flag)))
+        self.assertFalse(index.exists(os.path.join(self.gsm_dir2, '0_submit.sh')))
+        self.assertFalse(mock_exists.called)
+
+    @mock.patch('rsempipeline.utils.status_index.os.path.exists', autospec=True)
+    def test_exists_not_indexed(self, mock_exists):
+        index = StatusIndex(self.rsem_outdir).build()
+        mock_exists.return_value = True
+        path = os.path.join(self.rsem_outdir, 'GSE9', 'homo_sapiens', 'GSM9', '0_submit.sh')
+        self.assertTrue(index.exists(path))
+        mock_exists.assert_called_once_with(path)
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from testfixtures import LogCapture
+
+from rsempipeline.utils import usage_ledger as UL
+from rsempipeline.utils.misc import disk_used
+
+
+class UsageLedgerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.top_outdir = tempfile.mkdtemp(suffix='_rsem_testing')
+        self.rsem_outdir = os.path.join(self.top_outdir, 'rsem_output')
+        self.gsm_dirs = [self.gen_gsm_dir('GSE1', 'GSM1', 2),
+                         self.gen_gsm_dir('GSE1', 'GSM2', 1),
+                         self.gen_gsm_dir('GSE2', 'GSM3', 3)]
+        with open(os.path.join(self.top_outdir, 'rp_config.yml'), 'wb') as opf:
+            opf.write('x' * 100)
+        self.ledger = UL.get_ledger(self.top_outdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.top_outdir)
+
+    def gen_gsm_dir(self, gse, gsm, num_files):
+        gsm_dir = os.path.join(self.rsem_outdir, gse, 'homo_sapiens', gsm)
+        os.makedirs(gsm_dir)
+        for k in range(num_files):
+            self.write(gsm_dir, 'SRR{0}_1.fastq.gz'.format(k), 5000)
+        return gsm_dir
+
+    def write(self, gsm_dir, name, size):
+        with open(os.path.join(gsm_dir, name), 'wb') as opf:
+            opf.write('x' * size)
+
+    def test_find_gsm_dirs(self):
+        self.assertEqual(sorted(UL.find_gsm_dirs(self.rsem_outdir)),
+                         sorted(self.gsm_dirs))
+        self.assertEqual(UL.find_gsm_dirs('/path/to/nowhere'), [])
+
+    def test_first_get_total_reconciles(self):
+        self.assertEqual(self.ledger.get_total(), disk_used(self.top_outdir))
+        self.assertFalse(self.ledger.is_reconcile_due())
+
+    def test_get_total_without_walk(self):
+        self.ledger.get_total()
+        with mock.patch.object(UL, 'disk_used') as mock_disk_used:
+            self.ledger.get_total(self.gsm_dirs)
+        self.assertFalse(mock_disk_used.called)
+
+    def test_update(self):
+        self.ledger.reconcile()
+        self.write(self.gsm_dirs[0], 'SRR9_1.fastq.gz', 80000)
+        UL.update_usage(self.top_outdir, self.gsm_dirs[0])
+        self.assertEqual(self.ledger.get_total(), disk_used(self.top_outdir))
+
+    def test_update_does_not_overwrite_later_measurement(self):
+        self.ledger.reconcile()
+        with mock.patch.object(UL.time, 'time', return_value=0):
+            self.ledger.update([self.gsm_dirs[0]])
+        conn = self.ledger.connect()
+        usage, measured = conn.execute(
+            'SELECT usage, measured FROM usages WHERE gsm = ?',
+            (self.ledger.get_key(self.gsm_dirs[0]),)).fetchone()
+        conn.close()
+        self.assertEqual(usage, disk_used(self.gsm_dirs[0]))
+        self.assertNotEqual(measured, 0)
+
+    def test_mark_dirty(self):
+        self.ledger.reconcile()
+        shutil.rmtree(self.gsm_dirs[1])
+        os.remove(os.path.join(self.gsm_dirs[2], 'SRR0_1.fastq.gz'))
+        UL.mark_dirty(self.top_outdir, self.gsm_dirs[1:])
+        with mock.patch.object(UL, 'disk_used', wraps=disk_used) as mock_disk_used:
+            total = self.ledger.get_total()
+        # the removed GSM dir is counted as 0 without being walked
+        mock_disk_used.assert_called_once_with(self.gsm_dirs[2], 1)
+        self.assertEqual(total, self.ledger.reconcile())
+
+    def test_get_total_adds_new_gsm_dirs(self):
+        before = self.ledger.get_total()
+        gsm_dir = self.gen_gsm_dir('GSE3', 'GSM4', 2)
+        total = self.ledger.get_total([gsm_dir] + self.gsm_dirs)
+        # dirs of the new GSE and species aren't counted until reconciled
+        self.assertEqual(total, before + disk_used(gsm_dir))
+
+    def test_reconcile_interval(self):
+        self.ledger.reconcile()
+        self.assertTrue(self.ledger.is_reconcile_due(now=os.path.getmtime(
+            self.top_outdir) + 25 * 3600))
+        ledger = UL.get_ledger(self.top_outdir, reconcile_interval=0)
+        self.assertTrue(ledger.is_reconcile_due())
+
+    def test_update_usage_failure_is_logged(self):
+        with mock.patch.object(UL.UsageLedger, 'update',
+                               side_effect=UL.sqlite3.OperationalError('locked')):
+            with LogCapture() as L:
+                UL.update_usage(self.top_outdir, self.gsm_dirs[0])
+        L.check(('rsempipeline.utils.usage_ledger', 'WARNING',
+                 'failed to update the usage of {0} in the ledger: '
+                 'locked'.format(self.gsm_dirs[0])))